@@ -0,0 +1,109 @@
+from django.db import migrations, models
+
+# Время изменения связи ставится в базе: ETL видит изменения, сделанные и не через Django
+ADD_MODIFIED = """
+ALTER TABLE content.subscription_film_work ADD COLUMN IF NOT EXISTS modified timestamp with time zone;
+UPDATE content.subscription_film_work SET modified = created WHERE modified IS NULL;
+ALTER TABLE content.subscription_film_work ALTER COLUMN modified SET DEFAULT now();
+ALTER TABLE content.subscription_film_work ALTER COLUMN modified SET NOT NULL;
+CREATE INDEX IF NOT EXISTS subscription_film_work_modified_idx
+    ON content.subscription_film_work (modified, id);
+"""
+
+# Удаления строк, которые ETL должен перенести в индексы: триггеры записывают сюда id и таблицу удалённой строки
+CREATE_DELETED_OBJECTS = """
+CREATE TABLE IF NOT EXISTS content.deleted_objects (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    object_id uuid NOT NULL,
+    table_name text NOT NULL,
+    deleted timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS deleted_objects_table_deleted_idx
+    ON content.deleted_objects (table_name, deleted, id);
+"""
+
+CREATE_TOUCH_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.touch_modified() RETURNS trigger AS $$
+BEGIN
+    NEW.modified = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TOUCH_TRIGGER = """
+CREATE TRIGGER subscription_film_work_touch_modified
+BEFORE UPDATE ON content.subscription_film_work
+FOR EACH ROW EXECUTE FUNCTION content.touch_modified();
+"""
+
+# У удалённой связи фильма с подпиской в deleted_objects записывается id фильма, а не связи:
+# по нему ETL обновляет подписки в документе фильма. Связь, перенесённая на другой фильм,
+# для прежнего фильма тоже считается удалённой.
+CREATE_LINK_TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.record_film_link_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.deleted_objects (object_id, table_name) VALUES (OLD.film_work_id, TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_LINK_TOMBSTONE_TRIGGERS = """
+CREATE TRIGGER subscription_film_work_record_deletion
+AFTER DELETE ON content.subscription_film_work
+FOR EACH ROW EXECUTE FUNCTION content.record_film_link_deletion();
+
+CREATE TRIGGER subscription_film_work_record_move
+AFTER UPDATE OF film_work_id ON content.subscription_film_work
+FOR EACH ROW WHEN (OLD.film_work_id IS DISTINCT FROM NEW.film_work_id)
+EXECUTE FUNCTION content.record_film_link_deletion();
+"""
+
+DROP_LINK_TOMBSTONE_TRIGGERS = """
+DROP TRIGGER IF EXISTS subscription_film_work_record_deletion ON content.subscription_film_work;
+DROP TRIGGER IF EXISTS subscription_film_work_record_move ON content.subscription_film_work;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movies", "0006_subscription_subscriptionsfilmwork"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ADD_MODIFIED,
+            reverse_sql="""
+            DROP INDEX IF EXISTS content.subscription_film_work_modified_idx;
+            ALTER TABLE content.subscription_film_work DROP COLUMN IF EXISTS modified;
+            """,
+            state_operations=[
+                migrations.AddField(
+                    model_name="subscriptionsfilmwork",
+                    name="modified",
+                    field=models.DateTimeField(auto_now=True),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            CREATE_DELETED_OBJECTS,
+            reverse_sql="DROP TABLE IF EXISTS content.deleted_objects;",
+        ),
+        migrations.RunSQL(
+            CREATE_TOUCH_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS content.touch_modified();",
+        ),
+        migrations.RunSQL(
+            CREATE_TOUCH_TRIGGER,
+            reverse_sql="DROP TRIGGER IF EXISTS subscription_film_work_touch_modified ON content.subscription_film_work;",
+        ),
+        migrations.RunSQL(
+            CREATE_LINK_TOMBSTONE_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS content.record_film_link_deletion();",
+        ),
+        migrations.RunSQL(
+            CREATE_LINK_TOMBSTONE_TRIGGERS,
+            reverse_sql=DROP_LINK_TOMBSTONE_TRIGGERS,
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Таблицы, изменения которых читают конвейеры ETL
+NOTIFY_TABLES = ("film_work", "genre", "person", "subscription_film_work")
+
+# Канал, который слушает демон ETL (NOTIFY_CHANNEL в etl/daemon.py)
+NOTIFY_CHANNEL = "content_changes"
+
+CREATE_NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION content.notify_content_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_NOTIFY_TRIGGER = """
+CREATE TRIGGER {table}_notify_content_change
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_content_change();
+"""
+
+DROP_NOTIFY_TRIGGER = "DROP TRIGGER IF EXISTS {table}_notify_content_change ON content.{table};"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movies", "0007_subscription_film_work_changes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_NOTIFY_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS content.notify_content_change();",
+        ),
+        *(
+            migrations.RunSQL(
+                CREATE_NOTIFY_TRIGGER.format(table=table),
+                reverse_sql=DROP_NOTIFY_TRIGGER.format(table=table),
+            )
+            for table in NOTIFY_TABLES
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# Таблицы, удаления из которых ETL переносит в индексы Elasticsearch
+TOMBSTONE_TABLES = ("film_work", "genre", "person")
+
+CREATE_TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.record_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.deleted_objects (object_id, table_name) VALUES (OLD.id, TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TOMBSTONE_TRIGGER = """
+CREATE TRIGGER {table}_record_deletion
+AFTER DELETE ON content.{table}
+FOR EACH ROW EXECUTE FUNCTION content.record_deletion();
+"""
+
+DROP_TOMBSTONE_TRIGGER = "DROP TRIGGER IF EXISTS {table}_record_deletion ON content.{table};"
+
+# У удалённой связи фильма с персоной или жанром записывается id фильма функцией из миграции 0007:
+# по нему ETL обновляет персоны и жанры в документе фильма. Связи удалённой персоны или жанра удаляются
+# вместе с ними, поэтому обновляются и все фильмы, в которые они вложены
+LINK_TOMBSTONE_TABLES = ("person_film_work", "genre_film_work")
+
+CREATE_LINK_TOMBSTONE_TRIGGER = """
+CREATE TRIGGER {table}_record_deletion
+AFTER DELETE ON content.{table}
+FOR EACH ROW EXECUTE FUNCTION content.record_film_link_deletion();
+"""
+
+# Демон ETL узнаёт о новых удалениях по уведомлению об изменении deleted_objects
+CREATE_NOTIFY_TRIGGER = """
+CREATE TRIGGER deleted_objects_notify_content_change
+AFTER INSERT ON content.deleted_objects
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_content_change();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movies", "0008_content_change_notifications"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_TOMBSTONE_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS content.record_deletion();",
+        ),
+        *(
+            migrations.RunSQL(
+                CREATE_TOMBSTONE_TRIGGER.format(table=table),
+                reverse_sql=DROP_TOMBSTONE_TRIGGER.format(table=table),
+            )
+            for table in TOMBSTONE_TABLES
+        ),
+        *(
+            migrations.RunSQL(
+                CREATE_LINK_TOMBSTONE_TRIGGER.format(table=table),
+                reverse_sql=DROP_TOMBSTONE_TRIGGER.format(table=table),
+            )
+            for table in LINK_TOMBSTONE_TABLES
+        ),
+        migrations.RunSQL(
+            CREATE_NOTIFY_TRIGGER,
+            reverse_sql="DROP TRIGGER IF EXISTS deleted_objects_notify_content_change ON content.deleted_objects;",
+        ),
+    ]
@@ -32,6 +32,8 @@ class SubscriptionFilmWork(UUIDMixin):
         verbose_name=_("subscription"),
     )
     created = models.DateTimeField(auto_now_add=True)
+    # Обновляется и триггером в базе: ETL видит изменения связей, сделанные не через Django
+    modified = models.DateTimeField(auto_now=True)
 
     def get_results(self, request: HttpRequest) -> None:
         exit(1)
@@ -0,0 +1,290 @@
+"""Замер производительности конвейеров ETL на синтетических данных.
+
+Запускать против отдельной базы данных со схемой content, созданной миграциями Django Admin:
+
+    python benchmark.py --generate --films 100000 --persons 20000 --genres 50
+    python benchmark.py --conveyors MoviesETL PersonsETL
+    python benchmark.py --clean
+
+По умолчанию документы отправляются в заглушку Elasticsearch, которая только считает bulk-запросы,
+чтобы замер показывал скорость самого ETL. С --elastic загрузка идёт в Elasticsearch из настроек.
+"""
+
+import argparse
+import logging
+import resource
+import sys
+import tempfile
+import time
+from collections.abc import Generator, Iterator
+from contextlib import closing
+from typing import Any
+
+import psycopg2
+from config import settings
+from conveyors.base import Batch, PostgresToElasticsearch
+from elastic_transport import SerializerCollection
+from elasticsearch import Elasticsearch
+from elasticsearch.serializer import DEFAULT_SERIALIZERS
+from etl import CONVEYORS
+from psycopg2.extensions import connection
+from psycopg2.extras import DictCursor
+from state import JsonStorage, State
+
+# Логи загрузки каждого батча искажают замер
+logging.basicConfig(stream=sys.stdout, level=logging.WARNING)
+
+# Результаты замера выводятся отдельным логгером без служебных полей записи
+report = logging.getLogger("benchmark.report")
+report.setLevel(logging.INFO)
+report.propagate = False
+report_handler = logging.StreamHandler(sys.stdout)
+report_handler.setFormatter(logging.Formatter("%(message)s"))
+report.addHandler(report_handler)
+
+# Синтетические строки помечаются префиксом, чтобы их можно было удалить
+SYNTHETIC_PREFIX = "Benchmark"
+
+SQL_GENERATE = f"""
+INSERT INTO content.genre (id, name, description, created, modified)
+SELECT gen_random_uuid(), '{SYNTHETIC_PREFIX} genre ' || i, '', now(), now() - i * interval '1 second'
+FROM generate_series(1, %(genres)s) AS i;
+
+INSERT INTO content.person (id, full_name, created, modified)
+SELECT gen_random_uuid(), '{SYNTHETIC_PREFIX} person ' || i, now(), now() - i * interval '1 second'
+FROM generate_series(1, %(persons)s) AS i;
+
+INSERT INTO content.film_work (id, title, description, creation_date, rating, type, created, modified)
+SELECT gen_random_uuid(),
+       '{SYNTHETIC_PREFIX} film ' || i,
+       repeat(md5(i::text), 8),
+       current_date - i %% 20000,
+       round((random() * 10)::numeric, 1),
+       CASE WHEN i %% 5 = 0 THEN 'tv_show' ELSE 'movie' END,
+       now(),
+       now() - i * interval '1 second'
+FROM generate_series(1, %(films)s) AS i;
+
+WITH films AS (
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM content.film_work WHERE title LIKE '{SYNTHETIC_PREFIX} %%'
+), genres AS (
+    SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM content.genre WHERE name LIKE '{SYNTHETIC_PREFIX} %%'
+)
+INSERT INTO content.genre_film_work (id, film_work_id, genre_id, created)
+SELECT gen_random_uuid(), f.id, g.id, now()
+FROM films AS f
+CROSS JOIN generate_series(0, %(genres_per_film)s - 1) AS j
+JOIN genres AS g ON g.n = (f.n * 7 + j) %% %(genres)s;
+
+WITH films AS (
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM content.film_work WHERE title LIKE '{SYNTHETIC_PREFIX} %%'
+), persons AS (
+    SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM content.person WHERE full_name LIKE '{SYNTHETIC_PREFIX} %%'
+)
+INSERT INTO content.person_film_work (id, film_work_id, person_id, role, created)
+SELECT gen_random_uuid(), f.id, p.id, (ARRAY['actor', 'director', 'writer'])[j %% 3 + 1], now()
+FROM films AS f
+CROSS JOIN generate_series(0, %(persons_per_film)s - 1) AS j
+JOIN persons AS p ON p.n = (f.n * 13 + j) %% %(persons)s;
+"""
+
+SQL_CLEAN = f"""
+DELETE FROM content.genre_film_work
+WHERE film_work_id IN (SELECT id FROM content.film_work WHERE title LIKE '{SYNTHETIC_PREFIX} %');
+DELETE FROM content.person_film_work
+WHERE film_work_id IN (SELECT id FROM content.film_work WHERE title LIKE '{SYNTHETIC_PREFIX} %');
+DELETE FROM content.film_work WHERE title LIKE '{SYNTHETIC_PREFIX} %';
+DELETE FROM content.genre WHERE name LIKE '{SYNTHETIC_PREFIX} %';
+DELETE FROM content.person WHERE full_name LIKE '{SYNTHETIC_PREFIX} %';
+"""
+
+
+class TimingConnection(connection):
+    """Соединение, которое считает время выполнения запросов и чтения их результатов"""
+
+    query_seconds = 0.0
+
+
+class TimingCursor(DictCursor):
+    def _timed(self, method: Any, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.connection.query_seconds += time.perf_counter() - started
+
+    def execute(self, *args: Any) -> Any:
+        return self._timed(super().execute, *args)
+
+    def fetchmany(self, *args: Any) -> Any:
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self) -> Any:
+        return self._timed(super().fetchall)
+
+
+class RecordingElasticsearch:
+    """Заглушка Elasticsearch: принимает bulk-запросы без ошибок и считает их размер"""
+
+    class Response:
+        body = {"errors": False, "items": []}
+
+    def __init__(self) -> None:
+        self.transport = self
+        self.serializers = SerializerCollection(DEFAULT_SERIALIZERS)
+        self.requests = 0
+        self.bytes = 0
+
+    def options(self, **kwargs: Any) -> "RecordingElasticsearch":
+        return self
+
+    def bulk(self, operations: list[bytes], **kwargs: Any) -> Response:
+        self.requests += 1
+        self.bytes += sum(len(line) + 1 for line in operations)
+        return self.Response()
+
+
+class StageTimer:
+    """Считает строки и время, которое потребитель ждёт батчи стадии вместе с предыдущими стадиями"""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.seconds = 0.0
+
+    def wrap(self, items_batches: Iterator[Batch]) -> Generator[Batch, None, None]:
+        while True:
+            started = time.perf_counter()
+            items_batch = next(items_batches, None)
+            self.seconds += time.perf_counter() - started
+            if items_batch is None:
+                return
+            self.rows += len(items_batch.items)
+            yield items_batch
+
+
+def measure(conveyor: PostgresToElasticsearch) -> dict[str, tuple[int, float]]:
+    """Выполняет стадии конвейера по очереди и возвращает число строк и собственное время каждой стадии"""
+    extract, enrich, transform = StageTimer(), StageTimer(), StageTimer()
+    started = time.perf_counter()
+    conveyor.load(transform.wrap(conveyor.transform(enrich.wrap(conveyor.enrich(extract.wrap(conveyor.extract()))))))
+    total = time.perf_counter() - started
+    return {
+        "extract": (extract.rows, extract.seconds),
+        "enrich": (enrich.rows, enrich.seconds - extract.seconds),
+        "transform": (transform.rows, transform.seconds - enrich.seconds),
+        "load": (transform.rows, total - transform.seconds),
+    }
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(
+    postgres_dsn: dict[str, Any],
+    elasticsearch: Any,
+    conveyors: list[type[PostgresToElasticsearch]],
+    **conveyor_options: Any,
+) -> None:
+    """Загружает все строки таблиц каждым конвейером с пустым состоянием и печатает результаты"""
+    for etl_class in conveyors:
+        with (
+            closing(
+                psycopg2.connect(**postgres_dsn, connection_factory=TimingConnection, cursor_factory=TimingCursor)
+            ) as pg_conn,
+            tempfile.NamedTemporaryFile(suffix=".json") as state_file,
+        ):
+            conveyor = etl_class(  # type: ignore
+                postgres=pg_conn,
+                elasticsearch=elasticsearch,
+                state=State(JsonStorage(state_file.name)),
+                **conveyor_options,
+            )
+            if isinstance(elasticsearch, RecordingElasticsearch):
+                elasticsearch.requests = elasticsearch.bytes = 0
+            stages = measure(conveyor)
+
+            report.info(f"{etl_class.__name__}:")
+            for stage, (rows, seconds) in stages.items():
+                report.info(
+                    f"  {stage:<10} {rows:>9} rows {seconds:>9.2f} s {rows / seconds if seconds else 0:>12.0f} rows/s"
+                )
+            report.info(f"  postgres   {pg_conn.query_seconds:>24.2f} s")
+            if isinstance(elasticsearch, RecordingElasticsearch):
+                report.info(
+                    f"  bulk       {elasticsearch.requests:>9} requests {elasticsearch.bytes / 1024**2:>9.1f} MB"
+                )
+            report.info(f"  peak RSS   {peak_rss_mb():>21.1f} MB")
+
+
+def generate(postgres_dsn: dict[str, Any], **sizes: int) -> None:
+    with closing(psycopg2.connect(**postgres_dsn)) as pg_conn, pg_conn, pg_conn.cursor() as cur:
+        cur.execute(SQL_GENERATE, sizes)
+
+
+def clean(postgres_dsn: dict[str, Any]) -> None:
+    with closing(psycopg2.connect(**postgres_dsn)) as pg_conn, pg_conn, pg_conn.cursor() as cur:
+        cur.execute(SQL_CLEAN)
+
+
+if __name__ == "__main__":
+    conveyor_classes = {etl_class.__name__: etl_class for etl_class in CONVEYORS}
+
+    parser = argparse.ArgumentParser(description="Benchmark ETL conveyors on synthetic content")
+    parser.add_argument("--generate", action="store_true", help="Insert synthetic content before the benchmark")
+    parser.add_argument("--clean", action="store_true", help="Delete synthetic content and exit")
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--genres-per-film", type=int, default=3)
+    parser.add_argument("--persons-per-film", type=int, default=10)
+    parser.add_argument(
+        "--conveyors",
+        nargs="+",
+        choices=conveyor_classes,
+        metavar="CONVEYOR",
+        default=["MoviesETL", "GenresETL", "PersonsETL"],
+    )
+    parser.add_argument("--elastic", action="store_true", help="Load into Elasticsearch from settings")
+    args = parser.parse_args()
+
+    postgres_dsn = {
+        "dbname": settings.postgres_movies_db,
+        "user": settings.postgres_user,
+        "password": settings.postgres_password,
+        "host": settings.postgres_host,
+        "port": settings.postgres_port,
+        "options": "-c search_path=content,public",
+    }
+
+    if args.clean:
+        clean(postgres_dsn)
+        sys.exit()
+    if args.generate:
+        generate(
+            postgres_dsn,
+            films=args.films,
+            persons=args.persons,
+            genres=args.genres,
+            genres_per_film=min(args.genres_per_film, args.genres),
+            persons_per_film=min(args.persons_per_film, args.persons),
+        )
+
+    if args.elastic:
+        elasticsearch = Elasticsearch(
+            [{"host": settings.elastic_host, "port": settings.elastic_port, "scheme": "http"}],
+            request_timeout=60,
+        )
+    else:
+        elasticsearch = RecordingElasticsearch()
+
+    benchmark(
+        postgres_dsn,
+        elasticsearch,
+        [conveyor_classes[name] for name in args.conveyors],
+        batch_size=settings.batch_size,
+        bulk_thread_count=settings.bulk_thread_count,
+        bulk_chunk_size=settings.bulk_chunk_size,
+        bulk_max_chunk_bytes=settings.bulk_max_chunk_bytes,
+        bulk_max_retries=settings.bulk_max_retries,
+    )
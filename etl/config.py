@@ -36,6 +36,26 @@ class Settings(BaseSettings):
     redis_db: int = Field(alias="REDIS_DB_ETL", default=2)
 
     batch_size: int = 100
+    # Число индексов, которые загружаются одновременно
+    concurrency: int = 3
+    # Полная переиндексация: число процессов и диапазонов id, на которые делятся таблицы
+    reindex_workers: int = 4
+    reindex_ranges: int = 16
+    # Число батчей, которые готовятся заранее, пока загружается текущий; 0 - без конвейеризации
+    pipeline_depth: int = 2
+
+    # Параллельная загрузка в Elasticsearch
+    bulk_thread_count: int = 4
+    bulk_chunk_size: int = 250
+    bulk_max_chunk_bytes: int = 10 * 1024 * 1024
+    bulk_max_retries: int = 3
+
+    # Режим демона: время накопления изменений в микробатч и интервал опроса при отсутствии уведомлений
+    notify_debounce_seconds: float = 1
+    poll_interval_seconds: float = 60
+
+    # Канал Redis, в который публикуются id изменившихся документов индексов, чтобы API сбросило их кэш
+    cache_invalidation_channel: str = "etl_index_updated"
 
 
 settings = Settings()
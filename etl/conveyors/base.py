@@ -1,22 +1,70 @@
 import datetime as dt
-import itertools
 import logging
+import queue
+import threading
 from abc import ABC, abstractmethod
-from collections.abc import Generator
-from typing import Any
+from collections.abc import Generator, Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, NamedTuple
 
+import orjson
 from elasticsearch import Elasticsearch
-from exceptions import ElasticError
+from elasticsearch.helpers import streaming_bulk
 from psycopg2._psycopg import connection
-from state import State
+from psycopg2.extensions import cursor as plain_cursor
+from state import CacheInvalidations, ContentHashes, State
 
 logger = logging.getLogger(__name__)
 
 
+# Позиция водяного знака: время изменения и id последней прочитанной строки
+Cursor = tuple[str, str]
+
+MIN_ID = "00000000-0000-0000-0000-000000000000"
+
+# Повторное чтение строк запроса extract по id документов, которые не удалось загрузить
+SQL_BY_IDS = """
+SELECT *
+FROM ({query}) AS src
+WHERE src.id = ANY(%s::uuid[])
+ORDER BY src.modified, src.id;
+"""
+
+
+# Ограничение запроса extract диапазоном id при параллельной переиндексации
+SQL_ID_RANGE = """
+SELECT *
+FROM ({query}) AS src
+WHERE src.id BETWEEN %s AND %s
+ORDER BY src.modified, src.id;
+"""
+
+
+class Batch(NamedTuple):
+    """Батч объектов конвейера и позиция водяного знака, до которой он прочитан"""
+
+    items: list[Any]
+    cursor: Cursor
+    # Id документов, загрузка которых повторяется; id, которых нет среди items, больше не повторяются
+    retried: tuple[str, ...] = ()
+
+
+class _PipelineEnd:
+    """Маркер завершения предыдущей стадии конвейера"""
+
+
 class PostgresToElasticsearch(ABC):
     index_name: str
+    # Таблица схемы content, изменения которой читает extract_query
+    source_table: str
+    # Другие таблицы схемы content, изменения которых тоже читает extract_query
+    extra_source_tables: tuple[str, ...] = ()
     extract_query: str
-    enrich_queries: dict[str, str]
+    # Запрос, возвращающий по массиву id объектов батча строки с дополнительными полями
+    enrich_query: str | None = None
+
+    # Как часто поток стадии проверяет, не остановлен ли конвейер, сек.
+    pipeline_poll_interval: float = 0.5
 
     def __init__(
         self,
@@ -24,90 +72,341 @@ class PostgresToElasticsearch(ABC):
         elasticsearch: Elasticsearch,
         state: State,
         batch_size: int,
+        pipeline_depth: int = 0,
+        bulk_thread_count: int = 4,
+        bulk_chunk_size: int = 250,
+        bulk_max_chunk_bytes: int = 10 * 1024 * 1024,
+        bulk_max_retries: int = 3,
+        full_reindex: bool = False,
+        index_name: str | None = None,
+        id_range: tuple[str, str] | None = None,
+        content_hashes: ContentHashes | None = None,
+        cache_invalidations: CacheInvalidations | None = None,
     ) -> None:
         self.postgres = postgres
         self.elasticsearch = elasticsearch
         self.state = state
         self.batch_size = batch_size
+        # Размер очередей между стадиями; 0 - стадии выполняются поочерёдно
+        self.pipeline_depth = pipeline_depth
+        # Параметры параллельной загрузки: число одновременных bulk-запросов и размер одного запроса
+        self.bulk_thread_count = bulk_thread_count
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_max_chunk_bytes = bulk_max_chunk_bytes
+        self.bulk_max_retries = bulk_max_retries
+        # Полная переиндексация: чтение с начала таблицы серверным курсором
+        self.full_reindex = full_reindex
+        # Индекс, в который загружаются документы вместо алиаса index_name, например при пересоздании
+        if index_name:
+            self.index_name = index_name
+        # Диапазон id, которым ограничено чтение, если таблицу переиндексируют несколько процессов
+        self.id_range = id_range
+        # Хэши загруженных документов, чтобы не перезаписывать в индексе неизменившиеся
+        self.content_hashes = content_hashes
+        # Сообщения API об изменившихся документах для сброса их кэша
+        self.cache_invalidations = cache_invalidations
+
+    @property
+    def state_prefix(self) -> str:
+        """Префикс ключей состояния конвейера: водяного знака и статистики загрузки"""
+        return self.index_name
 
     @property
     def state_key(self) -> str:
+        return self.state_prefix + "__cursor"
+
+    @property
+    def retry_key(self) -> str:
+        """Ключ состояния с id документов, загрузку которых нужно повторить"""
+        return self.state_prefix + "__retry"
+
+    @property
+    def legacy_state_key(self) -> str:
+        """Ключ, в котором раньше хранилось только время изменения"""
         return self.index_name + "__modified"
 
     @property
-    def modified(self) -> str:
-        return self.state.get_state(self.state_key) or dt.datetime.min.isoformat()
+    def cursor(self) -> Cursor:
+        if cursor := self.state.get_state(self.state_key):
+            return tuple(cursor)  # type: ignore[return-value]
+        # Продолжаем с сохранённого времени изменения, перечитав строки с этим же временем
+        return self.state.get_state(self.legacy_state_key) or dt.datetime.min.isoformat(), MIN_ID
+
+    @cursor.setter
+    def cursor(self, cursor: Cursor) -> None:
+        self.state.set_state(self.state_key, list(cursor))
 
-    @modified.setter
-    def modified(self, modified: str) -> None:
-        self.state.set_state(self.state_key, modified)
+    def open_cursor(self) -> plain_cursor:
+        """Открывает курсор для чтения изменений.
 
-    def extract(self) -> Generator:
-        """Возвращает данные батчами по batch_size штук"""
-        modified = self.modified
-        logger.info(f"starting etl from {modified}")
+        При полной переиндексации используется именованный (серверный) курсор, чтобы в памяти клиента
+        был только текущий батч, а строки читаются простыми кортежами без накладных расходов DictRow.
+        """
+        if not self.full_reindex:
+            return self.postgres.cursor()
 
-        with self.postgres.cursor() as cur:
-            cur.execute(self.extract_query, [modified])
+        cur = self.postgres.cursor(name=f"etl_{self.index_name}_{self.source_table}", cursor_factory=plain_cursor)
+        cur.itersize = self.batch_size
+        return cur
+
+    def extract(self) -> Generator[Batch, None, None]:
+        """Возвращает данные батчами по batch_size штук, начиная со строки, следующей за водяным знаком"""
+        # Диапазон при полной переиндексации продолжает чтение с сохранённой контрольной точки
+        start = self.cursor if self.id_range or not self.full_reindex else (dt.datetime.min.isoformat(), MIN_ID)
+        logger.info(f"starting {'full reindex' if self.full_reindex else 'etl'} from {start}")
+
+        query, params = self.extract_query, start
+        if self.id_range:
+            query = SQL_ID_RANGE.format(query=self.extract_query.strip().rstrip(";"))
+            params = (*start, *self.id_range)
+
+        with self.open_cursor() as cur:
+            cur.execute(query, params)
+            columns: list[str] = []
             while True:
                 dt_fetch_start = dt.datetime.now()
 
                 data = cur.fetchmany(self.batch_size)
                 if not data:
-                    logger.info(f"no more changes on {modified}")
+                    logger.info(f"no more changes after {start}")
                     break
 
-                logger.info(f"read {len(data)} items")
-                yield data
+                if self.full_reindex:
+                    columns = columns or [column.name for column in cur.description]
+                    data = [dict(zip(columns, row)) for row in data]
 
+                logger.info(f"read {len(data)} items")
                 last_modified = data[-1]["modified"] or dt_fetch_start
-                self.modified = last_modified.isoformat()
+                yield Batch(data, (last_modified.isoformat(), str(data[-1]["id"])))
+
+    def retry_ids(self) -> set[str]:
+        """Id документов, которые не удалось загрузить при прошлых запусках"""
+        return set(self.state.get_state(self.retry_key) or [])
 
-    def enrich(self, items_batches: Generator) -> Generator:
-        """Обогащает данные каждого объекта из items_batches данными жанров и персон"""
+    def add_retries(self, item_ids: Iterable[str]) -> None:
+        """Добавляет id документов, загрузку которых нужно повторить при следующем запуске"""
+        if item_ids := set(item_ids) - self.retry_ids():
+            self.state.set_state(self.retry_key, sorted(self.retry_ids() | item_ids))
+
+    def retry_batches(self) -> Generator[Batch, None, None]:
+        """Батчи id документов, которые не удалось загрузить при прошлых запусках, без сдвига водяного знака"""
+        retry_ids = sorted(self.retry_ids())
+        if retry_ids:
+            logger.info(f"retrying {len(retry_ids)} failed {self.index_name} items")
+        cursor = self.cursor
+        for start in range(0, len(retry_ids), self.batch_size):
+            yield Batch([], cursor, tuple(retry_ids[start : start + self.batch_size]))
+
+    def reload_failed(self) -> Generator[Batch, None, None]:
+        """Заново читает и обогащает строки документов, которые не удалось загрузить при прошлых запусках"""
+        query = SQL_BY_IDS.format(query=self.extract_query.strip().rstrip(";"))
+        for failed_batch in self.retry_batches():
+            with self.postgres.cursor() as cur:
+                cur.execute(query, (dt.datetime.min.isoformat(), MIN_ID, list(failed_batch.retried)))
+                failed_batch = failed_batch._replace(items=cur.fetchall())
+            yield from self.enrich(iter([failed_batch]))
+
+    def enrich(self, items_batches: Iterator[Batch]) -> Generator[Batch, None, None]:
+        """Обогащает данные объектов батча связанными данными одним запросом по массиву их id"""
         for items_batch in items_batches:
-            item_ids = [item["id"] for item in items_batch]
+            if not self.enrich_query:
+                yield items_batch._replace(items=[dict(item) for item in items_batch.items])
+                continue
 
+            item_ids = [str(item["id"]) for item in items_batch.items]
             with self.postgres.cursor() as cur:
-                enrich_data = dict()
-                table_names = tuple(self.enrich_queries.keys())
-                for table_name, query in self.enrich_queries.items():
-                    cur.execute(query, [item_ids])
-                    enrich_data[table_name] = dict(cur.fetchall())
+                cur.execute(self.enrich_query, [item_ids])
+                enrich_data = {row["id"]: dict(row) for row in cur.fetchall()}
 
-                yield [
-                    dict(item) | {table_name: enrich_data[table_name].get(item["id"], []) for table_name in table_names}
-                    for item in items_batch
-                ]
+            yield items_batch._replace(
+                items=[dict(item) | enrich_data.get(item["id"], {}) for item in items_batch.items],
+            )
 
     @staticmethod
     @abstractmethod
     def transform_item(item: dict[str, Any]) -> dict[str, Any]:
         """Преобразует данные объекта в формат, подходящий для загрузки в ElasticSearch"""
 
-    def transform(self, items_batches: Generator) -> Generator:
+    def transform(self, items_batches: Iterator[Batch]) -> Generator[Batch, None, None]:
         """Преобразует данные в формат, подходящий для загрузки в ElasticSearch"""
-        yield from ((self.transform_item(item) for item in items_batch) for items_batch in items_batches)
-
-    def load(self, items_batches: Generator) -> None:
-        """Отправляем данные в ElasticSearch"""
         for items_batch in items_batches:
-            to_ids, to_zip = itertools.tee(items_batch)
-            index_ids = ({"index": {"_index": self.index_name, "_id": item["id"]}} for item in to_ids)
-            ziped = zip(index_ids, to_zip)
-            operations = list(itertools.chain.from_iterable(ziped))
-            response = self.elasticsearch.bulk(operations=operations)
-            if response.body["errors"]:
-                for error in response.body["items"]:
-                    logger.error(
-                        "{type} in bulk load {index} id {id}: {reason}".format(
-                            type=error["index"]["error"]["type"],
-                            index=error["index"]["_index"],
-                            id=error["index"]["_id"],
-                            reason=error["index"]["error"]["reason"],
-                        ),
-                    )
-                raise ElasticError("Invalid etl conveyor")
+            yield items_batch._replace(items=[self.transform_item(item) for item in items_batch.items])
+
+    def make_actions(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Формирует bulk-действия для загрузки документов в индекс.
+
+        Документы сериализуются orjson, клиент Elasticsearch передаёт готовые байты в bulk-запрос как есть.
+        """
+        return [
+            {"_index": self.index_name, "_id": item["id"], "_source": orjson.dumps(item, default=str)} for item in items
+        ]
+
+    def bulk_chunk(self, actions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Отправляет часть батча, повторяя только отклонённые с 429 документы, и возвращает ошибки"""
+        return [
+            info
+            for _, info in streaming_bulk(
+                self.elasticsearch,
+                actions,
+                chunk_size=self.bulk_chunk_size,
+                max_chunk_bytes=self.bulk_max_chunk_bytes,
+                max_retries=self.bulk_max_retries,
+                raise_on_error=False,
+                raise_on_exception=False,
+                yield_ok=False,
+            )
+        ]
+
+    def bulk(self, executor: Executor, actions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Загружает батч несколькими параллельными bulk-запросами и возвращает ошибки по документам"""
+        chunks = [actions[i : i + self.bulk_chunk_size] for i in range(0, len(actions), self.bulk_chunk_size)]
+        return [error for errors in executor.map(self.bulk_chunk, chunks) for error in errors]
+
+    def skip_unchanged(self, actions: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], dict[str, bytes]]:
+        """Убирает документы, содержимое которых не изменилось с прошлой загрузки, и возвращает хэши остальных.
+
+        При полной переиндексации загружаются все документы, а хэши только обновляются.
+        """
+        if not self.content_hashes:
+            return actions, {}
+
+        hashes = {
+            str(action["_id"]): ContentHashes.digest(action["_source"]) for action in actions if "_source" in action
+        }
+        unchanged = set() if self.full_reindex else self.content_hashes.unchanged(self.index_name, hashes)
+        return (
+            [action for action in actions if str(action["_id"]) not in unchanged],
+            {item_id: digest for item_id, digest in hashes.items() if item_id not in unchanged},
+        )
+
+    def save_hashes(self, actions: list[dict[str, Any]], hashes: dict[str, bytes], failed_ids: set[str]) -> None:
+        """Запоминает хэши загруженных документов; хэши частично обновлённых и удалённых документов сбрасываются"""
+        if not self.content_hashes:
+            return
+        self.content_hashes.save(
+            self.index_name,
+            {item_id: digest for item_id, digest in hashes.items() if item_id not in failed_ids},
+        )
+        self.content_hashes.forget(
+            self.index_name,
+            [str(action["_id"]) for action in actions if action.get("_op_type") in ("update", "delete")],
+        )
+
+    def invalidate_cache(self, actions: list[dict[str, Any]], failed_ids: set[str]) -> None:
+        """Сообщает API id документов, записанных в индекс"""
+        if self.cache_invalidations and (
+            item_ids := [str(action["_id"]) for action in actions if str(action["_id"]) not in failed_ids]
+        ):
+            self.cache_invalidations.publish(self.index_name, item_ids)
+
+    def log_errors(self, errors: list[dict[str, Any]]) -> set[str]:
+        """Логирует ошибки загрузки документов и возвращает id тех, загрузку которых нужно повторить.
+
+        Частичное обновление отсутствующего документа не повторяется: документ целиком загрузит его конвейер.
+        """
+        retry_ids = set()
+        for error in errors:
+            op_type, info = next(iter(error.items()))
+            reason = info["error"]
+            error_type = reason["type"] if isinstance(reason, dict) else info.get("exception", "error")
+            if not (op_type == "update" and info["status"] == 404):
+                retry_ids.add(str(info.get("_id")))
+            logger.error(
+                "{type} in bulk {op_type} {index} id {id}: {reason}".format(
+                    type=error_type,
+                    op_type=op_type,
+                    index=info.get("_index", self.index_name),
+                    id=info.get("_id"),
+                    reason=reason["reason"] if isinstance(reason, dict) else reason,
+                ),
+            )
+        return retry_ids
+
+    def load(self, items_batches: Iterator[Batch]) -> None:
+        """Отправляем данные в ElasticSearch и сдвигаем водяной знак после подтверждения загрузки.
+
+        Id документов, которые Elasticsearch не принял, сохраняются вместе с водяным знаком
+        и загружаются заново при следующем запуске.
+        """
+        with ThreadPoolExecutor(self.bulk_thread_count, thread_name_prefix=f"etl-{self.index_name}-bulk") as executor:
+            for items_batch in items_batches:
+                actions, hashes = self.skip_unchanged(self.make_actions(items_batch.items))
+                errors = self.bulk(executor, actions)
+
+                new_retry_ids = self.log_errors(errors)
+                failed_ids = {str(next(iter(error.values())).get("_id")) for error in errors}
+                batch_ids = {str(item["id"]) for item in items_batch.items} | set(items_batch.retried)
+                self.save_hashes(actions, hashes, failed_ids)
+                stats = {
+                    "loaded": len(actions) - len(errors),
+                    "skipped": len(items_batch.items) - len(actions),
+                    "failed": len(errors),
+                }
+                logger.info("loaded {loaded} items, skipped {skipped} unchanged, {failed} failed".format(**stats))
+                # Водяной знак, id документов для повторной загрузки и статистика сохраняются вместе
+                self.state.commit(
+                    {
+                        self.state_key: list(items_batch.cursor),
+                        self.retry_key: sorted(self.retry_ids() - batch_ids | new_retry_ids),
+                        f"{self.state_prefix}__loaded_at": dt.datetime.now().isoformat(),
+                    },
+                    {f"{self.state_prefix}__{name}": count for name, count in stats.items()},
+                )
+                self.invalidate_cache(actions, failed_ids)
+
+    def _put(self, batches: queue.Queue, stopped: threading.Event, value: Any) -> bool:
+        """Кладёт значение в очередь стадии, пока конвейер не остановлен"""
+        while not stopped.is_set():
+            try:
+                batches.put(value, timeout=self.pipeline_poll_interval)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def _produce(
+        self, items_batches: Generator[Batch, None, None], batches: queue.Queue, stopped: threading.Event
+    ) -> None:
+        """Выполняет стадию конвейера, передавая её батчи и ошибку через очередь"""
+        try:
+            for items_batch in items_batches:
+                if not self._put(batches, stopped, items_batch):
+                    return
+        except Exception as e:
+            self._put(batches, stopped, e)
+        else:
+            self._put(batches, stopped, _PipelineEnd)
+        finally:
+            items_batches.close()
+
+    def prefetch(self, items_batches: Generator[Batch, None, None]) -> Generator[Batch, None, None]:
+        """Выполняет предыдущие стадии конвейера в отдельном потоке.
+
+        Готовые батчи складываются в очередь размером pipeline_depth, поэтому следующий батч
+        читается и обогащается, пока текущий обрабатывается последующими стадиями.
+        """
+        if not self.pipeline_depth:
+            yield from items_batches
+            return
+
+        batches: queue.Queue = queue.Queue(maxsize=self.pipeline_depth)
+        stopped = threading.Event()
+        producer = threading.Thread(
+            target=self._produce,
+            args=(items_batches, batches, stopped),
+            name=f"etl-{self.index_name}-stage",
+            daemon=True,
+        )
+        producer.start()
+        try:
+            while (value := batches.get()) is not _PipelineEnd:
+                if isinstance(value, Exception):
+                    raise value
+                yield value
+        finally:
+            stopped.set()
+            producer.join()
 
     def etl(self) -> None:
-        self.load(self.transform(self.enrich(self.extract())))
+        self.load(self.transform(self.reload_failed()))
+        self.load(self.prefetch(self.transform(self.enrich(self.prefetch(self.extract())))))
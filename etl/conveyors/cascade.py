@@ -0,0 +1,86 @@
+import logging
+from collections.abc import Generator, Iterator
+from typing import Any
+
+from conveyors.base import MIN_ID, Batch, Cursor, PostgresToElasticsearch
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeETL(PostgresToElasticsearch):
+    """Переиндексирует документы, которые зависят от изменившихся строк другой таблицы.
+
+    extract_query читает изменившиеся строки источника (id, modified) после водяного знака,
+    affected_query по массиву их id возвращает id затронутых документов индекса,
+    enrich_query по массиву id документов возвращает данные для них.
+    """
+
+    affected_query: str
+    enrich_query: str
+    # Обновлять в документах только поля, которые возвращает transform_item
+    partial_update: bool = True
+
+    @property
+    def state_prefix(self) -> str:
+        return f"{self.index_name}__{self.source_table}"
+
+    @property
+    def legacy_state_key(self) -> str:
+        return f"{self.index_name}__{self.source_table}__modified"
+
+    @property
+    def cursor(self) -> Cursor:
+        if not self.state.get_state(self.state_key) and not self.state.get_state(self.legacy_state_key):
+            # Первый запуск каскада: документы индекса уже загружены своими конвейерами вместе со связанными
+            # данными, поэтому читать всю таблицу источника не нужно, достаточно изменений с текущего момента
+            with self.postgres.cursor() as cur:
+                cur.execute("SELECT now();")
+                started = cur.fetchone()[0].isoformat()
+            logger.info(f"{self.source_table} cascade to {self.index_name} starts from {started}")
+            self.cursor = (started, MIN_ID)
+        return super().cursor
+
+    @cursor.setter
+    def cursor(self, cursor: Cursor) -> None:
+        self.state.set_state(self.state_key, list(cursor))
+
+    def enrich(self, items_batches: Iterator[Batch]) -> Generator[Batch, None, None]:
+        """Заменяет батч изменившихся строк источника батчами затронутых ими документов"""
+        cursor = self.cursor
+        for items_batch in items_batches:
+            source_ids = [str(item["id"]) for item in items_batch.items]
+            with self.postgres.cursor() as cur:
+                cur.execute(self.affected_query, [source_ids])
+                affected_ids = [str(row["id"]) for row in cur.fetchall()]
+            logger.info(f"{len(source_ids)} changed {self.source_table} affect {len(affected_ids)} {self.index_name}")
+
+            # Водяной знак сдвигается только вместе с последней частью затронутых документов
+            for start in range(0, len(affected_ids), self.batch_size):
+                with self.postgres.cursor() as cur:
+                    cur.execute(self.enrich_query, [affected_ids[start : start + self.batch_size]])
+                    items = [dict(row) for row in cur.fetchall()]
+                is_last = start + self.batch_size >= len(affected_ids)
+                yield Batch(items, items_batch.cursor if is_last else cursor)
+
+            if not affected_ids:
+                yield Batch([], items_batch.cursor)
+            cursor = items_batch.cursor
+
+    def reload_failed(self) -> Generator[Batch, None, None]:
+        """Документы, которые не удалось обновить, перечитываются по их id без поиска затронутых"""
+        for failed_batch in self.retry_batches():
+            with self.postgres.cursor() as cur:
+                cur.execute(self.enrich_query, [list(failed_batch.retried)])
+                yield failed_batch._replace(items=[dict(row) for row in cur.fetchall()])
+
+    def etl(self) -> None:
+        if self.full_reindex:
+            # Полная переиндексация целевого индекса уже содержит актуальные связанные данные
+            logger.info(f"skip {self.source_table} cascade to {self.index_name} on full reindex")
+            return
+        super().etl()
+
+    def make_actions(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if not self.partial_update:
+            return super().make_actions(items)
+        return [{"_op_type": "update", "_index": self.index_name, "_id": item["id"], "doc": item} for item in items]
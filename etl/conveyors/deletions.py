@@ -0,0 +1,64 @@
+from collections.abc import Generator
+from typing import Any
+
+from conveyors.base import Batch, PostgresToElasticsearch
+
+# Удаления объектов таблицы, которых уже нет в ней: объект мог быть создан заново с тем же id
+SQL_DELETED_OBJECTS = """
+SELECT d.id,
+       d.object_id,
+       d.deleted AS modified
+FROM content.deleted_objects AS d
+WHERE d.table_name = '{table}'
+  AND (d.deleted, d.id) > (%s, %s)
+  AND NOT EXISTS (SELECT 1 FROM content.{table} AS t WHERE t.id = d.object_id)
+ORDER BY d.deleted, d.id;
+"""
+
+
+class DeletionsETL(PostgresToElasticsearch):
+    """Удаляет из индекса документы удалённых объектов.
+
+    Удаления записываются триггерами в таблицу deleted_objects.
+    """
+
+    source_table: str = "deleted_objects"
+
+    @property
+    def state_prefix(self) -> str:
+        return f"{self.index_name}__deleted"
+
+    @property
+    def legacy_state_key(self) -> str:
+        # Водяной знак удалений не хранился временем изменения: первый запуск читает удаления с начала
+        return f"{self.state_prefix}__modified"
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["object_id"]}
+
+    def reload_failed(self) -> Generator[Batch, None, None]:
+        for failed_batch in self.retry_batches():
+            yield failed_batch._replace(items=[{"object_id": item_id} for item_id in failed_batch.retried])
+
+    def make_actions(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        return [{"_op_type": "delete", "_index": self.index_name, "_id": item["id"]} for item in items]
+
+    def bulk_chunk(self, actions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # Документа может уже не быть в индексе, например после сверки индекса с Postgres
+        return [error for error in super().bulk_chunk(actions) if error.get("delete", {}).get("status") != 404]
+
+
+class MoviesDeletionsETL(DeletionsETL):
+    index_name: str = "movies"
+    extract_query: str = SQL_DELETED_OBJECTS.format(table="film_work")
+
+
+class GenresDeletionsETL(DeletionsETL):
+    index_name: str = "genres"
+    extract_query: str = SQL_DELETED_OBJECTS.format(table="genre")
+
+
+class PersonsDeletionsETL(DeletionsETL):
+    index_name: str = "persons"
+    extract_query: str = SQL_DELETED_OBJECTS.format(table="person")
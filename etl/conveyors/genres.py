@@ -7,15 +7,15 @@ SELECT fw.id,
        fw.name,
        fw.modified
 FROM content.genre as fw
-WHERE fw.modified >= %s
+WHERE (fw.modified, fw.id) > (%s, %s)
 ORDER BY fw.modified, fw.id;
 """
 
 
 class GenresETL(PostgresToElasticsearch):
     index_name: str = "genres"
+    source_table: str = "genre"
     extract_query: str = SQL_GENRES
-    enrich_queries: dict[str, str] = {}
 
     @staticmethod
     def transform_item(item: dict[str, Any]) -> dict[str, Any]:
@@ -1,6 +1,9 @@
 from typing import Any
 
+import orjson
 from conveyors.base import PostgresToElasticsearch
+from conveyors.cascade import CascadeETL
+from conveyors.suggest import suggest_inputs
 
 SQL_FILM_WORK = """
 SELECT fw.id,
@@ -10,79 +13,206 @@ SELECT fw.id,
        fw.type,
        fw.modified
 FROM content.film_work as fw
-WHERE fw.modified >= %s
+WHERE (fw.modified, fw.id) > (%s, %s)
 ORDER BY fw.modified, fw.id;
 """
 
 SQL_GENRES = """
-SELECT gfw.film_work_id,
-       json_agg(
+SELECT json_agg(
            DISTINCT jsonb_build_object(
                    'id', g.id,
                    'name', g.name
                )
-       )
-FROM content.genre_film_work as gfw
-LEFT JOIN content.genre as g
+       ) AS genres
+FROM content.genre_film_work AS gfw
+JOIN content.genre AS g
     ON gfw.genre_id = g.id
-WHERE gfw.film_work_id::text = ANY(%s)
-GROUP BY gfw.film_work_id
+WHERE gfw.film_work_id = fw.id
 """
 
 SQL_PERSONS = """
-SELECT pfw.film_work_id,
-       json_agg(
+SELECT json_agg(
            DISTINCT jsonb_build_object(
                    'role', pfw.role,
                    'id', p.id,
                    'name', p.full_name
                )
-       )
-FROM content.person_film_work as pfw
-LEFT JOIN content.person as p
-ON pfw.person_id = p.id
-WHERE pfw.film_work_id::text = ANY(%s)
-GROUP BY pfw.film_work_id;
+       ) AS persons
+FROM content.person_film_work AS pfw
+JOIN content.person AS p
+    ON pfw.person_id = p.id
+WHERE pfw.film_work_id = fw.id
 """
 
 SQL_SUBSCRIPTIONS = """
-SELECT sfw.film_work_id,
-       json_agg(
+SELECT json_agg(
            DISTINCT sfw.subscription_id
-       )
-FROM content.subscription_film_work as sfw
-WHERE sfw.film_work_id::text = ANY(%s)
-GROUP BY sfw.film_work_id;
+       ) AS subscriptions
+FROM content.subscription_film_work AS sfw
+WHERE sfw.film_work_id = fw.id
 """
 
+SQL_ENRICH = f"""
+SELECT fw.id,
+       COALESCE(fg.genres, '[]')::text AS genres,
+       COALESCE(fp.persons, '[]')::text AS persons,
+       COALESCE(fs.subscriptions, '[]')::text AS subscriptions
+FROM unnest(%s::uuid[]) AS fw(id)
+LEFT JOIN LATERAL ({SQL_GENRES}) AS fg ON TRUE
+LEFT JOIN LATERAL ({SQL_PERSONS}) AS fp ON TRUE
+LEFT JOIN LATERAL ({SQL_SUBSCRIPTIONS}) AS fs ON TRUE;
+"""
+
+SQL_ENRICH_GENRES = f"""
+SELECT fw.id,
+       COALESCE(fg.genres, '[]') AS genres
+FROM unnest(%s::uuid[]) AS fw(id)
+LEFT JOIN LATERAL ({SQL_GENRES}) AS fg ON TRUE;
+"""
+
+SQL_ENRICH_PERSONS = f"""
+SELECT fw.id,
+       COALESCE(fp.persons, '[]') AS persons
+FROM unnest(%s::uuid[]) AS fw(id)
+LEFT JOIN LATERAL ({SQL_PERSONS}) AS fp ON TRUE;
+"""
+
+SQL_ENRICH_SUBSCRIPTIONS = f"""
+SELECT fw.id,
+       COALESCE(fs.subscriptions, '[]') AS subscriptions
+FROM unnest(%s::uuid[]) AS fw(id)
+LEFT JOIN LATERAL ({SQL_SUBSCRIPTIONS}) AS fs ON TRUE;
+"""
+
+# Изменённые строки источника каскада и удалённые связи фильмов, которые триггер записывает
+# в deleted_objects с id фильма
+SQL_CHANGED_WITH_LINK_DELETIONS = """
+SELECT c.id,
+       c.modified
+FROM (
+    SELECT s.id,
+           s.modified
+    FROM content.{table} AS s
+    UNION ALL
+    SELECT d.id,
+           d.deleted AS modified
+    FROM content.deleted_objects AS d
+    WHERE d.table_name = '{link_table}'
+) AS c
+WHERE (c.modified, c.id) > (%s, %s)
+ORDER BY c.modified, c.id;
+"""
+
+# Существующие фильмы, связанные с изменёнными строками источника, и фильмы удалённых связей
+SQL_LINKED_FILMS = """
+WITH changes AS (
+    SELECT unnest(%s::uuid[]) AS id
+)
+SELECT fw.id
+FROM content.film_work AS fw
+WHERE fw.id IN (
+    SELECT l.film_work_id
+    FROM content.{link_table} AS l
+    JOIN changes AS c ON c.id = l.{source_column}
+    UNION
+    SELECT d.object_id
+    FROM content.deleted_objects AS d
+    JOIN changes AS c ON c.id = d.id
+);
+"""
+
+SQL_CHANGED_GENRES = SQL_CHANGED_WITH_LINK_DELETIONS.format(table="genre", link_table="genre_film_work")
+SQL_GENRES_FILMS = SQL_LINKED_FILMS.format(link_table="genre_film_work", source_column="genre_id")
+
+SQL_CHANGED_PERSONS = SQL_CHANGED_WITH_LINK_DELETIONS.format(table="person", link_table="person_film_work")
+SQL_PERSONS_FILMS = SQL_LINKED_FILMS.format(link_table="person_film_work", source_column="person_id")
+
+SQL_CHANGED_SUBSCRIPTIONS = SQL_CHANGED_WITH_LINK_DELETIONS.format(
+    table="subscription_film_work", link_table="subscription_film_work"
+)
+SQL_SUBSCRIPTIONS_FILMS = SQL_LINKED_FILMS.format(link_table="subscription_film_work", source_column="id")
+
+
+# Поля документа для каждой роли участника: имена и участники с этой ролью
+ROLE_FIELDS = {role: (f"{role}s_names", f"{role}s") for role in ("director", "actor", "writer")}
+
+
+def split_persons(persons: list[dict[str, Any]]) -> dict[str, list[Any]]:
+    """Раскладывает участников фильма по полям документа в соответствии с их ролями"""
+    fields: dict[str, list[Any]] = {names: [] for names, _ in ROLE_FIELDS.values()}
+    fields.update({objects: [] for _, objects in ROLE_FIELDS.values()})
+    for person in persons:
+        if role_fields := ROLE_FIELDS.get(person["role"]):
+            names, objects = role_fields
+            fields[names].append(person["name"])
+            fields[objects].append({"id": person["id"], "name": person["name"]})
+    return fields
+
 
 class MoviesETL(PostgresToElasticsearch):
     index_name: str = "movies"
+    source_table: str = "film_work"
     extract_query: str = SQL_FILM_WORK
-    enrich_queries: dict[str, str] = {
-        "genres": SQL_GENRES,
-        "persons": SQL_PERSONS,
-        "subscriptions": SQL_SUBSCRIPTIONS,
-    }
+    enrich_query: str = SQL_ENRICH
 
     @staticmethod
     def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        # Жанры и подписки Postgres возвращает готовым JSON, который вставляется в документ без разбора
         transformed_item = {
             "id": item["id"],
             "imdb_rating": item["rating"],
-            "genre": item["genres"],
+            "genre": orjson.Fragment(item["genres"]),
             "title": item["title"],
+            # Подсказки фильмов с высоким рейтингом показываются первыми
+            "title_suggest": {"input": suggest_inputs(item["title"]), "weight": int((item["rating"] or 0) * 10)},
             "description": item["description"],
-            "directors_names": [],
-            "actors_names": [],
-            "writers_names": [],
-            "directors": [],
-            "actors": [],
-            "writers": [],
-            "subscriptions": item["subscriptions"],
+            **split_persons(orjson.loads(item["persons"])),
+            "subscriptions": orjson.Fragment(item["subscriptions"]),
         }
-        for person in item["persons"]:
-            transformed_item[person["role"] + "s_names"].append(person["name"])
-            transformed_item[person["role"] + "s"].append({"id": person["id"], "name": person["name"]})
 
         return transformed_item
+
+
+class MoviesGenresETL(CascadeETL):
+    """Обновляет жанры в фильмах после изменения и удаления жанров и их связей с фильмами"""
+
+    index_name: str = "movies"
+    source_table: str = "genre"
+    extra_source_tables: tuple[str, ...] = ("deleted_objects",)
+    extract_query: str = SQL_CHANGED_GENRES
+    affected_query: str = SQL_GENRES_FILMS
+    enrich_query: str = SQL_ENRICH_GENRES
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["id"], "genre": item["genres"]}
+
+
+class MoviesPersonsETL(CascadeETL):
+    """Обновляет участников фильмов после изменения и удаления персон и их связей с фильмами"""
+
+    index_name: str = "movies"
+    source_table: str = "person"
+    extra_source_tables: tuple[str, ...] = ("deleted_objects",)
+    extract_query: str = SQL_CHANGED_PERSONS
+    affected_query: str = SQL_PERSONS_FILMS
+    enrich_query: str = SQL_ENRICH_PERSONS
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["id"], **split_persons(item["persons"])}
+
+
+class MoviesSubscriptionsETL(CascadeETL):
+    """Обновляет подписки в фильмах после привязки фильмов к подпискам"""
+
+    index_name: str = "movies"
+    source_table: str = "subscription_film_work"
+    extra_source_tables: tuple[str, ...] = ("deleted_objects",)
+    extract_query: str = SQL_CHANGED_SUBSCRIPTIONS
+    affected_query: str = SQL_SUBSCRIPTIONS_FILMS
+    enrich_query: str = SQL_ENRICH_SUBSCRIPTIONS
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["id"], "subscriptions": item["subscriptions"]}
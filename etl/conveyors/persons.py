@@ -1,6 +1,8 @@
 from typing import Any
 
 from conveyors.base import PostgresToElasticsearch
+from conveyors.cascade import CascadeETL
+from conveyors.suggest import suggest_inputs
 
 SQL_PERSONS = """
 SELECT
@@ -16,49 +18,76 @@ SELECT
 FROM content.person AS p
 LEFT JOIN content.person_film_work AS pfw ON p.id = pfw.person_id
 LEFT JOIN content.film_work AS fw ON pfw.film_work_id = fw.id
-WHERE p.modified >= %s
+WHERE (p.modified, p.id) > (%s, %s)
 GROUP BY p.id, p.modified
-ORDER BY p.modified;
+ORDER BY p.modified, p.id;
 """
 
 
-SQL_FILM_PERSONS = """
-SELECT
-   p.id,
-   p.full_name,
-   json_agg(
-       DISTINCT jsonb_build_object(
-               'id', pfw.film_work_id,
-               'role', pfw.role
-           )
-   ) as films,
-   MAX(fw.modified) AS modified
+SQL_CHANGED_FILM_WORKS = """
+SELECT fw.id,
+       fw.modified
+FROM content.film_work AS fw
+WHERE (fw.modified, fw.id) > (%s, %s)
+ORDER BY fw.modified, fw.id;
+"""
+
+SQL_FILMS_PERSONS = """
+SELECT DISTINCT pfw.person_id AS id
+FROM content.person_film_work AS pfw
+WHERE pfw.film_work_id = ANY(%s::uuid[]);
+"""
+
+SQL_ENRICH_FILM_PERSONS = """
+SELECT p.id,
+       p.full_name,
+       COALESCE(pf.films, '[]') AS films
 FROM content.person AS p
-LEFT JOIN content.person_film_work AS pfw ON p.id = pfw.person_id
-LEFT JOIN content.film_work AS fw ON pfw.film_work_id = fw.id
-GROUP BY p.id
-HAVING MAX(fw.modified) >= %s
-ORDER BY MAX(fw.modified);
+LEFT JOIN LATERAL (
+    SELECT json_agg(
+               DISTINCT jsonb_build_object(
+                       'id', pfw.film_work_id,
+                       'role', pfw.role
+                   )
+           ) AS films
+    FROM content.person_film_work AS pfw
+    WHERE pfw.person_id = p.id
+) AS pf ON TRUE
+WHERE p.id = ANY(%s::uuid[]);
 """
 
 
+def add_suggest(item: dict[str, Any]) -> dict[str, Any]:
+    """Добавляет в документ персоны подсказки по имени"""
+    item["full_name_suggest"] = suggest_inputs(item["full_name"])
+    return item
+
+
 class PersonsETL(PostgresToElasticsearch):
     index_name: str = "persons"
+    source_table: str = "person"
     extract_query: str = SQL_PERSONS
-    enrich_queries: dict[str, str] = {}
 
     @staticmethod
     def transform_item(item: dict[str, Any]) -> dict[str, Any]:
         item.pop("modified")
-        return item
+        return add_suggest(item)
+
 
+class FilmPersonsETL(CascadeETL):
+    """Переиндексирует персон, участвовавших в изменившихся фильмах"""
 
-class FilmPersonsETL(PostgresToElasticsearch):
-    index_name: str = "film_persons"
-    extract_query: str = SQL_FILM_PERSONS
-    enrich_queries: dict[str, str] = {}
+    index_name: str = "persons"
+    source_table: str = "film_work"
+    extract_query: str = SQL_CHANGED_FILM_WORKS
+    affected_query: str = SQL_FILMS_PERSONS
+    enrich_query: str = SQL_ENRICH_FILM_PERSONS
+    partial_update: bool = False
+
+    @property
+    def legacy_state_key(self) -> str:
+        return "film_persons__modified"
 
     @staticmethod
     def transform_item(item: dict[str, Any]) -> dict[str, Any]:
-        item.pop("modified")
-        return item
+        return add_suggest(item)
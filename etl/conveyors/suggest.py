@@ -0,0 +1,12 @@
+# Сколько слов названия или имени, с которых начинается подсказка при наборе
+SUGGEST_MAX_WORDS = 10
+
+
+def suggest_inputs(text: str | None) -> list[str]:
+    """Входы поля подсказок: текст целиком и его окончания, начинающиеся с каждого следующего слова.
+
+    Completion-поле находит подсказку только по началу входа, поэтому с окончаниями
+    "Звёздные войны" находится и по "войны".
+    """
+    words = (text or "").split()
+    return [" ".join(words[start:]) for start in range(min(len(words), SUGGEST_MAX_WORDS))]
@@ -56,20 +56,36 @@ INDEX_SETTINGS = {
 }
 
 
+INDICES: dict[str, dict[str, Any]] = {
+    "movies": INDEX_MAPPINGS_MOVIES,
+    "genres": INDEX_MAPPINGS_GENRES,
+    "persons": INDEX_MAPPINGS_PERSONS,
+}
+
+
+def versioned_index_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+
 @backoff.on_exception(backoff.expo, (BadRequestError, NotFoundError), max_time=60)
 def get_or_create_index(client: Elasticsearch, index_name: str, mapping: dict[str, Any]) -> dict[str, Any]:
     try:
         index = client.indices.get(index=index_name)
     except NotFoundError:
+        # Приложения работают с алиасом, чтобы индекс можно было пересоздать без простоя
         client.indices.create(
-            index=index_name,
+            index=versioned_index_name(index_name, 1),
             settings=INDEX_SETTINGS,
             mappings=mapping,
+            aliases={index_name: {}},
         )
         logger.info("Index created")
         raise
     else:
-        logger.info("Index exists")
+        # Маппинги строгие: новые поля добавляются в существующий индекс до того, как ETL начнёт их писать.
+        # Изменение только добавляет поля, у уже существующих полей маппинг не меняется
+        client.indices.put_mapping(index=index_name, properties=mapping["properties"])
+        logger.info("Index exists, mapping updated")
         return index
 
 
@@ -78,9 +94,8 @@ def main() -> None:
         [{"host": "elastic", "port": settings.elastic_port, "scheme": "http"}],
     )
 
-    get_or_create_index(client, "movies", INDEX_MAPPINGS_MOVIES)
-    get_or_create_index(client, "genres", INDEX_MAPPINGS_GENRES)
-    get_or_create_index(client, "persons", INDEX_MAPPINGS_PERSONS)
+    for index_name, mapping in INDICES.items():
+        get_or_create_index(client, index_name, mapping)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import logging
+import select
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
+from typing import Any
+
+import backoff
+import psycopg2
+from config import settings
+from elastic_transport import ConnectionError as ElasticConnectionError
+from elasticsearch import Elasticsearch
+from etl import index_conveyors, index_states, run_indices
+from psycopg2._psycopg import connection
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import DictCursor
+from redis import ConnectionError as RedisConnectionError, Redis
+from state import CacheInvalidations, ContentHashes
+
+logger = logging.getLogger(__name__)
+
+# Канал уведомлений Postgres об изменениях в схеме content. Имя канала задано в триггерной функции
+# миграции admin 0008_content_change_notifications и должно совпадать с ним
+NOTIFY_CHANNEL = "content_changes"
+
+
+def wait_for_changes(listener: connection, debounce: float, poll_interval: float) -> set[str] | None:
+    """Ждёт уведомлений об изменениях в схеме content и возвращает изменившиеся таблицы.
+
+    После первого уведомления ещё debounce секунд собирает следующие, чтобы обработать
+    изменения одним микробатчем. Если уведомлений не было poll_interval секунд, возвращает None.
+    """
+    if not select.select([listener], [], [], poll_interval)[0]:
+        return None
+
+    tables: set[str] = set()
+    deadline = time.monotonic() + debounce
+    while True:
+        listener.poll()
+        tables.update(notify.payload for notify in listener.notifies)
+        listener.notifies.clear()
+
+        timeout = deadline - time.monotonic()
+        if timeout <= 0 or not select.select([listener], [], [], timeout)[0]:
+            return tables
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (ElasticConnectionError, psycopg2.OperationalError, RedisConnectionError),
+    max_value=60,
+)  # type: ignore
+def etl_daemon(
+    postgres_dsn: dict[str, Any],
+    redis_dsn: dict[str, Any],
+    elastic_host: dict[str, Any],
+    batch_size: int,
+    debounce: float,
+    poll_interval: float,
+    concurrency: int = 1,
+    **conveyor_options: Any,
+) -> None:
+    """Постоянно держит соединения и запускает конвейеры по уведомлениям об изменениях в Postgres.
+
+    При отсутствии уведомлений конвейеры запускаются раз в poll_interval секунд, чтобы
+    не пропустить изменения, сделанные, пока демон был остановлен.
+    """
+    redis = Redis(**redis_dsn)
+    client = Elasticsearch([elastic_host], request_timeout=20)
+    states = index_states(redis)
+    logger.info('starting "etl_daemon"')
+
+    with ExitStack() as stack:
+        listener = stack.enter_context(closing(psycopg2.connect(**postgres_dsn)))
+        connections = {
+            index_name: stack.enter_context(closing(psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor)))
+            for index_name in index_conveyors()
+        }
+        executor = stack.enter_context(ThreadPoolExecutor(concurrency, thread_name_prefix="etl-index"))
+
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with listener.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+
+        etl_params = {
+            "elasticsearch": client,
+            "batch_size": batch_size,
+            "content_hashes": ContentHashes(redis),
+            "cache_invalidations": CacheInvalidations(redis, settings.cache_invalidation_channel),
+            **conveyor_options,
+        }
+        tables = None
+        while True:
+            logger.info(f"processing changes in {sorted(tables) if tables else 'all tables'}")
+            run_indices(executor, redis, connections, states, etl_params, tables)
+            tables = wait_for_changes(listener, debounce, poll_interval)
@@ -1,22 +1,141 @@
 import logging
-from contextlib import closing, suppress
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import ExitStack, closing, contextmanager, suppress
 from typing import Any
 
 import backoff
 import psycopg2
+from config import settings
+from conveyors.base import PostgresToElasticsearch
+from conveyors.deletions import GenresDeletionsETL, MoviesDeletionsETL, PersonsDeletionsETL
 from conveyors.genres import GenresETL
-from conveyors.movies import MoviesETL
+from conveyors.movies import MoviesETL, MoviesGenresETL, MoviesPersonsETL, MoviesSubscriptionsETL
 from conveyors.persons import FilmPersonsETL, PersonsETL
 from elastic_transport import ConnectionError as ElasticConnectionError
 from elasticsearch import Elasticsearch
 from exceptions import ElasticError
+from psycopg2._psycopg import connection
 from psycopg2.extras import DictCursor
 from redis import ConnectionError as RedisConnectionError, Redis
-from redis.exceptions import LockError
-from state import RedisStorage, State
+from redis.exceptions import LockError, LockNotOwnedError, RedisError
+from redis.lock import Lock
+from state import CacheInvalidations, ContentHashes, RedisHashStorage, RedisStorage, State
 
 logger = logging.getLogger(__name__)
 
+# Время жизни блокировки индекса и интервал, с которым она продлевается, пока загружаются его конвейеры, сек.
+LOCK_TIMEOUT = 60 * 10
+LOCK_EXTEND_INTERVAL = 60
+
+CONVEYORS: tuple[type[PostgresToElasticsearch], ...] = (
+    MoviesETL,
+    GenresETL,
+    PersonsETL,
+    FilmPersonsETL,
+    MoviesGenresETL,
+    MoviesPersonsETL,
+    MoviesSubscriptionsETL,
+    MoviesDeletionsETL,
+    GenresDeletionsETL,
+    PersonsDeletionsETL,
+)
+
+
+def lock_name(index_name: str) -> str:
+    """Блокировка, под которой в индекс пишет только один процесс ETL"""
+    return f"etl_data__{index_name}"
+
+
+def index_conveyors(tables: set[str] | None = None) -> dict[str, list[type[PostgresToElasticsearch]]]:
+    """Группирует по индексам конвейеры, читающие изменившиеся таблицы, или все, если таблицы неизвестны"""
+    conveyors: dict[str, list[type[PostgresToElasticsearch]]] = {}
+    for etl_class in CONVEYORS:
+        if tables is None or tables & {etl_class.source_table, *etl_class.extra_source_tables}:
+            conveyors.setdefault(etl_class.index_name, []).append(etl_class)
+    return conveyors
+
+
+@contextmanager
+def extending(lock: Lock) -> Iterator[None]:
+    """Продлевает блокировку в отдельном потоке, пока выполняется блок, чтобы она не истекла посреди долгой загрузки"""
+    stop = threading.Event()
+
+    def heartbeat() -> None:
+        while not stop.wait(LOCK_EXTEND_INTERVAL):
+            try:
+                lock.extend(LOCK_TIMEOUT, replace_ttl=True)
+            except LockNotOwnedError:
+                return
+            except RedisError as e:
+                # Блокировка продлится при следующей попытке, если Redis станет доступен до её истечения
+                logger.warning(f'Unable to extend lock "{lock.name}": {e!r}')
+
+    thread = threading.Thread(target=heartbeat, name=f"{lock.name}__heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def index_states(redis: Redis) -> dict[str, State]:
+    """Состояния индексов: локальный кэш состояния одного индекса сбрасывается, не мешая потокам других"""
+    return {
+        index_name: State(RedisHashStorage(redis, legacy_data_key=RedisStorage.data_key))
+        for index_name in index_conveyors()
+    }
+
+
+def run_conveyors(
+    redis: Redis, conveyor_params: dict[str, Any], conveyors: list[type[PostgresToElasticsearch]]
+) -> None:
+    """Последовательно запускает конвейеры одного индекса под его блокировкой"""
+    index_name = conveyors[0].index_name
+    # Блокировку продлевает другой поток, поэтому её токен не должен храниться в данных потока
+    lock = redis.lock(lock_name(index_name), timeout=LOCK_TIMEOUT, blocking=False, thread_local=False)
+    try:
+        with lock, extending(lock):
+            # Пока блокировка была свободна, состояние индекса могли изменить другие процессы
+            conveyor_params["state"].reset()
+            for etl_class in conveyors:
+                with suppress(ElasticError):
+                    etl_class(**conveyor_params).etl()  # type: ignore
+    except LockNotOwnedError:
+        logger.error(f'Lock "{lock_name(index_name)}" expired during run')
+    except LockError:
+        logger.warning(f'Unable to acquire lock "{lock_name(index_name)}"')
+    finally:
+        # Завершаем транзакцию чтения, чтобы не держать соединение в состоянии idle in transaction
+        conveyor_params["postgres"].rollback()
+
+
+def run_indices(
+    executor: Executor,
+    redis: Redis,
+    connections: dict[str, connection],
+    states: dict[str, State],
+    conveyor_params: dict[str, Any],
+    tables: set[str] | None = None,
+) -> None:
+    """Параллельно запускает конвейеры разных индексов, каждый со своим соединением с Postgres и состоянием.
+
+    Долгая загрузка одного индекса не задерживает обновление остальных.
+    """
+    futures = [
+        executor.submit(
+            run_conveyors,
+            redis,
+            conveyor_params | {"postgres": connections[index_name], "state": states[index_name]},
+            conveyors,
+        )
+        for index_name, conveyors in index_conveyors(tables).items()
+    ]
+    for future in futures:
+        future.result()
+
 
 @backoff.on_exception(
     backoff.expo,
@@ -28,30 +147,26 @@ def etl_data(
     redis_dsn: dict[str, Any],
     elastic_host: dict[str, Any],
     batch_size: int,
+    concurrency: int = 1,
+    **conveyor_options: Any,
 ) -> None:
     """Управляет процессом загрузки данных, блокировками и backoff"""
     redis = Redis(**redis_dsn)
     logger.info('starting "etl_data"')
 
-    try:
-        with redis.lock("etl_data", timeout=60 * 10, blocking=False):
-            client = Elasticsearch([elastic_host], request_timeout=20)
-            storage = RedisStorage(redis)
-            state = State(storage)
-
-            with closing(
-                psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor),
-            ) as pg_conn:
-                etl_params = {
-                    "postgres": pg_conn,
-                    "elasticsearch": client,
-                    "batch_size": batch_size,
-                    "state": state,
-                }
-                for etl_class in (MoviesETL, GenresETL, PersonsETL, FilmPersonsETL):
-                    with suppress(ElasticError):
-                        etl_class(**etl_params).etl()  # type: ignore
-
-    except LockError:
-        logger.warning('Unable to acquire lock "etl_movies"')
-        return
+    client = Elasticsearch([elastic_host], request_timeout=20)
+    states = index_states(redis)
+    etl_params = {
+        "elasticsearch": client,
+        "batch_size": batch_size,
+        "content_hashes": ContentHashes(redis),
+        "cache_invalidations": CacheInvalidations(redis, settings.cache_invalidation_channel),
+        **conveyor_options,
+    }
+    with ExitStack() as stack:
+        connections = {
+            index_name: stack.enter_context(closing(psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor)))
+            for index_name in index_conveyors()
+        }
+        executor = stack.enter_context(ThreadPoolExecutor(concurrency, thread_name_prefix="etl-index"))
+        run_indices(executor, redis, connections, states, etl_params)
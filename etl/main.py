@@ -1,8 +1,14 @@
+import argparse
 import logging
 import sys
 
 from config import settings
+from create_indices import INDICES
+from daemon import etl_daemon
 from etl import etl_data
+from rebuild import rebuild_indices
+from reconcile import reconcile_indices
+from reindex import parallel_reindex
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -10,6 +16,42 @@ logger = logging.getLogger(__name__)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load data from Postgres to Elasticsearch")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and process changes on Postgres notifications instead of a single run",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Reindex all rows from scratch streaming them with server-side cursors",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.reindex_workers,
+        help="Processes for --full: tables are split into id ranges loaded in parallel (1 - single process)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Discard checkpoints of an interrupted parallel --full run instead of resuming it",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="Delete index documents of rows missing in Postgres and report rows missing in indices",
+    )
+    parser.add_argument(
+        "--rebuild",
+        nargs="+",
+        choices=INDICES,
+        metavar="INDEX",
+        help="Rebuild indices into new versions and switch their aliases without downtime",
+    )
+    args = parser.parse_args()
+
     postgres_dsn = {
         "dbname": settings.postgres_movies_db,
         "user": settings.postgres_user,
@@ -30,4 +72,41 @@ if __name__ == "__main__":
     }
     batch_size = settings.batch_size
 
-    etl_data(postgres_dsn, redis_dsn, elastic_host, batch_size)
+    conveyor_options = {
+        "pipeline_depth": settings.pipeline_depth,
+        "bulk_thread_count": settings.bulk_thread_count,
+        "bulk_chunk_size": settings.bulk_chunk_size,
+        "bulk_max_chunk_bytes": settings.bulk_max_chunk_bytes,
+        "bulk_max_retries": settings.bulk_max_retries,
+        "full_reindex": args.full,
+    }
+
+    if args.reconcile:
+        reconcile_indices(postgres_dsn, redis_dsn, elastic_host, batch_size)
+    elif args.rebuild:
+        rebuild_indices(postgres_dsn, redis_dsn, elastic_host, batch_size, args.rebuild, **conveyor_options)
+    elif args.full and args.workers > 1:
+        loaded = parallel_reindex(
+            postgres_dsn,
+            redis_dsn,
+            elastic_host,
+            batch_size,
+            workers=args.workers,
+            ranges=settings.reindex_ranges,
+            restart=args.restart,
+            **conveyor_options,
+        )
+        sys.exit(0 if loaded else 1)
+    elif args.daemon:
+        etl_daemon(
+            postgres_dsn,
+            redis_dsn,
+            elastic_host,
+            batch_size,
+            debounce=settings.notify_debounce_seconds,
+            poll_interval=settings.poll_interval_seconds,
+            concurrency=settings.concurrency,
+            **conveyor_options,
+        )
+    else:
+        etl_data(postgres_dsn, redis_dsn, elastic_host, batch_size, settings.concurrency, **conveyor_options)
@@ -13,9 +13,16 @@ INDEX_MAPPINGS_MOVIES = {
                 },
             },
         },
+        "title_suggest": {
+            "type": "completion",
+            "analyzer": "simple",
+        },
         "imdb_rating": {
             "type": "float",
         },
+        "subscriptions": {
+            "type": "integer",
+        },
         "description": {
             "type": "text",
             "analyzer": "ru_en",
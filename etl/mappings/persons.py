@@ -13,6 +13,10 @@ INDEX_MAPPINGS_PERSONS = {
                 },
             },
         },
+        "full_name_suggest": {
+            "type": "completion",
+            "analyzer": "simple",
+        },
         "films": {
             "type": "nested",
             "dynamic": "strict",
@@ -0,0 +1,162 @@
+import logging
+from contextlib import closing
+from typing import Any
+
+import psycopg2
+from config import settings
+from conveyors.base import MIN_ID, PostgresToElasticsearch
+from conveyors.cascade import CascadeETL
+from create_indices import INDEX_SETTINGS, INDICES, versioned_index_name
+from elasticsearch import Elasticsearch
+from etl import CONVEYORS, lock_name
+from psycopg2.extras import DictCursor
+from redis import Redis
+from state import CacheInvalidations, ContentHashes, RedisHashStorage, RedisStorage, State
+
+logger = logging.getLogger(__name__)
+
+# Настройки нового индекса на время загрузки: без обновления поиска и реплик
+BULK_LOAD_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+}
+
+
+def next_index_name(client: Elasticsearch, alias: str) -> str:
+    """Возвращает имя следующей версии индекса алиаса"""
+    prefix = f"{alias}_v"
+    versions = [
+        int(name[len(prefix) :]) for name in client.indices.get(index=prefix + "*") if name[len(prefix) :].isdigit()
+    ]
+    return versioned_index_name(alias, max(versions, default=0) + 1)
+
+
+def live_indices(client: Elasticsearch, alias: str) -> dict[str, Any]:
+    """Возвращает настройки индексов, которые сейчас обслуживают алиас (или одноимённого индекса)"""
+    if not client.indices.exists(index=alias):
+        return {}
+    return client.indices.get_settings(index=alias)
+
+
+def swap_alias(client: Elasticsearch, alias: str, new_index: str, old_indices: list[str]) -> None:
+    """Одной операцией переключает алиас на новый индекс.
+
+    Индекс старой схемы, названный так же, как алиас, удаляется в той же операции.
+    """
+    actions: list[dict[str, Any]] = [{"add": {"index": new_index, "alias": alias}}]
+    for index in old_indices:
+        if index == alias:
+            actions.append({"remove_index": {"index": index}})
+        else:
+            actions.append({"remove": {"index": index, "alias": alias}})
+    client.indices.update_aliases(actions=actions)
+    logger.info(f"alias {alias} switched to {new_index}")
+
+
+def load_index(conveyors: list[PostgresToElasticsearch], started: str) -> None:
+    """Полностью загружает новый индекс.
+
+    Каскадные конвейеры начинают с момента старта загрузки: более ранние изменения
+    связанных таблиц уже попадут в индекс при полной переиндексации.
+    """
+    for conveyor in conveyors:
+        if isinstance(conveyor, CascadeETL):
+            conveyor.cursor = (started, MIN_ID)
+    for conveyor in conveyors:
+        conveyor.full_reindex = True
+        conveyor.etl()
+        conveyor.postgres.rollback()
+
+
+def catch_up(conveyors: list[PostgresToElasticsearch]) -> None:
+    """Догружает изменения, сделанные во время загрузки нового индекса"""
+    for conveyor in conveyors:
+        conveyor.full_reindex = False
+        conveyor.etl()
+        conveyor.postgres.rollback()
+
+
+def rebuild_index(client: Elasticsearch, redis: Redis, conveyor_params: dict[str, Any], alias: str) -> None:
+    """Пересоздаёт индекс алиаса без простоя.
+
+    Новая версия индекса загружается конвейерами с отдельным состоянием, пока поиск
+    продолжает работать со старой. Затем под блокировкой индекса догружаются последние
+    изменения и алиас атомарно переключается на новый индекс.
+    """
+    new_index = next_index_name(client, alias)
+    old_settings = live_indices(client, alias)
+    replicas = next(
+        (index["settings"]["index"]["number_of_replicas"] for index in old_settings.values()),
+        1,
+    )
+    state_key = f"rebuild_{new_index}"
+    state = State(RedisHashStorage(redis, state_key))
+    conveyors = [
+        etl_class(**conveyor_params, state=state, index_name=new_index)  # type: ignore
+        for etl_class in CONVEYORS
+        if etl_class.index_name == alias
+    ]
+
+    client.indices.create(index=new_index, settings=INDEX_SETTINGS | BULK_LOAD_SETTINGS, mappings=INDICES[alias])
+    logger.info(f"rebuilding {alias} into {new_index}")
+    swapped = False
+    try:
+        with conveyor_params["postgres"].cursor() as cur:
+            cur.execute("SELECT now();")
+            started = cur.fetchone()[0].isoformat()
+        load_index(conveyors, started)
+        client.options(request_timeout=60 * 60).indices.forcemerge(index=new_index, max_num_segments=1)
+
+        # Пока держим блокировку индекса, инкрементальный ETL не пишет в старый индекс изменения,
+        # которые не попали бы в новый
+        with redis.lock(lock_name(alias), timeout=60 * 10, blocking_timeout=60 * 10):
+            catch_up(conveyors)
+            client.indices.put_settings(
+                index=new_index,
+                settings={"refresh_interval": INDEX_SETTINGS["refresh_interval"], "number_of_replicas": replicas},
+            )
+            client.indices.refresh(index=new_index)
+            swap_alias(client, alias, new_index, list(old_settings))
+            swapped = True
+            # Документы, которые не удалось загрузить в новый индекс, повторно загрузит инкрементальный ETL
+            live_state = State(RedisHashStorage(redis, legacy_data_key=RedisStorage.data_key))
+            for conveyor in conveyors:
+                type(conveyor)(**conveyor_params, state=live_state).add_retries(conveyor.retry_ids())
+    except BaseException:
+        if not swapped:
+            logger.exception(f"rebuild of {alias} failed, {new_index} removed")
+            client.indices.delete(index=new_index)
+        raise
+    finally:
+        redis.delete(state_key)
+
+    # Хэши относились к документам прежнего индекса
+    ContentHashes(redis).clear(alias)
+    CacheInvalidations(redis, settings.cache_invalidation_channel).publish(alias)
+    old_indices = [index for index in old_settings if index != alias]
+    if old_indices:
+        client.indices.delete(index=",".join(old_indices))
+        logger.info(f"removed old indices {old_indices}")
+
+
+def rebuild_indices(
+    postgres_dsn: dict[str, Any],
+    redis_dsn: dict[str, Any],
+    elastic_host: dict[str, Any],
+    batch_size: int,
+    aliases: list[str],
+    **conveyor_options: Any,
+) -> None:
+    """Пересоздаёт индексы указанных алиасов по очереди"""
+    redis = Redis(**redis_dsn)
+    client = Elasticsearch([elastic_host], request_timeout=20)
+
+    with closing(psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor)) as pg_conn:
+        conveyor_params = {
+            "postgres": pg_conn,
+            "elasticsearch": client,
+            "batch_size": batch_size,
+            **conveyor_options,
+        }
+        for alias in aliases:
+            rebuild_index(client, redis, conveyor_params, alias)
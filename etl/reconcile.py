@@ -0,0 +1,128 @@
+import logging
+from collections.abc import Generator, Iterator
+from contextlib import closing
+from typing import Any
+
+import psycopg2
+from config import settings
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
+from etl import lock_name
+from psycopg2._psycopg import connection
+from redis import Redis
+from state import CacheInvalidations, ContentHashes
+
+logger = logging.getLogger(__name__)
+
+# Индексы и таблицы, документы которых соответствуют строкам один к одному
+INDEX_TABLES = {
+    "movies": "film_work",
+    "genres": "genre",
+    "persons": "person",
+}
+
+# uuid в Postgres сортируются побайтно, как и их строковое представление в keyword-поле id
+SQL_SOURCE_IDS = "SELECT id::text FROM content.{table} ORDER BY id;"
+
+# Сколько id недостающих в индексе документов выводится в лог
+MISSING_SAMPLE_SIZE = 10
+
+
+def source_ids(postgres: connection, table: str, batch_size: int) -> Generator[str, None, None]:
+    """Возвращает отсортированные id строк таблицы, читая их серверным курсором"""
+    with postgres.cursor(name=f"reconcile_{table}") as cur:
+        cur.itersize = batch_size
+        cur.execute(SQL_SOURCE_IDS.format(table=table))
+        for (item_id,) in cur:
+            yield item_id
+
+
+def index_ids(elasticsearch: Elasticsearch, index_name: str, batch_size: int) -> Generator[str, None, None]:
+    """Возвращает отсортированные id документов индекса постранично через search_after"""
+    search_after = None
+    while True:
+        hits = elasticsearch.search(
+            index=index_name,
+            size=batch_size,
+            source=False,
+            sort=[{"id": "asc"}],
+            search_after=search_after,
+        )["hits"]["hits"]
+        if not hits:
+            return
+        for hit in hits:
+            yield hit["_id"]
+        search_after = hits[-1]["sort"]
+
+
+def sorted_difference(left: Iterator[str], right: Iterator[str]) -> Generator[tuple[str, bool], None, None]:
+    """Сравнивает два отсортированных потока id и возвращает id, которые есть только в одном из них.
+
+    Второй элемент пары - True, если id есть только в left.
+    """
+    left_id, right_id = next(left, None), next(right, None)
+    while left_id is not None or right_id is not None:
+        if right_id is None or (left_id is not None and left_id < right_id):
+            yield left_id, True  # type: ignore[misc]
+            left_id = next(left, None)
+        elif left_id is None or right_id < left_id:
+            yield right_id, False
+            right_id = next(right, None)
+        else:
+            left_id, right_id = next(left, None), next(right, None)
+
+
+def reconcile_index(
+    postgres: connection,
+    elasticsearch: Elasticsearch,
+    content_hashes: ContentHashes,
+    cache_invalidations: CacheInvalidations,
+    index_name: str,
+    batch_size: int,
+) -> None:
+    """Удаляет из индекса документы, которых нет в Postgres, и сообщает о недостающих документах"""
+    missing: list[str] = []
+    orphans: list[str] = []
+    for item_id, in_source in sorted_difference(
+        source_ids(postgres, INDEX_TABLES[index_name], batch_size),
+        index_ids(elasticsearch, index_name, batch_size),
+    ):
+        if not in_source:
+            orphans.append(item_id)
+        elif len(missing) < MISSING_SAMPLE_SIZE:
+            missing.append(item_id)
+    postgres.rollback()
+
+    if missing:
+        logger.warning(f"rows are missing in {index_name}, e.g. {missing}")
+
+    actions = ({"_op_type": "delete", "_index": index_name, "_id": item_id} for item_id in orphans)
+    for ok, info in streaming_bulk(elasticsearch, actions, chunk_size=batch_size, raise_on_error=False):
+        if not ok and info["delete"]["status"] != 404:
+            logger.error(f"unable to delete {index_name} id {info['delete']['_id']}: {info['delete']}")
+    content_hashes.forget(index_name, orphans)
+    if orphans:
+        cache_invalidations.publish(index_name, orphans)
+    logger.info(f"{index_name} reconciled: {len(orphans)} orphan documents deleted")
+
+
+def reconcile_indices(
+    postgres_dsn: dict[str, Any],
+    redis_dsn: dict[str, Any],
+    elastic_host: dict[str, Any],
+    batch_size: int,
+) -> None:
+    """Сверяет id документов индексов с id строк Postgres.
+
+    Сверка выполняется под блокировкой индекса, чтобы ETL не загрузил документ, строки которого
+    ещё не было в прочитанном снимке таблицы.
+    """
+    redis = Redis(**redis_dsn)
+    elasticsearch = Elasticsearch([elastic_host], request_timeout=60)
+    content_hashes = ContentHashes(redis)
+    cache_invalidations = CacheInvalidations(redis, settings.cache_invalidation_channel)
+
+    with closing(psycopg2.connect(**postgres_dsn)) as postgres:
+        for index_name in INDEX_TABLES:
+            with redis.lock(lock_name(index_name), timeout=60 * 30, blocking_timeout=60 * 10):
+                reconcile_index(postgres, elasticsearch, content_hashes, cache_invalidations, index_name, batch_size)
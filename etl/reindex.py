@@ -0,0 +1,156 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from contextlib import ExitStack, closing
+from typing import Any
+
+import psycopg2
+from config import settings
+from conveyors.base import Cursor, PostgresToElasticsearch
+from conveyors.cascade import CascadeETL
+from elasticsearch import Elasticsearch
+from etl import CONVEYORS, lock_name
+from psycopg2.extras import DictCursor
+from redis import Redis
+from redis.lock import Lock
+from state import CacheInvalidations, ContentHashes, RedisHashStorage, RedisStorage, State
+
+logger = logging.getLogger(__name__)
+
+# uuid сравниваются побайтно, поэтому диапазоны строятся по старшим 32 битам
+UUID_PREFIX_SPACE = 16**8
+
+# Время, на которое переиндексация блокирует инкрементальную загрузку индексов, сек.
+REINDEX_LOCK_TIMEOUT = 60 * 60 * 6
+# Как часто блокировки продлеваются на REINDEX_LOCK_TIMEOUT, пока диапазоны загружаются, сек.
+REINDEX_LOCK_EXTEND_INTERVAL = 60 * 10
+
+
+def id_ranges(count: int) -> list[tuple[str, str]]:
+    """Делит пространство uuid на count диапазонов одинакового размера"""
+    step = UUID_PREFIX_SPACE // count
+    bounds = [i * step for i in range(count)] + [UUID_PREFIX_SPACE]
+    return [
+        (f"{start:08x}-0000-0000-0000-000000000000", f"{end - 1:08x}-ffff-ffff-ffff-ffffffffffff")
+        for start, end in zip(bounds, bounds[1:])
+    ]
+
+
+def checkpoint_key(etl_class: type[PostgresToElasticsearch], id_range: tuple[str, str]) -> str:
+    """Ключ состояния, в котором хранится позиция переиндексации диапазона"""
+    return f"reindex__{etl_class.index_name}__{etl_class.source_table}__{id_range[0]}"
+
+
+def reindex_range(
+    postgres_dsn: dict[str, Any],
+    redis_dsn: dict[str, Any],
+    elastic_host: dict[str, Any],
+    etl_class: type[PostgresToElasticsearch],
+    id_range: tuple[str, str],
+    conveyor_options: dict[str, Any],
+) -> Cursor | None:
+    """Переиндексирует диапазон id в отдельном процессе и возвращает последнюю загруженную позицию"""
+    redis = Redis(**redis_dsn)
+    state = State(RedisHashStorage(redis, checkpoint_key(etl_class, id_range)))
+    with closing(psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor)) as pg_conn:
+        conveyor = etl_class(  # type: ignore
+            postgres=pg_conn,
+            elasticsearch=Elasticsearch([elastic_host], request_timeout=20),
+            state=state,
+            content_hashes=ContentHashes(redis),
+            **conveyor_options | {"full_reindex": True, "id_range": id_range},
+        )
+        conveyor.etl()
+        cursor = state.get_state(conveyor.state_key)
+    return tuple(cursor) if cursor else None  # type: ignore[return-value]
+
+
+def finish_reindex(
+    redis: Redis,
+    etl_class: type[PostgresToElasticsearch],
+    futures: dict[tuple[str, str], Future],
+    conveyor_params: dict[str, Any],
+) -> bool:
+    """Переносит позиции диапазонов в водяной знак конвейера, если все диапазоны загружены.
+
+    Водяным знаком становится наименьшая из позиций: строки, изменённые после окончания
+    чтения своего диапазона, будут перечитаны инкрементальным ETL.
+    """
+    failed = {id_range: future.exception() for id_range, future in futures.items() if future.exception()}
+    for id_range, error in failed.items():
+        logger.error(f"{etl_class.__name__} range {id_range} failed: {error!r}")
+    if failed:
+        # Контрольные точки остаются, следующий запуск продолжит незавершённые диапазоны
+        return False
+
+    conveyor = etl_class(**conveyor_params)  # type: ignore
+    if cursors := [cursor for future in futures.values() if (cursor := future.result())]:
+        conveyor.cursor = min(cursors)
+    # Документы, которые не удалось загрузить в диапазонах, повторно загрузит инкрементальный ETL
+    for id_range in futures:
+        checkpoint = State(RedisHashStorage(redis, checkpoint_key(etl_class, id_range)))
+        conveyor.add_retries(checkpoint.get_state(conveyor.retry_key) or [])
+    redis.delete(*(checkpoint_key(etl_class, id_range) for id_range in futures))
+    logger.info(f"{etl_class.__name__} reindexed in {len(futures)} ranges")
+    return True
+
+
+def wait_extending_locks(futures: list[Future], locks: list[Lock]) -> None:
+    """Ждёт завершения загрузки диапазонов, продлевая блокировки индексов, чтобы они не истекли посреди неё"""
+    while wait(futures, timeout=REINDEX_LOCK_EXTEND_INTERVAL).not_done:
+        for lock in locks:
+            lock.extend(REINDEX_LOCK_TIMEOUT, replace_ttl=True)
+
+
+def parallel_reindex(
+    postgres_dsn: dict[str, Any],
+    redis_dsn: dict[str, Any],
+    elastic_host: dict[str, Any],
+    batch_size: int,
+    workers: int,
+    ranges: int,
+    restart: bool = False,
+    **conveyor_options: Any,
+) -> bool:
+    """Полностью переиндексирует таблицы, разбив их на диапазоны id, которые загружаются в workers процессах.
+
+    Каскадные конвейеры не запускаются: индексы заново строятся по своим таблицам.
+    Возвращает False, если какие-то диапазоны не загружены; их можно догрузить повторным запуском.
+    """
+    redis = Redis(**redis_dsn)
+    conveyors = [etl_class for etl_class in CONVEYORS if not issubclass(etl_class, CascadeETL)]
+    if restart:
+        redis.delete(
+            *(checkpoint_key(etl_class, id_range) for etl_class in conveyors for id_range in id_ranges(ranges))
+        )
+
+    conveyor_options = conveyor_options | {"batch_size": batch_size}
+    with ExitStack() as stack:
+        # Инкрементальный ETL не должен перезаписывать загружаемые индексы до окончания переиндексации
+        locks = [
+            stack.enter_context(
+                redis.lock(lock_name(index_name), timeout=REINDEX_LOCK_TIMEOUT, blocking_timeout=60 * 10)
+            )
+            for index_name in {etl_class.index_name for etl_class in conveyors}
+        ]
+        pg_conn = stack.enter_context(closing(psycopg2.connect(**postgres_dsn, cursor_factory=DictCursor)))
+        conveyor_params = {
+            "postgres": pg_conn,
+            "elasticsearch": Elasticsearch([elastic_host], request_timeout=20),
+            "state": State(RedisHashStorage(redis, legacy_data_key=RedisStorage.data_key)),
+            **conveyor_options,
+        }
+        with ProcessPoolExecutor(workers) as executor:
+            futures: dict[type[PostgresToElasticsearch], dict[tuple[str, str], Future]] = defaultdict(dict)
+            for etl_class in conveyors:
+                for id_range in id_ranges(ranges):
+                    futures[etl_class][id_range] = executor.submit(
+                        reindex_range, postgres_dsn, redis_dsn, elastic_host, etl_class, id_range, conveyor_options
+                    )
+            wait_extending_locks([future for by_range in futures.values() for future in by_range.values()], locks)
+            finished = [
+                finish_reindex(redis, etl_class, futures[etl_class], conveyor_params) for etl_class in conveyors
+            ]
+    for index_name in {etl_class.index_name for etl_class in conveyors}:
+        CacheInvalidations(redis, settings.cache_invalidation_channel).publish(index_name)
+    return all(finished)
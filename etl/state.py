@@ -1,36 +1,53 @@
+import hashlib
 import json
+import logging
 from abc import ABCMeta, abstractmethod
 from typing import TYPE_CHECKING, Any
 
+from redis.exceptions import RedisError
+
 if TYPE_CHECKING:
     from redis import Redis
+    from redis.client import Pipeline
+
+logger = logging.getLogger(__name__)
 
 
 class StateStorage(metaclass=ABCMeta):
     @abstractmethod
-    def save_state(self, state: dict[str, Any]) -> None:
-        pass
+    def save_state(self, state: dict[str, Any], counters: dict[str, int] | None = None) -> None:
+        """Сохраняет значения и одновременно увеличивает счётчики"""
 
     @abstractmethod
     def retrieve_state(self) -> dict[str, Any]:
         pass
 
+    def retrieve_value(self, key: str) -> Any | None:
+        return self.retrieve_state().get(key)
+
+    def reset(self) -> None:
+        """Сбрасывает локальный кэш значений, которые могли изменить другие процессы"""
+
+
+def add_counters(state: dict[str, Any], counters: dict[str, int] | None) -> dict[str, Any]:
+    return {key: state.get(key, 0) + value for key, value in (counters or {}).items()}
+
 
 class JsonStorage(StateStorage):
     def __init__(self, file_path: str, *args, **kwargs) -> None:
         self.file_path = file_path
         super().__init__(*args, **kwargs)
 
-    def save_state(self, state: dict[str, Any]) -> None:
+    def save_state(self, state: dict[str, Any], counters: dict[str, int] | None = None) -> None:
         try:
             with open(self.file_path, "r+") as file:
                 file_content: dict[str, Any] = json.load(file)
                 file.seek(0)
-                json.dump(file_content | state, file)
+                json.dump(file_content | state | add_counters(file_content, counters), file)
                 file.truncate()
         except (FileNotFoundError, json.JSONDecodeError):
             with open(self.file_path, "w") as file:
-                json.dump(state, file)
+                json.dump(state | add_counters({}, counters), file)
                 file.truncate()
 
     def retrieve_state(self) -> dict[str, Any]:
@@ -42,22 +59,88 @@ class JsonStorage(StateStorage):
 
 
 class RedisStorage(StateStorage):
-    def __init__(self, redis: "Redis", *args, **kwargs) -> None:
+    data_key = "state_data"
+
+    def __init__(self, redis: "Redis", data_key: str | None = None, *args, **kwargs) -> None:
         self.redis = redis
+        if data_key:
+            self.data_key = data_key
         super().__init__(*args, **kwargs)
 
-    data_key = "state_data"
+    def save_state(self, state: dict[str, Any], counters: dict[str, int] | None = None) -> None:
+        def update(pipe: "Pipeline") -> None:
+            json_data = pipe.get(self.data_key) or "{}"  # noqa: P103
+            data = json.loads(json_data)
+            updated_data = data | state | add_counters(data, counters)
+            pipe.multi()
+            pipe.set(self.data_key, json.dumps(updated_data))
 
-    def save_state(self, state: dict[str, Any]) -> None:
-        json_data = self.redis.get(self.data_key) or "{}"  # noqa: P103
-        data = json.loads(json_data)
-        updated_data = data | state
-        self.redis.set(self.data_key, json.dumps(updated_data))
+        # Конвейеры разных индексов сохраняют состояние одновременно: WATCH повторяет
+        # слияние, если ключ изменился между чтением и записью
+        self.redis.transaction(update, self.data_key)
 
     def retrieve_state(self) -> dict[str, Any]:
         return json.loads(self.redis.get(self.data_key) or "{}")  # noqa: P103
 
 
+class RedisHashStorage(StateStorage):
+    """Хранит каждое значение состояния отдельным полем hash в Redis.
+
+    Значения читаются и записываются по одному полю без разбора всего состояния,
+    а прочитанные и записанные значения кэшируются в памяти процесса.
+    """
+
+    data_key = "etl_state"
+
+    def __init__(
+        self,
+        redis: "Redis",
+        data_key: str | None = None,
+        legacy_data_key: str | None = None,
+        *args,
+        **kwargs,
+    ) -> None:
+        self.redis = redis
+        if data_key:
+            self.data_key = data_key
+        self.cache: dict[str, Any] = {}
+        super().__init__(*args, **kwargs)
+        if legacy_data_key:
+            self.migrate(legacy_data_key)
+
+    def migrate(self, legacy_data_key: str) -> None:
+        """Переносит значения из состояния, хранившегося одним JSON (RedisStorage), не перезаписывая новые"""
+        if self.redis.exists(self.data_key) or not (json_data := self.redis.get(legacy_data_key)):
+            return
+        with self.redis.pipeline() as pipe:
+            for key, value in json.loads(json_data).items():
+                pipe.hsetnx(self.data_key, key, json.dumps(value))
+            pipe.execute()
+
+    def save_state(self, state: dict[str, Any], counters: dict[str, int] | None = None) -> None:
+        with self.redis.pipeline() as pipe:
+            if state:
+                pipe.hset(self.data_key, mapping={key: json.dumps(value) for key, value in state.items()})
+            for key, value in (counters or {}).items():
+                pipe.hincrby(self.data_key, key, value)
+            results = pipe.execute()
+
+        self.cache.update(state)
+        self.cache.update(zip(counters or {}, results[bool(state) :]))
+
+    def retrieve_state(self) -> dict[str, Any]:
+        return {key.decode(): json.loads(value) for key, value in self.redis.hgetall(self.data_key).items()}
+
+    def retrieve_value(self, key: str) -> Any | None:
+        if key not in self.cache:
+            value = self.redis.hget(self.data_key, key)
+            self.cache[key] = json.loads(value) if value is not None else None
+        return self.cache[key]
+
+    def reset(self) -> None:
+        self.cache.clear()
+
+
 class State:
     def __init__(self, storage: StateStorage) -> None:
         self.storage = storage
@@ -66,6 +149,74 @@ class State:
     def set_state(self, key: str, value: Any) -> None:
         self.storage.save_state({key: value})
 
+    def commit(self, values: dict[str, Any], counters: dict[str, int]) -> None:
+        """Сохраняет значения и увеличивает счётчики одной транзакцией"""
+        self.storage.save_state(values, counters)
+
     def get_state(self, key: str) -> Any | None:
-        state_dict = self.storage.retrieve_state()
-        return state_dict.get(key)
+        return self.storage.retrieve_value(key)
+
+    def reset(self) -> None:
+        self.storage.reset()
+
+
+class ContentHashes:
+    """Хэши содержимого документов, загруженных в индексы, по их id"""
+
+    def __init__(self, redis: "Redis") -> None:
+        self.redis = redis
+
+    @staticmethod
+    def key(index_name: str) -> str:
+        return f"etl_hashes__{index_name}"
+
+    @staticmethod
+    def digest(document: Any) -> bytes:
+        if not isinstance(document, bytes):
+            document = json.dumps(document, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(document, digest_size=16).digest()
+
+    def unchanged(self, index_name: str, hashes: dict[str, bytes]) -> set[str]:
+        """Возвращает id документов, хэш которых совпадает с сохранённым"""
+        if not hashes:
+            return set()
+        stored = self.redis.hmget(self.key(index_name), list(hashes))
+        return {item_id for (item_id, digest), saved in zip(hashes.items(), stored) if saved == digest}
+
+    def save(self, index_name: str, hashes: dict[str, bytes]) -> None:
+        if hashes:
+            self.redis.hset(self.key(index_name), mapping=hashes)  # type: ignore[arg-type]
+
+    def forget(self, index_name: str, item_ids: list[str]) -> None:
+        if item_ids:
+            self.redis.hdel(self.key(index_name), *item_ids)
+
+    def clear(self, index_name: str) -> None:
+        self.redis.delete(self.key(index_name))
+
+
+class CacheInvalidations:
+    """Сообщения API об изменившихся документах индексов, чтобы оно сбросило их кэш.
+
+    Каждое сообщение увеличивает поколение индекса: закэшированные списки и результаты поиска
+    прежних поколений API больше не читает, а документы с перечисленными id удаляет из кэша точно.
+    Без списка id сообщение означает, что мог измениться любой документ индекса.
+    """
+
+    def __init__(self, redis: "Redis", channel: str) -> None:
+        self.redis = redis
+        self.channel = channel
+
+    @staticmethod
+    def key(index_name: str) -> str:
+        return f"etl_cache_generation__{index_name}"
+
+    def publish(self, index_name: str, item_ids: list[str] | None = None) -> None:
+        # Документы уже загружены, поэтому недоступность Redis не должна прерывать загрузку:
+        # кэш устареет не дольше, чем на время его жизни
+        try:
+            generation = self.redis.incr(self.key(index_name))
+            message = {"index": index_name, "ids": item_ids, "generation": generation}
+            self.redis.publish(self.channel, json.dumps(message))
+        except RedisError as e:
+            logger.warning(f"unable to publish cache invalidation of {index_name}: {e!r}")
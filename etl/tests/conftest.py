@@ -0,0 +1,4 @@
+import os
+
+# Настройки ETL читаются при импорте модулей, а Postgres в тестах не нужен
+os.environ.setdefault("POSTGRES_PASSWORD", "tests")
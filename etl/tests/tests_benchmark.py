@@ -0,0 +1,43 @@
+from collections.abc import Generator
+from typing import Any
+
+from benchmark import RecordingElasticsearch, measure
+from conveyors.base import Batch, PostgresToElasticsearch
+from state import JsonStorage, State
+
+
+class InMemoryETL(PostgresToElasticsearch):
+    """Конвейер, который читает строки из памяти вместо Postgres"""
+
+    index_name: str = "genres"
+    source_table: str = "genre"
+    extract_query: str = ""
+    rows: list[dict[str, Any]] = [
+        {"id": f"00000000-0000-0000-0000-00000000000{i}", "name": f"genre {i}", "modified": f"2024-01-0{i}"}
+        for i in range(1, 6)
+    ]
+
+    def extract(self) -> Generator[Batch, None, None]:
+        for start in range(0, len(self.rows), self.batch_size):
+            items = self.rows[start : start + self.batch_size]
+            yield Batch(items, (items[-1]["modified"], items[-1]["id"]))
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["id"], "name": item["name"]}
+
+
+def test_measure(tmp_path):
+    elasticsearch = RecordingElasticsearch()
+    state = State(JsonStorage(str(tmp_path / "state.json")))
+    conveyor = InMemoryETL(postgres=None, elasticsearch=elasticsearch, state=state, batch_size=2, bulk_chunk_size=2)
+
+    stages = measure(conveyor)
+
+    assert list(stages) == ["extract", "enrich", "transform", "load"]
+    assert all(rows == len(InMemoryETL.rows) for rows, _ in stages.values())
+    assert all(seconds >= 0 for _, seconds in stages.values())
+    # Пять документов батчами по два загружаются тремя bulk-запросами
+    assert elasticsearch.requests == 3
+    assert elasticsearch.bytes > 0
+    assert state.get_state(conveyor.state_key) == ["2024-01-05", "00000000-0000-0000-0000-000000000005"]
@@ -0,0 +1,27 @@
+from create_indices import INDEX_MAPPINGS_MOVIES, get_or_create_index
+
+
+class RecordingIndices:
+    """Клиент индексов, у которого индекс уже существует"""
+
+    def __init__(self) -> None:
+        self.mappings: list[dict] = []
+
+    def get(self, index: str) -> dict:
+        return {index: {}}
+
+    def put_mapping(self, **params) -> None:
+        self.mappings.append(params)
+
+
+class RecordingElasticsearch:
+    def __init__(self) -> None:
+        self.indices = RecordingIndices()
+
+
+def test_existing_index_gets_new_fields():
+    client = RecordingElasticsearch()
+
+    assert get_or_create_index(client, "movies", INDEX_MAPPINGS_MOVIES) == {"movies": {}}
+    assert client.indices.mappings == [{"index": "movies", "properties": INDEX_MAPPINGS_MOVIES["properties"]}]
+    assert "title_suggest" in client.indices.mappings[0]["properties"]
@@ -0,0 +1,81 @@
+import datetime as dt
+
+import pytest
+
+import orjson
+from conveyors.base import MIN_ID
+from conveyors.deletions import MoviesDeletionsETL
+from conveyors.movies import MoviesGenresETL, MoviesPersonsETL, MoviesSubscriptionsETL
+from elastic_transport import SerializerCollection
+from elasticsearch.serializer import DEFAULT_SERIALIZERS
+from etl import index_conveyors
+from state import JsonStorage, State
+
+
+class BulkElasticsearch:
+    """Заглушка Elasticsearch, которая отвечает на удаление документов заданными статусами"""
+
+    class Response:
+        def __init__(self, body: dict) -> None:
+            self.body = body
+
+    def __init__(self, statuses: dict[str, int]) -> None:
+        self.transport = self
+        self.serializers = SerializerCollection(DEFAULT_SERIALIZERS)
+        self.statuses = statuses
+
+    def options(self, **kwargs) -> "BulkElasticsearch":
+        return self
+
+    def bulk(self, operations: list[bytes], **kwargs) -> Response:
+        items = []
+        for line in operations:
+            item_id = orjson.loads(line)["delete"]["_id"]
+            status = self.statuses[item_id]
+            items.append({"delete": {"_index": "movies", "_id": item_id, "status": status}})
+        return self.Response({"errors": any(item["delete"]["status"] >= 300 for item in items), "items": items})
+
+
+@pytest.fixture()
+def deletions_etl():
+    def _make(statuses: dict[str, int]) -> MoviesDeletionsETL:
+        return MoviesDeletionsETL(
+            postgres=None,
+            elasticsearch=BulkElasticsearch(statuses),
+            state=None,
+            batch_size=10,
+        )
+
+    return _make
+
+
+def test_deletions_actions(deletions_etl):
+    conveyor = deletions_etl({})
+
+    items = [conveyor.transform_item({"id": "tombstone", "object_id": "film", "modified": None})]
+
+    assert conveyor.make_actions(items) == [{"_op_type": "delete", "_index": "movies", "_id": "film"}]
+
+
+def test_deletions_ignore_missing_documents(deletions_etl):
+    conveyor = deletions_etl({"deleted": 200, "missing": 404, "failed": 500})
+    actions = conveyor.make_actions([{"id": item_id} for item_id in ("deleted", "missing", "failed")])
+
+    errors = conveyor.bulk_chunk(actions)
+
+    assert [error["delete"]["_id"] for error in errors] == ["failed"]
+
+
+def test_deletions_first_run_starts_from_beginning(tmp_path):
+    state = State(JsonStorage(str(tmp_path / "state.json")))
+    # Водяной знак конвейера фильмов в старом формате не относится к удалениям
+    state.set_state("movies__modified", "2024-01-01T00:00:00")
+    conveyor = MoviesDeletionsETL(postgres=None, elasticsearch=None, state=state, batch_size=10)
+
+    assert conveyor.cursor == (dt.datetime.min.isoformat(), MIN_ID)
+
+
+def test_link_deletions_update_movies():
+    conveyors = index_conveyors({"deleted_objects"})
+
+    assert {MoviesGenresETL, MoviesPersonsETL, MoviesSubscriptionsETL, MoviesDeletionsETL} <= set(conveyors["movies"])
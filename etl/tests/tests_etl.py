@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+import etl
+from etl import extending, run_conveyors
+from redis.exceptions import LockError, LockNotOwnedError
+
+
+class FakeLock:
+    """Блокировка, которая считает продления и не может быть освобождена, если истекла"""
+
+    def __init__(self, acquired: bool = True, expired: bool = False) -> None:
+        self.name = "etl_data__genres"
+        self.acquired = acquired
+        self.expired = expired
+        self.extended = threading.Event()
+
+    def __enter__(self) -> "FakeLock":
+        if not self.acquired:
+            raise LockError("Unable to acquire lock")
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.expired:
+            raise LockNotOwnedError("Cannot release a lock that's no longer owned")
+
+    def extend(self, additional_time: int, replace_ttl: bool = False) -> bool:
+        self.extended.set()
+        return True
+
+
+class FakeRedis:
+    def __init__(self, lock: FakeLock) -> None:
+        self.lock_params: dict = {}
+        self._lock = lock
+
+    def lock(self, name: str, **params) -> FakeLock:
+        self.lock_params = params
+        return self._lock
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.rolled_back = False
+
+    def rollback(self) -> None:
+        self.rolled_back = True
+
+
+class FakeState:
+    def __init__(self) -> None:
+        self.resets = 0
+
+    def reset(self) -> None:
+        self.resets += 1
+
+
+class RecordingETL:
+    index_name = "genres"
+    runs = 0
+
+    def __init__(self, **params) -> None:
+        pass
+
+    def etl(self) -> None:
+        RecordingETL.runs += 1
+
+
+@pytest.fixture()
+def conveyor_params():
+    RecordingETL.runs = 0
+    return {"postgres": FakeConnection(), "state": FakeState()}
+
+
+def test_extending_extends_lock_while_running(monkeypatch):
+    monkeypatch.setattr(etl, "LOCK_EXTEND_INTERVAL", 0.01)
+    lock = FakeLock()
+
+    with extending(lock):
+        assert lock.extended.wait(1)
+
+
+def test_run_conveyors(conveyor_params):
+    redis = FakeRedis(FakeLock())
+
+    run_conveyors(redis, conveyor_params, [RecordingETL])
+
+    assert RecordingETL.runs == 1
+    assert conveyor_params["state"].resets == 1
+    assert conveyor_params["postgres"].rolled_back
+    # Блокировку продлевает другой поток
+    assert redis.lock_params["thread_local"] is False
+
+
+@pytest.mark.parametrize(
+    argnames=("lock", "runs", "message"),
+    argvalues=[
+        (FakeLock(acquired=False), 0, 'Unable to acquire lock "etl_data__genres"'),
+        (FakeLock(expired=True), 1, 'Lock "etl_data__genres" expired during run'),
+    ],
+)
+def test_run_conveyors_lock_errors(caplog, conveyor_params, lock, runs, message):
+    run_conveyors(FakeRedis(lock), conveyor_params, [RecordingETL])
+
+    assert RecordingETL.runs == runs
+    assert conveyor_params["postgres"].rolled_back
+    assert caplog.messages == [message]
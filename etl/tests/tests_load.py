@@ -0,0 +1,134 @@
+from typing import Any
+
+import pytest
+
+import orjson
+from conveyors.base import Batch, PostgresToElasticsearch
+from elastic_transport import SerializerCollection
+from elasticsearch.serializer import DEFAULT_SERIALIZERS
+from state import JsonStorage, State
+
+
+class BulkElasticsearch:
+    """Заглушка Elasticsearch, которая отвечает на bulk-действия с документами заданными ошибками"""
+
+    class Response:
+        def __init__(self, body: dict) -> None:
+            self.body = body
+
+    def __init__(self, errors: dict[str, tuple[int, str]]) -> None:
+        self.transport = self
+        self.serializers = SerializerCollection(DEFAULT_SERIALIZERS)
+        self.errors = errors
+        self.loaded: list[str] = []
+
+    def options(self, **kwargs) -> "BulkElasticsearch":
+        return self
+
+    def bulk(self, operations: list[bytes], **kwargs) -> Response:
+        items = []
+        self.loaded = []
+        lines = iter(operations)
+        for line in lines:
+            op_type, action = next(iter(orjson.loads(line).items()))
+            if op_type != "delete":
+                next(lines)
+            item = {"_index": action["_index"], "_id": action["_id"], "status": 200}
+            if action["_id"] in self.errors:
+                status, error_type = self.errors[action["_id"]]
+                item |= {"status": status, "error": {"type": error_type, "reason": error_type}}
+            else:
+                self.loaded.append(action["_id"])
+            items.append({op_type: item})
+        return self.Response({"errors": len(self.loaded) < len(items), "items": items})
+
+
+class Cursor:
+    def __init__(self, postgres: "Postgres") -> None:
+        self.postgres = postgres
+
+    def __enter__(self) -> "Cursor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def execute(self, query: str, params: Any) -> None:
+        self.postgres.queries.append((query, params))
+
+    def fetchall(self) -> list[dict[str, Any]]:
+        item_ids = self.postgres.queries[-1][1][-1]
+        return [{"id": item_id, "name": item_id} for item_id in item_ids if item_id in self.postgres.rows]
+
+
+class Postgres:
+    """Соединение, которое возвращает строки с запрошенными id из заданных"""
+
+    def __init__(self, rows: set[str]) -> None:
+        self.rows = rows
+        self.queries: list[tuple[str, Any]] = []
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+
+class GenresETL(PostgresToElasticsearch):
+    index_name: str = "genres"
+    source_table: str = "genre"
+    extract_query: str = "SELECT id, name, modified FROM content.genre WHERE (modified, id) > (%s, %s);"
+
+    @staticmethod
+    def transform_item(item: dict[str, Any]) -> dict[str, Any]:
+        return {"id": item["id"], "name": item["name"]}
+
+
+@pytest.fixture()
+def state(tmp_path) -> State:
+    return State(JsonStorage(str(tmp_path / "state.json")))
+
+
+def make_etl(state: State, errors: dict[str, tuple[int, str]], rows: set[str] = frozenset()) -> GenresETL:
+    return GenresETL(
+        postgres=Postgres(set(rows)),
+        elasticsearch=BulkElasticsearch(errors),
+        state=state,
+        batch_size=10,
+        bulk_max_retries=0,
+    )
+
+
+def test_load_records_failed_ids_and_advances_watermark(state):
+    conveyor = make_etl(state, {"b": (400, "mapper_parsing_exception"), "c": (429, "es_rejected_execution_exception")})
+    items = [{"id": item_id, "name": item_id} for item_id in "abcd"]
+
+    conveyor.load(iter([Batch(items, ("2024-01-01", "d"))]))
+
+    assert conveyor.elasticsearch.loaded == ["a", "d"]
+    assert state.get_state(conveyor.state_key) == ["2024-01-01", "d"]
+    assert state.get_state(conveyor.retry_key) == ["b", "c"]
+
+
+def test_load_forgets_reloaded_ids(state):
+    state.set_state("genres__retry", ["b", "c", "gone"])
+    conveyor = make_etl(state, {"c": (400, "mapper_parsing_exception")})
+
+    # Строки "gone" уже нет в Postgres, документ удалит конвейер удалений
+    items = [{"id": item_id, "name": item_id} for item_id in "bc"]
+    conveyor.load(iter([Batch(items, ("2024-01-01", "d"), retried=("b", "c", "gone"))]))
+
+    assert state.get_state(conveyor.retry_key) == ["c"]
+
+
+def test_reload_failed(state):
+    state.set_state("genres__cursor", ["2024-01-01", "d"])
+    state.set_state("genres__retry", ["b", "c", "gone"])
+    conveyor = make_etl(state, {}, rows={"b", "c"})
+
+    conveyor.load(conveyor.transform(conveyor.reload_failed()))
+
+    [(query, params)] = conveyor.postgres.queries
+    assert "src.id = ANY(%s::uuid[])" in query
+    assert params[-1] == ["b", "c", "gone"]
+    assert conveyor.elasticsearch.loaded == ["b", "c"]
+    assert state.get_state(conveyor.state_key) == ["2024-01-01", "d"]
+    assert state.get_state(conveyor.retry_key) == []
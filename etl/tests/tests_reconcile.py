@@ -0,0 +1,18 @@
+import pytest
+
+from reconcile import sorted_difference
+
+
+@pytest.mark.parametrize(
+    argnames=("left", "right", "expected"),
+    argvalues=[
+        ([], [], []),
+        (["a", "b"], [], [("a", True), ("b", True)]),
+        ([], ["a", "b"], [("a", False), ("b", False)]),
+        (["a", "b", "c"], ["a", "b", "c"], []),
+        (["a", "c", "e"], ["b", "c", "d", "f"], [("a", True), ("b", False), ("d", False), ("e", True), ("f", False)]),
+        (["a", "b"], ["c", "d"], [("a", True), ("b", True), ("c", False), ("d", False)]),
+    ],
+)
+def test_sorted_difference(left, right, expected):
+    assert list(sorted_difference(iter(left), iter(right))) == expected
@@ -0,0 +1,28 @@
+import pytest
+
+from conveyors.suggest import SUGGEST_MAX_WORDS, suggest_inputs
+
+
+@pytest.mark.parametrize(
+    argnames=("text", "expected"),
+    argvalues=[
+        (None, []),
+        ("", []),
+        ("   ", []),
+        ("Star", ["Star"]),
+        ("Звёздные  войны ", ["Звёздные войны", "войны"]),
+        ("Star Wars: Episode IV", ["Star Wars: Episode IV", "Wars: Episode IV", "Episode IV", "IV"]),
+    ],
+)
+def test_suggest_inputs(text, expected):
+    assert suggest_inputs(text) == expected
+
+
+def test_suggest_inputs_limits_words():
+    words = [f"word{number}" for number in range(SUGGEST_MAX_WORDS + 5)]
+
+    inputs = suggest_inputs(" ".join(words))
+
+    assert len(inputs) == SUGGEST_MAX_WORDS
+    assert inputs[0] == " ".join(words)
+    assert inputs[-1] == " ".join(words[SUGGEST_MAX_WORDS - 1 :])
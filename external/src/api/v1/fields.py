@@ -3,6 +3,18 @@ from typing import Annotated
 from fastapi import Query
 
 from core.config import settings
+from services.database import FIRST_PAGE_CURSOR
 
 PageNumberQueryType = Annotated[int, Query(description="Pagination page number", ge=1)]
 PageSizeQueryType = Annotated[int, Query(description="Pagination page size", ge=1, le=settings.page_size_max)]
+SuggestSizeQueryType = Annotated[
+    int, Query(description="Number of suggestions of each kind", ge=1, le=settings.suggest_size_max)
+]
+CursorQueryType = Annotated[
+    str | None,
+    Query(
+        description=f"Cursor of the next page from the X-Next-Cursor header of the previous page, "
+        f"or {FIRST_PAGE_CURSOR} to start paging with cursors",
+        pattern=r"^[\w-]+$",
+    ),
+]
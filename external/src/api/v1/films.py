@@ -2,14 +2,22 @@ from http import HTTPStatus
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
-from api.v1.fields import PageNumberQueryType, PageSizeQueryType
-from api.v1.models import FilmDetailExternal, FilmPersonExternal, FilmShortExternal, FilmsSortKeys, GenreExternal
+from api.v1.fields import CursorQueryType, PageNumberQueryType, PageSizeQueryType
+from api.v1.models import (
+    BatchExternal,
+    FilmDetailExternal,
+    FilmPersonExternal,
+    FilmShortExternal,
+    FilmsPageExternal,
+    FilmsSortKeys,
+    GenreExternal,
+)
 from core.auth import JWTTokenPayload, SystemRolesEnum, check_permissions
 from core.config import settings
-from core.types import NestedQuery, RequestData
-from models.film import Film as FilmInternal
+from core.types import NestedQuery, Page, RequestData
+from models.film import Film as FilmInternal, FilmShort
 from services.base import BaseService
 from services.films import get_films_service
 
@@ -18,7 +26,7 @@ router = APIRouter()
 
 @router.get(
     "/search",
-    response_model=list[FilmShortExternal],
+    response_model=list[FilmShortExternal] | FilmsPageExternal,
     summary="Search films",
     description="Full-text search for film works",
     response_description="Movie title and rating",
@@ -30,31 +38,47 @@ async def films_search(
     sort: Annotated[FilmsSortKeys, Query(description="Ordering param")] = None,
     page_number: PageNumberQueryType = 1,
     page_size: PageSizeQueryType = settings.page_size,
+    cursor: CursorQueryType = None,
+    with_total: Annotated[bool, Query(description="Include the total number of films")] = False,
+    with_facets: Annotated[bool, Query(description="Include the genre and subscription counts")] = False,
     films_service: BaseService = Depends(get_films_service),
-) -> list[FilmShortExternal]:
+) -> Response:
     """List items with brief information"""
 
-    films: list[FilmInternal] = (
-        await films_service.get_data(
-            RequestData(
-                query=query,
-                sort=sort,
-                page_number=page_number,
-                page_size=page_size,
-            ),
-        )
-        or []
+    request_data = RequestData(
+        query=query,
+        sort=sort,
+        page_number=page_number,
+        page_size=page_size,
+        cursor=cursor,
+        projection="short",
+        with_total=with_total,
+        with_facets=with_facets,
     )
 
-    return [
-        FilmShortExternal(
-            uuid=film.id,
-            title=film.title,
-            imdb_rating=film.imdb_rating,
-            subscriptions=film.subscriptions,
-        )
-        for film in films
-    ]
+    async def render() -> list[FilmShortExternal] | FilmsPageExternal:
+        return films_page_external(await films_service.get_data(request_data) or [], request_data)
+
+    return await films_service.get_response("films_search", request_data, render)
+
+
+@router.post(
+    "/batch",
+    response_model=list[FilmDetailExternal],
+    summary="Retrieve films by ids",
+    description="Get film works with details by a list of ids",
+    response_description="Detailed data on found film works in the order of the ids",
+    tags=["Retrieve details"],
+)
+async def films_batch(
+    token: Annotated[JWTTokenPayload | None, Depends(check_permissions(SystemRolesEnum.user))],
+    batch: BatchExternal,
+    films_service: BaseService = Depends(get_films_service),
+) -> list[FilmDetailExternal]:
+    """Retrieve several items with all the information, skipping unknown ids"""
+
+    films: list[FilmInternal] = await films_service.get_many(list(dict.fromkeys(str(film_id) for film_id in batch.ids)))
+    return [film_details_external(film) for film in films]
 
 
 @router.get(
@@ -69,29 +93,24 @@ async def film_details(
     token: Annotated[JWTTokenPayload | None, Depends(check_permissions(SystemRolesEnum.user))],
     film_id: UUID,
     film_service: BaseService = Depends(get_films_service),
-) -> FilmDetailExternal:
+) -> Response:
     """Retrieve an item with all the information"""
 
-    film: FilmInternal | None = await film_service.get_data(RequestData(id=film_id))
-    if not film:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="film not found")
+    request_data = RequestData(id=film_id)
 
-    return FilmDetailExternal(
-        uuid=film.id,
-        title=film.title,
-        imdb_rating=film.imdb_rating,
-        description=film.description,
-        genre=[GenreExternal(uuid=genre.id, name=genre.name) for genre in film.genre or []],
-        actors=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.actors or []],
-        directors=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.directors or []],
-        writers=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.writers or []],
-        subscriptions=film.subscriptions or [],
-    )
+    async def render() -> FilmDetailExternal:
+        film: FilmInternal | None = await film_service.get_data(request_data)
+        if not film:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="film not found")
+
+        return film_details_external(film)
+
+    return await film_service.get_response("film_details", request_data, render)
 
 
 @router.get(
     "",
-    response_model=list[FilmShortExternal],
+    response_model=list[FilmShortExternal] | FilmsPageExternal,
     summary="List films",
     description="List film works",
     response_description="Movie title and rating",
@@ -103,28 +122,63 @@ async def films_list(
     page_number: PageNumberQueryType = 1,
     page_size: PageSizeQueryType = settings.page_size,
     genre: Annotated[UUID, Query(description="Film work genre")] = None,
+    cursor: CursorQueryType = None,
+    with_total: Annotated[bool, Query(description="Include the total number of films")] = False,
+    with_facets: Annotated[bool, Query(description="Include the genre and subscription counts")] = False,
     films_service: BaseService = Depends(get_films_service),
-) -> list[FilmShortExternal]:
+) -> Response:
     """List items with brief information"""
 
-    films: list[FilmInternal] = (
-        await films_service.get_data(
-            RequestData(
-                sort=sort,
-                page_number=page_number,
-                page_size=page_size,
-                nested_query=NestedQuery(path="genre", field="id", query_string=str(genre)) if genre else None,
-            ),
-        )
-        or []
+    request_data = RequestData(
+        sort=sort,
+        page_number=page_number,
+        page_size=page_size,
+        nested_query=NestedQuery(path="genre", field="id", query_string=str(genre)) if genre else None,
+        cursor=cursor,
+        projection="short",
+        with_total=with_total,
+        with_facets=with_facets,
+    )
+
+    async def render() -> list[FilmShortExternal] | FilmsPageExternal:
+        return films_page_external(await films_service.get_data(request_data) or [], request_data)
+
+    return await films_service.get_response("films_list", request_data, render)
+
+
+def films_page_external(films: list[FilmShort], request_data: RequestData) -> Page | FilmsPageExternal:
+    """A bare list of films, or an object with the total and facets when they are requested"""
+    items = Page(
+        (
+            FilmShortExternal(
+                uuid=film.id,
+                title=film.title,
+                imdb_rating=film.imdb_rating,
+                subscriptions=film.subscriptions or [],
+            )
+            for film in films
+        ),
+        next_cursor=getattr(films, "next_cursor", None),
+    )
+    if not request_data.with_total and not request_data.with_facets:
+        return items
+    return FilmsPageExternal(
+        items=items,
+        total=getattr(films, "total", None),
+        facets=getattr(films, "facets", None),
+        next_cursor=items.next_cursor,
     )
 
-    return [
-        FilmShortExternal(
-            uuid=film.id,
-            title=film.title,
-            imdb_rating=film.imdb_rating,
-            subscriptions=film.subscriptions,
-        )
-        for film in films
-    ]
+
+def film_details_external(film: FilmInternal) -> FilmDetailExternal:
+    return FilmDetailExternal(
+        uuid=film.id,
+        title=film.title,
+        imdb_rating=film.imdb_rating,
+        description=film.description,
+        genre=[GenreExternal(uuid=genre.id, name=genre.name) for genre in film.genre or []],
+        actors=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.actors or []],
+        directors=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.directors or []],
+        writers=[FilmPersonExternal(uuid=person.id, full_name=person.name) for person in film.writers or []],
+        subscriptions=film.subscriptions or [],
+    )
@@ -2,7 +2,7 @@ from http import HTTPStatus
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
 from api.v1.fields import PageNumberQueryType, PageSizeQueryType
 from api.v1.models import GenreExternal
@@ -28,17 +28,22 @@ async def genre_details(
     token: Annotated[JWTTokenPayload | None, Depends(check_permissions(SystemRolesEnum.user))],
     genre_id: UUID,
     genre_service: BaseService = Depends(get_genres_service),
-) -> GenreExternal:
+) -> Response:
     """Retrieve an item with all the information"""
 
-    genre: GenreInternal | None = await genre_service.get_data(RequestData(id=genre_id))
-    if not genre:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
+    request_data = RequestData(id=genre_id)
 
-    return GenreExternal(
-        uuid=genre.id,
-        name=genre.name,
-    )
+    async def render() -> GenreExternal:
+        genre: GenreInternal | None = await genre_service.get_data(request_data)
+        if not genre:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
+
+        return GenreExternal(
+            uuid=genre.id,
+            name=genre.name,
+        )
+
+    return await genre_service.get_response("genre_details", request_data, render)
 
 
 @router.get(
@@ -54,16 +59,16 @@ async def genres_list(
     page_number: PageNumberQueryType = 1,
     page_size: PageSizeQueryType = settings.page_size,
     genres_service: BaseService = Depends(get_genres_service),
-) -> list[GenreExternal]:
+) -> Response:
     """List items with brief information"""
 
-    genres: list[GenreInternal] = (
-        await genres_service.get_data(
-            RequestData(
-                page_number=page_number,
-                page_size=page_size,
-            ),
-        )
-        or []
+    request_data = RequestData(
+        page_number=page_number,
+        page_size=page_size,
     )
-    return [GenreExternal(uuid=genre.id, name=genre.name) for genre in genres]
+
+    async def render() -> list[GenreExternal]:
+        genres: list[GenreInternal] = await genres_service.get_data(request_data) or []
+        return [GenreExternal(uuid=genre.id, name=genre.name) for genre in genres]
+
+    return await genres_service.get_response("genres_list", request_data, render)
@@ -1,8 +1,11 @@
 from enum import Enum
+from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic.types import UUID4
 
+from core.config import settings
+
 
 class GenreExternal(BaseModel):
     uuid: UUID4
@@ -21,6 +24,18 @@ class FilmShortExternal(BaseModel):
     subscriptions: list[int]
 
 
+class FacetValueExternal(BaseModel):
+    value: str | int
+    count: int
+
+
+class FilmsPageExternal(BaseModel):
+    items: list[FilmShortExternal]
+    total: int | None = None
+    facets: dict[str, list[FacetValueExternal]] | None = None
+    next_cursor: str | None = None
+
+
 class FilmDetailExternal(FilmShortExternal):
     description: str | None
     genre: list[GenreExternal]
@@ -38,6 +53,20 @@ class PersonDetailExternal(FilmPersonExternal):
     films: list[PersonFilmExternal] | None
 
 
+class FilmSuggestExternal(BaseModel):
+    uuid: UUID4
+    title: str
+
+
+class SuggestExternal(BaseModel):
+    films: list[FilmSuggestExternal]
+    persons: list[FilmPersonExternal]
+
+
+class BatchExternal(BaseModel):
+    ids: list[UUID] = Field(min_length=1, max_length=settings.batch_size_max)
+
+
 class FilmsSortKeys(str, Enum):
     imdb_rating_asc = "imdb_rating"
     imdb_rating_desc = "-imdb_rating"
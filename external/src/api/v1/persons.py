@@ -1,16 +1,16 @@
-import itertools
 from http import HTTPStatus
 from itertools import groupby
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
-from api.v1.fields import PageNumberQueryType, PageSizeQueryType
-from api.v1.models import FilmShortExternal, FilmsSortKeys, PersonDetailExternal, PersonFilmExternal
+from api.v1.fields import CursorQueryType, PageNumberQueryType, PageSizeQueryType
+from api.v1.models import BatchExternal, FilmShortExternal, FilmsSortKeys, PersonDetailExternal, PersonFilmExternal
 from core.auth import JWTTokenPayload, SystemRolesEnum, check_permissions
 from core.config import settings
-from core.types import NestedQuery, RequestData
+from core.types import NestedQuery, Page, RequestData
+from models.film import FilmShort
 from models.person import Person as PersonInternal
 from services.base import BaseService
 from services.films import get_films_service
@@ -32,32 +32,26 @@ async def persons_list(
     query: Annotated[str, Query(description="Query string for the full text search")],
     page_number: PageNumberQueryType = 1,
     page_size: PageSizeQueryType = settings.page_size,
+    cursor: CursorQueryType = None,
     persons_service: BaseService = Depends(get_persons_service),
-) -> list[PersonDetailExternal]:
+) -> Response:
     """List items with brief information"""
 
-    persons: list[PersonInternal] = (
-        await persons_service.get_data(
-            RequestData(
-                query=query,
-                page_number=page_number,
-                page_size=page_size,
-            ),
-        )
-        or []
+    request_data = RequestData(
+        query=query,
+        page_number=page_number,
+        page_size=page_size,
+        cursor=cursor,
     )
 
-    return [
-        PersonDetailExternal(
-            uuid=person.id,
-            full_name=person.name,
-            films=[
-                PersonFilmExternal(uuid=film_id, roles=[film.role for film in group])
-                for film_id, group in groupby(person.films, key=lambda x: x.id) or []  # type: ignore
-            ],
+    async def render() -> list[PersonDetailExternal]:
+        persons: list[PersonInternal] = await persons_service.get_data(request_data) or []
+        return Page(
+            (person_details_external(person) for person in persons),
+            next_cursor=getattr(persons, "next_cursor", None),
         )
-        for person in persons
-    ]
+
+    return await persons_service.get_response("persons_search", request_data, render)
 
 
 @router.get(
@@ -75,31 +69,55 @@ async def person_films_list(
     page_number: PageNumberQueryType = 1,
     page_size: PageSizeQueryType = settings.page_size,
     films_service: BaseService = Depends(get_films_service),
-) -> list[FilmShortExternal]:
+) -> Response:
     """List person films with brief information"""
-    films = itertools.chain.from_iterable(
-        [
-            await films_service.get_data(
-                RequestData(
-                    sort=sort,
-                    page_number=page_number,
-                    page_size=page_size,
-                    nested_query=NestedQuery(path=path, field="id", query_string=str(person_id)),
-                ),
-            )
-            or []
+
+    request_data = RequestData(
+        sort=sort,
+        page_number=page_number,
+        page_size=page_size,
+        # Фильм с несколькими ролями персоны - один документ, поэтому попадает в выдачу один раз
+        nested_query=[
+            NestedQuery(path=path, field="id", query_string=str(person_id))
             for path in ("actors", "writers", "directors")
         ],
+        projection="short",
     )
 
-    return [
-        FilmShortExternal(
-            uuid=film.id,
-            title=film.title,
-            imdb_rating=film.imdb_rating,
-        )
-        for film in films
-    ]
+    async def render() -> list[FilmShortExternal]:
+        films: list[FilmShort] = await films_service.get_data(request_data) or []
+        return [
+            FilmShortExternal(
+                uuid=film.id,
+                title=film.title,
+                imdb_rating=film.imdb_rating,
+                subscriptions=film.subscriptions or [],
+            )
+            for film in films
+        ]
+
+    return await films_service.get_response("person_films", request_data, render)
+
+
+@router.post(
+    "/batch",
+    response_model=list[PersonDetailExternal],
+    summary="Retrieve persons by ids",
+    description="Get persons with details by a list of ids",
+    response_description="Persons names with films and roles in the order of the ids",
+    tags=["Retrieve details"],
+)
+async def persons_batch(
+    token: Annotated[JWTTokenPayload | None, Depends(check_permissions(SystemRolesEnum.user))],
+    batch: BatchExternal,
+    persons_service: BaseService = Depends(get_persons_service),
+) -> list[PersonDetailExternal]:
+    """Retrieve several items with all the information, skipping unknown ids"""
+
+    persons: list[PersonInternal] = await persons_service.get_many(
+        list(dict.fromkeys(str(person_id) for person_id in batch.ids))
+    )
+    return [person_details_external(person) for person in persons]
 
 
 @router.get(
@@ -114,13 +132,22 @@ async def person_details(
     token: Annotated[JWTTokenPayload | None, Depends(check_permissions(SystemRolesEnum.user))],
     person_id: UUID,
     person_service: BaseService = Depends(get_persons_service),
-) -> PersonDetailExternal:
+) -> Response:
     """Retrieve an item with all the information"""
 
-    person: PersonInternal | None = await person_service.get_data(RequestData(id=person_id))
-    if not person:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
+    request_data = RequestData(id=person_id)
+
+    async def render() -> PersonDetailExternal:
+        person: PersonInternal | None = await person_service.get_data(request_data)
+        if not person:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
+
+        return person_details_external(person)
+
+    return await person_service.get_response("person_details", request_data, render)
+
 
+def person_details_external(person: PersonInternal) -> PersonDetailExternal:
     return PersonDetailExternal(
         uuid=person.id,
         full_name=person.name,
@@ -0,0 +1,36 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+
+from api.v1.fields import SuggestSizeQueryType
+from api.v1.models import FilmPersonExternal, FilmSuggestExternal, SuggestExternal
+from core.auth import JWTTokenPayload, check_permissions
+from core.config import settings
+from services.suggest import SuggestService, get_suggest_service
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    response_model=SuggestExternal,
+    summary="Suggest films and persons",
+    description="Typeahead suggestions of film titles and person names by the beginning of a word",
+    response_description="Matching film titles and person names",
+    tags=["Full-text search"],
+)
+async def suggest(
+    token: Annotated[JWTTokenPayload | None, Depends(check_permissions())],
+    query: Annotated[str, Query(description="Beginning of the typed text", min_length=1, max_length=100)],
+    size: SuggestSizeQueryType = settings.suggest_size,
+    suggest_service: SuggestService = Depends(get_suggest_service),
+) -> SuggestExternal:
+    """Suggest items by a prefix of their titles or names"""
+
+    suggestions = await suggest_service.suggest(query, size)
+    return SuggestExternal(
+        films=[FilmSuggestExternal(uuid=film["id"], title=film["title"]) for film in suggestions["films"]],
+        persons=[
+            FilmPersonExternal(uuid=person["id"], full_name=person["full_name"]) for person in suggestions["persons"]
+        ],
+    )
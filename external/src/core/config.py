@@ -27,8 +27,34 @@ class Settings(BaseSettings):
 
     page_size: int = 10
     page_size_max: int = 100
+    # Наибольшее число id в запросе документов пачкой
+    batch_size_max: int = 100
+    # Время жизни point-in-time Elasticsearch между запросами страниц по курсору: продлевается каждой страницей
+    pit_keep_alive: str = "30s"
+    # Граница точного подсчёта общего числа документов и число значений каждого фасета в ответе
+    track_total_hits_max: int = 10000
+    facet_size: int = 50
 
     cache_expires_in_seconds: int = 60 * 5  # 5 минут
+    # Защита от одновременного обновления кэша: время блокировки на обновление, интервал проверки кэша
+    # ожидающими запросами и коэффициент раннего обновления XFetch (0 - без раннего обновления)
+    cache_lock_timeout_seconds: float = 5
+    cache_lock_poll_interval_seconds: float = 0.05
+    cache_xfetch_beta: float = 1.0
+    # Кэшировать сериализованные ответы эндпойнтов
+    cache_responses: bool = True
+    # Кэш проверенных моделей в памяти процесса перед Redis
+    local_cache_enabled: bool = False
+    local_cache_max_size: int = 1000
+    local_cache_expires_in_seconds: int = 30
+    # Канал сообщений ETL об изменившихся документах, по которым сбрасывается кэш
+    cache_invalidation_channel: str = "etl_index_updated"
+    cache_invalidation_reconnect_seconds: float = 5
+    # Число подсказок каждого вида и кэш подсказок по самым частым началам запросов в памяти процесса
+    suggest_size: int = 5
+    suggest_size_max: int = 20
+    suggest_cache_max_size: int = 10000
+    suggest_cache_expires_in_seconds: int = 60
 
     jwt_access_token_secret_key: str = "movies_token_secret"
     jwt_access_token_expires_minutes: int = 60
@@ -1,4 +1,5 @@
-from typing import Annotated, TypeAlias
+from collections.abc import Iterable
+from typing import Annotated, Any, TypeAlias
 from uuid import UUID
 
 from pydantic import AfterValidator, BaseModel
@@ -34,10 +35,35 @@ class RequestData(BaseModel):
     page_number: PageNumberType | None = None
     page_size: PageSizeType | None = None
     query: str | None = None
-    nested_query: NestedQuery | None = None
+    # Несколько вложенных запросов: документ подходит, если подходит хотя бы под один
+    nested_query: NestedQuery | list[NestedQuery] | None = None
+    cursor: str | None = None
+    # Имя облегчённой модели, поля которой нужны эндпойнту
+    projection: str | None = None
+    # Посчитать общее число документов и фасеты в том же запросе к Elasticsearch
+    with_total: bool = False
+    with_facets: bool = False
+
+
+class Page(list):
+    """Страница списка с курсором следующей страницы, если она может быть, общим числом документов и фасетами"""
+
+    def __init__(
+        self,
+        items: Iterable[Any] = (),
+        next_cursor: str | None = None,
+        total: int | None = None,
+        facets: dict[str, list[dict[str, Any]]] | None = None,
+    ) -> None:
+        super().__init__(items)
+        self.next_cursor = next_cursor
+        self.total = total
+        self.facets = facets
 
 
 DataType: TypeAlias = BaseModel | list[BaseModel]
 DataOptType: TypeAlias = DataType | None
 ModelType: TypeAlias = BaseModel
 ModelListType: TypeAlias = list[BaseModel]
+# Тело ответа эндпойнта и его заголовки
+ResponseType: TypeAlias = tuple[bytes, dict[str, str]]
@@ -1,3 +1,4 @@
+import asyncio
 from collections.abc import AsyncGenerator, Callable
 from contextlib import asynccontextmanager
 from http import HTTPStatus
@@ -13,6 +14,8 @@ from api.routers import all_v1_routers
 from core.config import settings
 from core.tracer import configure_tracer
 from db import elastic, redis
+from services.cache import listen_invalidations
+from services.database import InvalidCursorError
 
 description = """Information about films, genres and people involved in the creation of the work"""
 
@@ -23,7 +26,15 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     elastic.es = AsyncElasticsearch(
         hosts=[{"host": settings.elastic_host, "port": settings.elastic_port, "scheme": "http"}],
     )
+    listener = asyncio.create_task(
+        listen_invalidations(
+            redis.redis,
+            settings.cache_invalidation_channel,
+            settings.cache_invalidation_reconnect_seconds,
+        )
+    )
     yield
+    listener.cancel()
     await redis.redis.close()
     await elastic.es.close()
 
@@ -54,6 +65,11 @@ async def before_request(request: Request, call_next: Callable) -> Response:
     return await call_next(request)
 
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError) -> Response:
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST, content={"detail": "invalid cursor"})
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -11,6 +11,17 @@ class FilmPerson(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class FilmShort(BaseModel):
+    """Поля фильма для списков и результатов поиска"""
+
+    id: str = Field(..., alias="uuid")
+    title: str
+    imdb_rating: float
+    subscriptions: list[int] | None = None
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
 class Film(BaseModel):
     id: str = Field(..., alias="uuid")
     title: str
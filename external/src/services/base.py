@@ -1,9 +1,23 @@
-from core.types import DataOptType, RequestData
+import asyncio
+import math
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from fastapi import Response
+from orjson import dumps
+
+from core.config import settings
+from core.types import DataOptType, ModelType, RequestData
 from services.cache import BaseCache
 from services.database import BaseDatabase
 
 
 class BaseService:
+    # Вес последнего замера в скользящем среднем времени получения данных из базы данных
+    recompute_weight = 0.2
+
     def __init__(
         self,
         cache: BaseCache,
@@ -11,17 +25,93 @@ class BaseService:
     ) -> None:
         self.cache = cache
         self.database = database
+        # Запросы к базе данных, которые выполняются сейчас, по ключам кэша
+        self.in_flight: dict[str, asyncio.Task] = {}
+        # Среднее время получения данных из базы данных, сек.
+        self.recompute_seconds = 0.0
+        # Кэшировать готовые ответы эндпойнтов, а не только данные
+        self.cache_responses = settings.cache_responses
 
     async def get_data(self, request_data: RequestData) -> DataOptType:
+        # Одинаковые одновременные запросы ждут результата одного обращения к кэшу и базе данных
+        key = self.cache.make_cache_key(request_data)
+        if not (task := self.in_flight.get(key)):
+            task = asyncio.ensure_future(self.load_data(request_data))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Отмена одного из ожидающих запросов не должна отменять общий
+        return await asyncio.shield(task)
+
+    async def get_many(self, ids: list[str]) -> list[ModelType]:
+        """Возвращает найденные документы в порядке ids: из кэша одним запросом, недостающие - из базы данных"""
+        requests_data = [RequestData(id=item_id) for item_id in ids]
+        found = dict(zip(ids, await self.cache.get_many(requests_data)))
+        if misses := [item_id for item_id, data in found.items() if not data]:
+            loaded = await self.database.get_many(misses)
+            await self.cache.put_many([(loaded[item_id], RequestData(id=item_id)) for item_id in loaded])
+            found |= loaded
+        return [data for item_id in ids if (data := found[item_id])]  # type: ignore[misc]
+
+    async def load_data(self, request_data: RequestData) -> DataOptType:
         # Пытаемся получить данные из кеша
-        data = await self.cache.get(request_data)
-        if not data:
-            # Если данных нет в кеше, то ищем его в базе данных
-            data = await self.database.get(request_data)
-            if not data:
-                # Если данные отсутствуют в базе данных, значит, их вообще нет
-                return None
-            # Сохраняем данные в кеш
-            await self.cache.put(data, request_data)
+        data, ttl = await self.cache.get_with_ttl(request_data)
+        if data and not self.expires_early(ttl):
+            return data
+
+        # Обновлять данные идёт только один запрос, остальные получают данные из кэша
+        if not (token := await self.cache.lock(request_data, settings.cache_lock_timeout_seconds)):
+            return data or await self.wait_for_cache(request_data)
+        try:
+            return await self.refresh(request_data)
+        finally:
+            await self.cache.unlock(request_data, token)
 
+    def expires_early(self, ttl: int) -> bool:
+        """Вероятностное раннее обновление (XFetch): чем ближе истечение срока и дольше
+        получение данных, тем вероятнее, что запрос обновит кэш заранее"""
+        gap = self.recompute_seconds * settings.cache_xfetch_beta * -math.log(1 - random.random())
+        return gap * 1000 >= ttl > 0
+
+    async def wait_for_cache(self, request_data: RequestData) -> DataOptType:
+        """Ждёт, пока другой запрос обновит кэш, и идёт в базу данных сам, если данные так и не появились"""
+        deadline = time.monotonic() + settings.cache_lock_timeout_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.cache_lock_poll_interval_seconds)
+            if data := await self.cache.get(request_data):
+                return data
+            if not await self.cache.is_locked(request_data):
+                break
+        return await self.refresh(request_data)
+
+    async def refresh(self, request_data: RequestData) -> DataOptType:
+        # Если данных нет в кеше, то ищем его в базе данных
+        started = time.monotonic()
+        data = await self.database.get(request_data)
+        elapsed = time.monotonic() - started
+        self.recompute_seconds += (elapsed - self.recompute_seconds) * self.recompute_weight
+        if not data:
+            # Если данные отсутствуют в базе данных, значит, их вообще нет
+            return None
+        # Сохраняем данные в кеш
+        await self.cache.put(data, request_data)
         return data
+
+    async def get_response(
+        self, route: str, request_data: RequestData, render: Callable[[], Awaitable[Any]]
+    ) -> Response:
+        """Возвращает ответ эндпойнта route из кэша в виде готового JSON без проверки и преобразования моделей.
+
+        При промахе ответ строится функцией render, сериализуется один раз и сохраняется в кэш,
+        если он не пустой.
+        """
+        if self.cache_responses and (response := await self.cache.get_response(route, request_data)):
+            body, headers = response
+            return Response(content=body, headers=headers, media_type="application/json")
+
+        content = await render()
+        body = dumps(content, default=lambda model: model.model_dump())
+        # Курсор следующей страницы списка
+        headers = {"X-Next-Cursor": next_cursor} if (next_cursor := getattr(content, "next_cursor", None)) else {}
+        if self.cache_responses and content:
+            await self.cache.put_response((body, headers), route, request_data)
+        return Response(content=body, headers=headers, media_type="application/json")
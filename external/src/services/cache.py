@@ -1,12 +1,20 @@
+import asyncio
+import logging
+import secrets
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any
+from collections import OrderedDict
+from typing import Any, ClassVar
 
 from opentelemetry import trace
-from orjson import dumps
+from orjson import JSONDecodeError, dumps
 from orjson.orjson import loads
 from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
 
-from core.types import DataOptType, DataType, ModelType, RequestData
+from core.config import settings
+from core.types import DataOptType, DataType, ModelType, Page, RequestData, ResponseType
 
 
 class BaseCache(ABC):
@@ -16,11 +24,14 @@ class BaseCache(ABC):
         cache_prefix: str,
         model: type[ModelType],
         expires: int,
+        projections: dict[str, type[ModelType]] | None = None,
     ) -> None:
         self.storage = storage
         self.cache_prefix = cache_prefix
         self.model = model
         self.expires = expires
+        # Облегчённые модели для запросов части полей документов, по именам проекций
+        self.projections = projections or {}
 
     @abstractmethod
     async def get(self, request_data: RequestData) -> DataOptType:
@@ -30,6 +41,86 @@ class BaseCache(ABC):
     async def put(self, data: DataOptType, request_data: RequestData) -> None:
         """Отправить данные в кэш"""
 
+    @abstractmethod
+    async def get_many(self, requests_data: list[RequestData]) -> list[DataOptType]:
+        """Получить из кэша данные нескольких запросов одним обращением"""
+
+    @abstractmethod
+    async def get_many_with_ttl(self, requests_data: list[RequestData]) -> list[tuple[DataOptType, int]]:
+        """Получить из кэша данные нескольких запросов и оставшееся время их жизни в миллисекундах"""
+
+    @abstractmethod
+    async def put_many(self, items: list[tuple[DataType, RequestData]]) -> None:
+        """Отправить в кэш данные нескольких запросов одним обращением"""
+
+    @abstractmethod
+    async def get_with_ttl(self, request_data: RequestData) -> tuple[DataOptType, int]:
+        """Получить данные из кэша и оставшееся время их жизни в миллисекундах"""
+
+    @abstractmethod
+    async def lock(self, request_data: RequestData, timeout: float) -> str | None:
+        """Захватить короткую блокировку на обновление данных в кэше и вернуть её токен"""
+
+    @abstractmethod
+    async def is_locked(self, request_data: RequestData) -> bool:
+        """Проверить, обновляет ли данные другой запрос"""
+
+    @abstractmethod
+    async def unlock(self, request_data: RequestData, token: str) -> None:
+        """Освободить блокировку на обновление данных, если она ещё принадлежит токену"""
+
+    @abstractmethod
+    async def get_response(self, route: str, request_data: RequestData) -> ResponseType | None:
+        """Получить из кэша готовое тело ответа эндпойнта и его заголовки"""
+
+    @abstractmethod
+    async def get_response_with_ttl(self, route: str, request_data: RequestData) -> tuple[ResponseType | None, int]:
+        """Получить из кэша готовый ответ эндпойнта и оставшееся время его жизни в миллисекундах"""
+
+    @abstractmethod
+    async def put_response(self, response: ResponseType, route: str, request_data: RequestData) -> None:
+        """Отправить в кэш готовое тело ответа эндпойнта и его заголовки"""
+
+    def model_for(self, request_data: RequestData) -> type[ModelType]:
+        return self.projections[request_data.projection] if request_data.projection else self.model
+
+    def make_cache_key(self, request_data: RequestData) -> str:
+        return make_key(self.cache_prefix, self.cache_prefix, request_data)
+
+    def make_response_key(self, request_data: RequestData) -> str:
+        """Ответы всех эндпойнтов на одни и те же параметры хранятся вместе, по имени эндпойнта"""
+        return make_key(self.cache_prefix, f"{self.cache_prefix}_response", request_data)
+
+
+# Поколения индексов по сообщениям ETL: списки и результаты поиска кэшируются в рамках поколения
+generations: dict[str, int] = {}
+
+# Хэш Redis, в котором процессы API хранят последние поколения индексов
+GENERATIONS_KEY = "cache_generations"
+
+# Число ключей, удаляемых из Redis одной командой
+INVALIDATION_BATCH_SIZE = 500
+
+# Удаляет блокировку, только если в ней всё ещё токен запроса, который её захватил
+UNLOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def make_key(index: str, prefix: str, request_data: RequestData) -> str:
+    # Параметры уже нормализованы: RequestData строится из проверенных параметров запроса со значениями по умолчанию
+    params = request_data.model_dump(exclude_unset=True)
+    if params.keys() != {"id"}:
+        # Списки и результаты поиска могут измениться при изменении любого документа индекса,
+        # а документ по id сбрасывается точно
+        prefix += f"_{generations.get(index, 0)}"
+    return prefix + "_" + dumps(params).decode("UTF-8")
+
+
+logger = logging.getLogger(__name__)
 
 tracer = trace.get_tracer(__name__)
 
@@ -44,7 +135,7 @@ class RedisCache(BaseCache):
             if not data:
                 return None
 
-            return self.load_cache_value(data)
+            return self.load_cache_value(data, self.model_for(request_data))
 
     async def put(self, data: DataOptType, request_data: RequestData) -> None:
         """Puts data to Redis"""
@@ -55,25 +146,328 @@ class RedisCache(BaseCache):
                 ex=self.expires,
             )
 
-    def make_cache_key(self, request_data: RequestData) -> str:
-        return self.cache_prefix + "_" + dumps(request_data.model_dump(exclude_unset=True)).decode("UTF-8")
+    async def get_many(self, requests_data: list[RequestData]) -> list[DataOptType]:
+        """Gets data of several requests from Redis with a single MGET"""
+        with tracer.start_as_current_span("redis-mget"):
+            values = await self.storage.mget([self.make_cache_key(request_data) for request_data in requests_data])
+            return [
+                self.load_cache_value(value, self.model_for(request_data)) if value else None
+                for value, request_data in zip(values, requests_data)
+            ]
+
+    async def get_many_with_ttl(self, requests_data: list[RequestData]) -> list[tuple[DataOptType, int]]:
+        """Gets data of several requests from Redis along with their remaining TTLs in one round trip"""
+        with tracer.start_as_current_span("redis-mget"):
+            keys = [self.make_cache_key(request_data) for request_data in requests_data]
+            async with self.storage.pipeline(transaction=False) as pipe:
+                pipe.mget(keys)
+                for key in keys:
+                    pipe.pttl(key)
+                values, *ttls = await pipe.execute()
+            return [
+                (self.load_cache_value(value, self.model_for(request_data)), ttl) if value else (None, 0)
+                for value, ttl, request_data in zip(values, ttls, requests_data)
+            ]
 
-    def load_cache_value(self, data: bytes) -> DataOptType:
+    async def put_many(self, items: list[tuple[DataType, RequestData]]) -> None:
+        """Puts data of several requests to Redis with a single pipeline"""
+        with tracer.start_as_current_span("redis-put"):
+            async with self.storage.pipeline(transaction=False) as pipe:
+                for data, request_data in items:
+                    pipe.set(name=self.make_cache_key(request_data), value=self.make_cache_value(data), ex=self.expires)
+                await pipe.execute()
+
+    async def get_with_ttl(self, request_data: RequestData) -> tuple[DataOptType, int]:
+        """Gets data from Redis along with its remaining TTL in one round trip"""
+        with tracer.start_as_current_span("redis-get"):
+            async with self.storage.pipeline(transaction=False) as pipe:
+                key = self.make_cache_key(request_data)
+                data, ttl = await pipe.get(key).pttl(key).execute()
+            if not data:
+                return None, 0
+
+            return self.load_cache_value(data, self.model_for(request_data)), ttl
+
+    async def lock(self, request_data: RequestData, timeout: float) -> str | None:
+        """Takes a short-lived lock so that only one worker recomputes the data"""
+        token = secrets.token_hex(16)
+        if await self.storage.set(self.make_lock_key(request_data), token, nx=True, px=int(timeout * 1000)):
+            return token
+        return None
+
+    async def is_locked(self, request_data: RequestData) -> bool:
+        return bool(await self.storage.exists(self.make_lock_key(request_data)))
+
+    async def unlock(self, request_data: RequestData, token: str) -> None:
+        # Блокировка могла истечь и достаться другому запросу: удаляем только свою
+        await self.storage.eval(UNLOCK_SCRIPT, 1, self.make_lock_key(request_data), token)
+
+    async def get_response(self, route: str, request_data: RequestData) -> ResponseType | None:
+        """Gets a serialized response from Redis"""
+        with tracer.start_as_current_span("redis-get"):
+            body, headers = await self.storage.hmget(self.make_response_key(request_data), [route, f"{route}_headers"])
+            if not body:
+                return None
+
+            return body, loads(headers) if headers else {}
+
+    async def get_response_with_ttl(self, route: str, request_data: RequestData) -> tuple[ResponseType | None, int]:
+        """Gets a serialized response from Redis along with its remaining TTL in one round trip"""
+        with tracer.start_as_current_span("redis-get"):
+            async with self.storage.pipeline(transaction=False) as pipe:
+                key = self.make_response_key(request_data)
+                (body, headers), ttl = await pipe.hmget(key, [route, f"{route}_headers"]).pttl(key).execute()
+            if not body:
+                return None, 0
+
+            return (body, loads(headers) if headers else {}), ttl
+
+    async def put_response(self, response: ResponseType, route: str, request_data: RequestData) -> None:
+        """Puts a serialized response to Redis"""
+        body, headers = response
+        with tracer.start_as_current_span("redis-put"):
+            async with self.storage.pipeline(transaction=False) as pipe:
+                key = self.make_response_key(request_data)
+                # Время жизни задаётся только новому хэшу: ответы других эндпойнтов не продлеваются при записи
+                await pipe.hset(key, mapping={route: body, f"{route}_headers": dumps(headers)}).expire(
+                    key, self.expires, nx=True
+                ).execute()
+
+    def make_lock_key(self, request_data: RequestData) -> str:
+        return self.make_cache_key(request_data) + "_lock"
+
+    @staticmethod
+    def load_cache_value(data: bytes, model: type[ModelType]) -> DataOptType:
         data = loads(data)
         match data:  # noqa: R503
+            case {"items": list() as items}:
+                return Page(
+                    (model.model_validate(item) for item in items),
+                    next_cursor=data.get("next_cursor"),
+                    total=data.get("total"),
+                    facets=data.get("facets"),
+                )
             case list():
-                return [self.model.model_validate(film) for film in data]
+                return [model.model_validate(film) for film in data]
             case dict():
-                return self.model.model_validate(data)
+                return model.model_validate(data)
             case _:
                 return None
 
     @staticmethod
     def make_cache_value(data: DataType) -> bytes:
         match data:  # noqa: R503
+            case Page():
+                # Курсор, общее число документов и фасеты кэшируются вместе с документами страницы
+                return dumps(
+                    {
+                        "items": [model.model_dump() for model in data],
+                        "next_cursor": data.next_cursor,
+                        "total": data.total,
+                        "facets": data.facets,
+                    }
+                )
             case list():
                 return dumps([model.model_dump() for model in data])
             case ModelType():
                 return dumps(data.model_dump())
             case _:
                 raise TypeError(f"Invalid data type: {type(data)}")
+
+
+class LocalCache(BaseCache):
+    """In-process LRU cache of validated models in front of another cache.
+
+    Entries live for at most `expires` seconds and no longer than in the underlying cache.
+    Documents are dropped when the ETL announces their update, lists and search results
+    are keyed by the generation of the index.
+    """
+
+    storage: OrderedDict[str, tuple[float, float, DataType | ResponseType]]
+    instances: ClassVar[weakref.WeakSet["LocalCache"]] = weakref.WeakSet()
+
+    def __init__(self, cache: BaseCache, max_size: int, expires: int) -> None:
+        super().__init__(OrderedDict(), cache.cache_prefix, cache.model, expires, cache.projections)
+        self.cache = cache
+        self.max_size = max_size
+        self.instances.add(self)
+
+    async def get(self, request_data: RequestData) -> DataOptType:
+        data, _ = await self.get_with_ttl(request_data)
+        return data
+
+    async def put(self, data: DataOptType, request_data: RequestData) -> None:
+        await self.cache.put(data, request_data)
+        self.remember(self.make_cache_key(request_data), data, self.cache.expires * 1000)
+
+    async def get_with_ttl(self, request_data: RequestData) -> tuple[DataOptType, int]:
+        key = self.make_cache_key(request_data)
+        if entry := self.lookup(key):
+            return entry  # type: ignore[return-value]
+
+        data, ttl = await self.cache.get_with_ttl(request_data)
+        if data:
+            self.remember(key, data, ttl)
+        return data, ttl
+
+    async def get_many(self, requests_data: list[RequestData]) -> list[DataOptType]:
+        return [data for data, _ in await self.get_many_with_ttl(requests_data)]
+
+    async def get_many_with_ttl(self, requests_data: list[RequestData]) -> list[tuple[DataOptType, int]]:
+        found: list[tuple[DataOptType, int]] = [
+            self.lookup(self.make_cache_key(request_data)) or (None, 0)  # type: ignore[misc]
+            for request_data in requests_data
+        ]
+        misses = [request_data for request_data, (data, _) in zip(requests_data, found) if not data]
+        if not misses:
+            return found
+
+        loaded = iter(await self.cache.get_many_with_ttl(misses))
+        for position, (data, _) in enumerate(found):
+            if not data and (entry := next(loaded))[0]:
+                found[position] = entry
+                self.remember(self.make_cache_key(requests_data[position]), *entry)
+        return found
+
+    async def put_many(self, items: list[tuple[DataType, RequestData]]) -> None:
+        await self.cache.put_many(items)
+        # Записи только что сохранены в кэш на полный срок
+        for data, request_data in items:
+            self.remember(self.make_cache_key(request_data), data, self.cache.expires * 1000)
+
+    async def lock(self, request_data: RequestData, timeout: float) -> str | None:
+        return await self.cache.lock(request_data, timeout)
+
+    async def is_locked(self, request_data: RequestData) -> bool:
+        return await self.cache.is_locked(request_data)
+
+    async def unlock(self, request_data: RequestData, token: str) -> None:
+        await self.cache.unlock(request_data, token)
+
+    async def get_response(self, route: str, request_data: RequestData) -> ResponseType | None:
+        response, _ = await self.get_response_with_ttl(route, request_data)
+        return response
+
+    async def get_response_with_ttl(self, route: str, request_data: RequestData) -> tuple[ResponseType | None, int]:
+        key = f"{self.make_response_key(request_data)}_{route}"
+        if entry := self.lookup(key):
+            return entry  # type: ignore[return-value]
+
+        response, ttl = await self.cache.get_response_with_ttl(route, request_data)
+        if response:
+            self.remember(key, response, ttl)
+        return response, ttl
+
+    async def put_response(self, response: ResponseType, route: str, request_data: RequestData) -> None:
+        await self.cache.put_response(response, route, request_data)
+        self.remember(f"{self.make_response_key(request_data)}_{route}", response, self.cache.expires * 1000)
+
+    def lookup(self, key: str) -> tuple[DataType | ResponseType, int] | None:
+        """Returns a live entry with the remaining lifetime in the underlying cache in milliseconds"""
+        if not (entry := self.storage.get(key)):
+            return None
+        expires_at, cache_expires_at, data = entry
+        now = time.monotonic()
+        if now >= expires_at:
+            del self.storage[key]
+            return None
+        self.storage.move_to_end(key)
+        return data, int((cache_expires_at - now) * 1000)
+
+    def remember(self, key: str, data: DataOptType | ResponseType, ttl: int) -> None:
+        if not data or ttl <= 0:
+            return
+        now = time.monotonic()
+        self.storage[key] = (now + min(self.expires, ttl / 1000), now + ttl / 1000, data)
+        self.storage.move_to_end(key)
+        while len(self.storage) > self.max_size:
+            self.storage.popitem(last=False)
+
+    def forget(self, item_ids: list[str] | None = None) -> None:
+        """Drops cached documents with the ids, or all entries"""
+        if item_ids is None:
+            self.storage.clear()
+            return
+        for item_id in item_ids:
+            request_data = RequestData(id=item_id)
+            self.storage.pop(self.make_cache_key(request_data), None)
+            response_key = self.make_response_key(request_data)
+            for key in [key for key in self.storage if key.startswith(response_key)]:
+                del self.storage[key]
+
+    @classmethod
+    def invalidate(cls, cache_prefix: str | None = None, item_ids: list[str] | None = None) -> None:
+        """Drops entries of the index in every local cache of the worker, or all entries"""
+        for cache in cls.instances:
+            if cache_prefix is None or cache.cache_prefix == cache_prefix:
+                cache.forget(item_ids)
+
+
+async def invalidate(storage: Redis, index: str, item_ids: list[str] | None, generation: int) -> None:
+    """Switches the worker to the new generation of the index and drops cached documents with the ids.
+
+    Without ids any document of the index may have changed, so all cached documents are dropped.
+    """
+    generations[index] = max(generations.get(index, 0), generation)
+    LocalCache.invalidate(index, item_ids)
+
+    # Сообщение получают все процессы API, а общий кэш в Redis сбрасывает один из них
+    if not await storage.set(f"{index}_invalidated_{generation}", 1, nx=True, ex=60):
+        return
+    await storage.hset(GENERATIONS_KEY, index, generation)
+    if item_ids is None:
+        keys = [key async for key in storage.scan_iter(match=f'{index}_*{{"id":*')]
+    else:
+        keys = [
+            make_key(index, prefix, RequestData(id=item_id))
+            for item_id in item_ids
+            for prefix in (index, f"{index}_response")
+        ]
+    for start in range(0, len(keys), INVALIDATION_BATCH_SIZE):
+        await storage.delete(*keys[start : start + INVALIDATION_BATCH_SIZE])
+
+
+async def listen_invalidations(storage: Redis, channel: str, reconnect_interval: float) -> None:
+    """Drops cache entries of the documents updated by the ETL.
+
+    Messages published while the subscription is down are lost, so on (re)connect local caches are cleared
+    and generations of the indices are read from Redis.
+    """
+    while True:
+        try:
+            async with storage.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(channel)
+                LocalCache.invalidate()
+                for index, generation in (await storage.hgetall(GENERATIONS_KEY)).items():
+                    index = index.decode("UTF-8")
+                    generations[index] = max(generations.get(index, 0), int(generation))
+                async for message in pubsub.listen():
+                    try:
+                        update = loads(message["data"])
+                        await invalidate(storage, update["index"], update["ids"], update["generation"])
+                    except (JSONDecodeError, KeyError, TypeError):
+                        logger.exception(f"invalid cache invalidation message: {message['data']!r}")
+        except RedisConnectionError as e:
+            logger.warning(f"cache invalidation subscription to {channel} lost: {e!r}")
+            await asyncio.sleep(reconnect_interval)
+
+
+def make_cache(
+    storage: Redis,
+    cache_prefix: str,
+    model: type[ModelType],
+    projections: dict[str, type[ModelType]] | None = None,
+) -> BaseCache:
+    """Redis cache of the index, with an in-process tier in front of it if enabled in settings"""
+    cache: BaseCache = RedisCache(
+        storage,
+        cache_prefix=cache_prefix,
+        model=model,
+        expires=settings.cache_expires_in_seconds,
+        projections=projections,
+    )
+    if settings.local_cache_enabled:
+        cache = LocalCache(
+            cache, max_size=settings.local_cache_max_size, expires=settings.local_cache_expires_in_seconds
+        )
+    return cache
@@ -1,10 +1,22 @@
+import binascii
 from abc import ABC, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from contextlib import suppress
 from typing import Any
 
-from elasticsearch import NotFoundError
+from elasticsearch import BadRequestError, NotFoundError
 from opentelemetry.trace import get_tracer
+from orjson import JSONDecodeError, dumps, loads
 
-from core.types import DataOptType, ModelType, NestedQuery, PageNumberType, PageSizeType, RequestData
+from core.config import settings
+from core.types import DataOptType, ModelType, NestedQuery, Page, PageNumberType, PageSizeType, RequestData
+
+# Курсор, которым клиент начинает постраничный обход с первой страницы
+FIRST_PAGE_CURSOR = "start"
+
+
+class InvalidCursorError(ValueError):
+    """Курсор страницы не выдан API или повреждён"""
 
 
 class BaseDatabase(ABC):
@@ -15,17 +27,30 @@ class BaseDatabase(ABC):
         model: type[ModelType],
         sort_fields: tuple[str, ...] = (),
         search_fields: tuple[str, ...] = (),
+        projections: dict[str, type[ModelType]] | None = None,
+        facets: dict[str, dict[str, Any]] | None = None,
     ) -> None:
         self.storage = storage
         self.index = index
         self.model = model
         self.sort_fields = sort_fields
         self.search_fields = search_fields
+        # Облегчённые модели для запросов части полей документов, по именам проекций
+        self.projections = projections or {}
+        # Агрегации, которые считаются по запросу вместе со страницей списка, по именам фасетов
+        self.facets = facets or {}
+
+    def model_for(self, request_data: RequestData) -> type[ModelType]:
+        return self.projections[request_data.projection] if request_data.projection else self.model
 
     @abstractmethod
     async def get(self, request_data: RequestData) -> DataOptType:
         """Получить данные из базы данных"""
 
+    @abstractmethod
+    async def get_many(self, ids: list[str]) -> dict[str, ModelType]:
+        """Получить документы по id одним обращением к базе данных"""
+
 
 tracer = get_tracer(__name__)
 
@@ -39,19 +64,128 @@ class ElasticDatabase(BaseDatabase):
                     doc = await self.storage.get(index=self.index, id=str(request_data.id))
                 except NotFoundError:
                     return None
-                return self.model(**doc.body["_source"])
+                return self.model_for(request_data)(**doc.body["_source"])
 
-            docs = await self.storage.search(
-                index=self.index,
-                query=self.make_query_dls(request_data.query)
+            params = {
+                "query": self.make_query_dls(request_data.query)
                 or self.make_query_dls_nested(
                     request_data.nested_query,
                 ),
-                sort=self.make_elastic_sort_string(request_data.sort),
-                from_=self.get_item_from(request_data.page_size, request_data.page_number),
-                size=request_data.page_size,
+                "sort": self.make_sort(request_data),
+                "size": request_data.page_size,
+                # Точное число документов считается только по запросу и не дальше заданной границы
+                "track_total_hits": settings.track_total_hits_max if request_data.with_total else False,
+            }
+            if request_data.with_facets and self.facets:
+                params["aggs"] = self.facets
+            model = self.model_for(request_data)
+            if request_data.projection:
+                # Из Elasticsearch передаются только поля облегчённой модели
+                params["source_includes"] = list(model.model_fields)
+            if request_data.cursor:
+                pit_id, docs = await self.search_after(params, *self.decode_cursor(request_data.cursor, params["sort"]))
+            else:
+                pit_id = None
+                docs = await self.storage.search(
+                    index=self.index,
+                    from_=self.get_item_from(request_data.page_size, request_data.page_number),
+                    **params,
+                )
+
+            hits = docs.body["hits"]["hits"]
+            next_cursor = None
+            if pit_id and len(hits) == request_data.page_size:
+                # Курсор следующей страницы - значения сортировки последнего документа
+                next_cursor = self.encode_cursor(pit_id, hits[-1]["sort"], params["sort"])
+            elif pit_id:
+                # Страница последняя: point-in-time больше не нужен
+                await self.close_point_in_time(pit_id)
+            return Page(
+                (model(**doc["_source"]) for doc in hits),
+                next_cursor=next_cursor,
+                total=docs.body["hits"]["total"]["value"] if request_data.with_total else None,
+                facets=self.make_facets(docs.body.get("aggregations", {})) if request_data.with_facets else None,
             )
-            return [self.model(**doc["_source"]) for doc in docs.body["hits"]["hits"]]
+
+    async def get_many(self, ids: list[str]) -> dict[str, ModelType]:
+        """Get documents by ids with a single mget"""
+        with tracer.start_as_current_span("elasticsearch-mget"):
+            docs = await self.storage.mget(index=self.index, ids=ids)
+            return {doc["_id"]: self.model(**doc["_source"]) for doc in docs.body["docs"] if doc.get("found")}
+
+    async def search_after(
+        self, params: dict[str, Any], pit_id: str | None, search_after: list[Any] | None
+    ) -> tuple[str, Any]:
+        """Ищет документы после search_after в point-in-time, открывая его на первой странице обхода"""
+        if not pit_id:
+            pit_id = await self.open_point_in_time()
+        try:
+            try:
+                docs = await self.search_in_point_in_time(params, pit_id, search_after)
+            except NotFoundError:
+                # Срок point-in-time истёк: продолжаем в новом, по актуальному состоянию индекса
+                pit_id = await self.open_point_in_time()
+                docs = await self.search_in_point_in_time(params, pit_id, search_after)
+        except BadRequestError as e:
+            # Значения search_after или id point-in-time в курсоре не подходят к запросу
+            raise InvalidCursorError(str(e)) from e
+        # Elasticsearch может вернуть обновлённый id point-in-time
+        return docs.body.get("pit_id", pit_id), docs
+
+    async def open_point_in_time(self) -> str:
+        response = await self.storage.open_point_in_time(index=self.index, keep_alive=settings.pit_keep_alive)
+        return response.body["id"]
+
+    async def close_point_in_time(self, pit_id: str) -> None:
+        # Срок point-in-time мог уже истечь
+        with suppress(NotFoundError):
+            await self.storage.close_point_in_time(id=pit_id)
+
+    async def search_in_point_in_time(self, params: dict[str, Any], pit_id: str, search_after: list[Any] | None) -> Any:
+        return await self.storage.search(
+            pit={"id": pit_id, "keep_alive": settings.pit_keep_alive},
+            search_after=search_after,
+            **params,
+        )
+
+    @staticmethod
+    def make_facets(aggregations: dict[str, Any]) -> dict[str, list[dict[str, Any]]]:
+        """Значения фасетов с числом документов; у агрегаций по вложенным полям корзины во вложенной агрегации values"""
+        return {
+            name: [
+                {"value": bucket["key"], "count": bucket["doc_count"]}
+                for bucket in aggregation.get("values", aggregation).get("buckets", [])
+            ]
+            for name, aggregation in aggregations.items()
+        }
+
+    @staticmethod
+    def encode_cursor(pit_id: str | None, search_after: list[Any], sort: list[str]) -> str:
+        data = {"pit": pit_id, "after": search_after, "sort": sort}
+        return urlsafe_b64encode(dumps(data)).rstrip(b"=").decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str, sort: list[str]) -> tuple[str | None, list[Any] | None]:
+        """Возвращает id point-in-time и значения search_after курсора, выданного для той же сортировки"""
+        if cursor == FIRST_PAGE_CURSOR:
+            return None, None
+        try:
+            data = loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            pit_id, search_after = data["pit"], list(data["after"])
+        except (binascii.Error, JSONDecodeError, KeyError, TypeError) as e:
+            raise InvalidCursorError(cursor) from e
+        # Значения search_after соответствуют ключам сортировки, с которой выдан курсор
+        if data.get("sort") != sort or len(search_after) != len(sort):
+            raise InvalidCursorError(cursor)
+        return pit_id, search_after
+
+    def make_sort(self, request_data: RequestData) -> list[str] | None:
+        """При обходе по курсору id - последний ключ сортировки: порядок однозначен, и по нему можно продолжить"""
+        sort = self.make_elastic_sort_string(request_data.sort)
+        if not request_data.cursor:
+            return [sort] if sort else None
+        sort = sort or ("_score" if request_data.query else None)
+        return [sort, "id:asc"] if sort else ["id:asc"]
 
     def make_elastic_sort_string(self, sort_string: str | None) -> str | None:
         if sort_string in self.sort_fields:
@@ -77,8 +211,12 @@ class ElasticDatabase(BaseDatabase):
             },
         }
 
-    @staticmethod
-    def make_query_dls_nested(nested_query: NestedQuery) -> dict[str, Any] | None:
+    @classmethod
+    def make_query_dls_nested(cls, nested_query: NestedQuery | list[NestedQuery] | None) -> dict[str, Any] | None:
+        if isinstance(nested_query, list):
+            queries = [query for query in map(cls.make_query_dls_nested, nested_query) if query]
+            return {"bool": {"should": queries, "minimum_should_match": 1}} if queries else None
+
         if not nested_query or not nested_query.path or not nested_query.field or not nested_query.query_string:
             return None
 
@@ -8,22 +8,36 @@ from api.v1.models import FilmsSortKeys
 from core.config import settings
 from db.elastic import get_elastic
 from db.redis import get_redis
-from models.film import Film
+from models.film import Film, FilmShort
 from services.base import BaseService
-from services.cache import RedisCache
+from services.cache import make_cache
 from services.database import ElasticDatabase
 
+# Облегчённые модели фильма для эндпойнтов, которым нужна часть полей
+FILM_PROJECTIONS = {"short": FilmShort}
+
+# Фасеты списков фильмов: id жанров и подписки
+FILM_FACETS = {
+    "genres": {
+        "nested": {"path": "genre"},
+        "aggs": {"values": {"terms": {"field": "genre.id", "size": settings.facet_size}}},
+    },
+    "subscriptions": {"terms": {"field": "subscriptions", "size": settings.facet_size}},
+}
+
 
 @lru_cache
 def get_films_service(
     redis: Redis = Depends(get_redis),
     elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> BaseService:
-    cache = RedisCache(redis, cache_prefix="movies", model=Film, expires=settings.cache_expires_in_seconds)
+    cache = make_cache(redis, cache_prefix="movies", model=Film, projections=FILM_PROJECTIONS)
     database = ElasticDatabase(
         elastic,
         index="movies",
         model=Film,
+        projections=FILM_PROJECTIONS,
+        facets=FILM_FACETS,
         sort_fields=tuple(key.value for key in FilmsSortKeys),
         search_fields=(
             "actors_names",
@@ -4,12 +4,11 @@ from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from redis.asyncio import Redis
 
-from core.config import settings
 from db.elastic import get_elastic
 from db.redis import get_redis
 from models.genre import Genre
 from services.base import BaseService
-from services.cache import RedisCache
+from services.cache import make_cache
 from services.database import ElasticDatabase
 
 
@@ -18,7 +17,7 @@ def get_genres_service(
     redis: Redis = Depends(get_redis),
     elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> BaseService:
-    cache = RedisCache(redis, cache_prefix="genres", model=Genre, expires=settings.cache_expires_in_seconds)
+    cache = make_cache(redis, cache_prefix="genres", model=Genre)
     database = ElasticDatabase(
         elastic,
         index="genres",
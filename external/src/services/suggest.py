@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+from elasticsearch import AsyncElasticsearch
+from fastapi import Depends
+from opentelemetry.trace import get_tracer
+
+from core.config import settings
+from db.elastic import get_elastic
+
+# Индексы подсказок: completion-поле и поля документа, которые возвращаются с подсказкой
+SUGGEST_SOURCES = {
+    "films": ("movies", "title_suggest", ["id", "title"]),
+    "persons": ("persons", "full_name_suggest", ["id", "full_name"]),
+}
+
+tracer = get_tracer(__name__)
+
+
+class SuggestService:
+    """Typeahead suggestions from the completion fields of the indices.
+
+    Suggestions for a prefix are kept in an in-process LRU cache for a short time:
+    the hottest prefixes are served without a request to Elasticsearch.
+    """
+
+    def __init__(self, storage: AsyncElasticsearch, max_size: int, expires: int) -> None:
+        self.storage = storage
+        self.max_size = max_size
+        self.expires = expires
+        self.cache: OrderedDict[tuple[str, int], tuple[float, dict[str, list[dict[str, Any]]]]] = OrderedDict()
+
+    async def suggest(self, prefix: str, size: int) -> dict[str, list[dict[str, Any]]]:
+        # Completion-поля анализируются анализатором simple, поэтому регистр и лишние пробелы не важны
+        key = (" ".join(prefix.lower().split()), size)
+        if entry := self.cache.get(key):
+            expires_at, suggestions = entry
+            if time.monotonic() < expires_at:
+                self.cache.move_to_end(key)
+                return suggestions
+            del self.cache[key]
+
+        suggestions = await self.load(key[0], size)
+        self.cache[key] = (time.monotonic() + self.expires, suggestions)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        return suggestions
+
+    async def load(self, prefix: str, size: int) -> dict[str, list[dict[str, Any]]]:
+        """Get suggestions of all kinds with a single msearch"""
+        with tracer.start_as_current_span("elasticsearch-suggest"):
+            searches: list[dict[str, Any]] = []
+            for name, (index, field, source) in SUGGEST_SOURCES.items():
+                searches.append({"index": index})
+                searches.append(
+                    {
+                        "_source": source,
+                        "suggest": {name: {"prefix": prefix, "completion": {"field": field, "size": size}}},
+                    }
+                )
+            response = await self.storage.msearch(searches=searches)
+            return {
+                name: [
+                    option["_source"]
+                    for suggestion in result.get("suggest", {}).get(name, [])
+                    for option in suggestion["options"]
+                ]
+                for name, result in zip(SUGGEST_SOURCES, response.body["responses"])
+            }
+
+
+@lru_cache
+def get_suggest_service(elastic: AsyncElasticsearch = Depends(get_elastic)) -> SuggestService:
+    return SuggestService(
+        elastic,
+        max_size=settings.suggest_cache_max_size,
+        expires=settings.suggest_cache_expires_in_seconds,
+    )
@@ -1,12 +1,18 @@
+import time
 from collections.abc import Callable
 from typing import TYPE_CHECKING, Any
 
 import pytest
 
 from fastapi.testclient import TestClient
+from jose import jwt
+from tests.fakes import FakeElasticsearch, FakeRedis
 
+from core.auth import SystemRolesEnum
+from core.config import settings
 from main import app as fastapi_app
 from models.genre import Genre as ModelGenre
+from services.base import BaseService
 
 if TYPE_CHECKING:
     from fastapi import FastAPI
@@ -15,20 +21,35 @@ if TYPE_CHECKING:
 # Create a new application for testing
 @pytest.fixture()
 def app() -> "FastAPI":
-    return fastapi_app
+    yield fastapi_app
+    fastapi_app.dependency_overrides.clear()
+
+
+@pytest.fixture()
+def access_token(faker) -> str:
+    now = int(time.time())
+    payload = {"iat": now, "exp": now + 60, "sub": faker.uuid4(), "roles": [SystemRolesEnum.user.value]}
+    return jwt.encode(payload, settings.jwt_access_token_secret_key, algorithm="HS256")
 
 
 # Make requests in our tests
 @pytest.fixture()
-def client(app: "FastAPI") -> TestClient:
-    return TestClient(app=app, base_url="http://testserver")
+def client(app: "FastAPI", access_token: str) -> TestClient:
+    # Без X-Request-Id приложение отклоняет запросы, детальные данные доступны пользователям
+    return TestClient(
+        app=app,
+        base_url="http://testserver",
+        headers={"X-Request-Id": "tests", "Authorization": f"Bearer {access_token}"},
+    )
 
 
 @pytest.fixture()
 def mock_service(app: "FastAPI") -> Callable:
     def _service_mocker(get_service_func, func_name, result):
-        class MockFilmService:
-            pass
+        class MockFilmService(BaseService):
+            def __init__(self) -> None:
+                # Ответы строятся из подменённых данных, без кэша
+                self.cache_responses = False
 
         async def func(self, *args, **kwargs) -> Any:
             return result
@@ -43,6 +64,23 @@ def mock_service(app: "FastAPI") -> Callable:
     return _service_mocker
 
 
+@pytest.fixture()
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture()
+def fake_service(app: "FastAPI") -> Callable:
+    """Подменяет сервис настоящим сервисом поверх Redis и Elasticsearch в памяти"""
+
+    def _fake_service(get_service_func, elastic: FakeElasticsearch) -> BaseService:
+        service = get_service_func.__wrapped__(redis=FakeRedis(), elastic=elastic)
+        app.dependency_overrides[get_service_func] = lambda: service
+        return service
+
+    return _fake_service
+
+
 @pytest.fixture(scope="session", autouse=True)
 def faker_session_locale():
     return ["it_IT"]
@@ -51,3 +89,18 @@ def faker_session_locale():
 @pytest.fixture()
 def genre(faker):
     return ModelGenre(id=faker.uuid4(), name=faker.word())
+
+
+@pytest.fixture()
+def film_documents(faker, genre) -> list[dict[str, Any]]:
+    """Документы фильмов в том виде, в каком их загружает ETL"""
+    return [
+        {
+            "id": faker.uuid4(),
+            "title": faker.sentence(),
+            "imdb_rating": faker.pyfloat(1, 1, True),
+            "genre": [genre.model_dump()],
+            "subscriptions": [1],
+        }
+        for _ in range(3)
+    ]
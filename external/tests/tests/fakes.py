@@ -0,0 +1,212 @@
+import fnmatch
+import time
+from collections.abc import AsyncGenerator
+from types import SimpleNamespace
+from typing import Any
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError, NotFoundError
+
+from services.cache import UNLOCK_SCRIPT
+
+
+def encode(value: Any) -> Any:
+    """Значения хранятся в байтах, как их возвращает Redis"""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("UTF-8")
+
+
+class FakeRedis:
+    """Асинхронный Redis в памяти с командами, которыми пользуется кэш API"""
+
+    def __init__(self) -> None:
+        self.data: dict[str, Any] = {}
+        self.expires_at: dict[str, float] = {}
+
+    def alive(self, name: str) -> bool:
+        if name in self.expires_at and time.monotonic() >= self.expires_at[name]:
+            self.data.pop(name, None)
+            self.expires_at.pop(name, None)
+        return name in self.data
+
+    async def get(self, name: str) -> bytes | None:
+        return self.data[name] if self.alive(name) else None
+
+    async def set(
+        self, name: str, value: Any, ex: int | None = None, px: int | None = None, nx: bool = False
+    ) -> bool | None:
+        if nx and self.alive(name):
+            return None
+        self.data[name] = encode(value)
+        self.expires_at.pop(name, None)
+        if ex or px:
+            self.expires_at[name] = time.monotonic() + (ex or 0) + (px or 0) / 1000
+        return True
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return [await self.get(key) for key in keys]
+
+    async def pttl(self, name: str) -> int:
+        if not self.alive(name):
+            return -2
+        if name not in self.expires_at:
+            return -1
+        return int((self.expires_at[name] - time.monotonic()) * 1000)
+
+    async def exists(self, *names: str) -> int:
+        return sum(self.alive(name) for name in names)
+
+    async def delete(self, *names: str) -> int:
+        deleted = sum(self.alive(name) for name in names)
+        for name in names:
+            self.data.pop(name, None)
+            self.expires_at.pop(name, None)
+        return deleted
+
+    async def expire(self, name: str, seconds: int, nx: bool = False) -> bool:
+        if not self.alive(name) or nx and name in self.expires_at:
+            return False
+        self.expires_at[name] = time.monotonic() + seconds
+        return True
+
+    async def hset(
+        self, name: str, key: str | None = None, value: Any = None, mapping: dict[str, Any] | None = None
+    ) -> int:
+        self.alive(name)
+        fields = self.data.setdefault(name, {})
+        items = (mapping or {}) | ({key: value} if key is not None else {})
+        fields.update({encode(field): encode(field_value) for field, field_value in items.items()})
+        return len(items)
+
+    async def hget(self, name: str, key: str) -> bytes | None:
+        return (await self.hmget(name, [key]))[0]
+
+    async def hmget(self, name: str, keys: list[str]) -> list[bytes | None]:
+        fields = self.data[name] if self.alive(name) else {}
+        return [fields.get(encode(key)) for key in keys]
+
+    async def hgetall(self, name: str) -> dict[bytes, bytes]:
+        return dict(self.data[name]) if self.alive(name) else {}
+
+    async def scan_iter(self, match: str = "*") -> AsyncGenerator[str, None]:
+        for name in list(self.data):
+            if self.alive(name) and fnmatch.fnmatchcase(name, match):
+                yield name
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> Any:
+        if script != UNLOCK_SCRIPT:
+            raise NotImplementedError(script)
+        name, token = keys_and_args
+        if await self.get(name) == encode(token):
+            return await self.delete(name)
+        return 0
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Команды конвейера выполняются по очереди при execute"""
+
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[tuple[str, tuple, dict]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.commands.clear()
+
+    def __getattr__(self, command: str) -> Any:
+        def queue(*args: Any, **kwargs: Any) -> "FakePipeline":
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list[Any]:
+        commands, self.commands = self.commands, []
+        return [await getattr(self.redis, command)(*args, **kwargs) for command, args, kwargs in commands]
+
+
+def api_error(error_class: type[ApiError], status: int) -> ApiError:
+    """Ошибка клиента Elasticsearch с ответом заданного статуса"""
+    meta = ApiResponseMeta(status, "1.1", HttpHeaders(), 0, NodeConfig("http", "elastic", 9200))
+    return error_class(error_class.__name__, meta, {"error": {"type": "fake", "reason": "fake"}})
+
+
+class FakeElasticsearch:
+    """Асинхронный Elasticsearch с документами одного индекса в памяти.
+
+    Поиск возвращает документы по порядку, без учёта запроса; аргументы запросов сохраняются в searches.
+    """
+
+    def __init__(
+        self,
+        documents: list[dict[str, Any]] | None = None,
+        aggregations: dict[str, Any] | None = None,
+        responses: list[dict[str, Any]] | None = None,
+        error: ApiError | None = None,
+    ) -> None:
+        self.documents = documents or []
+        self.aggregations = aggregations
+        # Ответы msearch
+        self.responses = responses or []
+        # Ошибка, с которой завершается поиск
+        self.error = error
+        self.searches: list[dict[str, Any]] = []
+        self.mgets: list[list[str]] = []
+        self.closed_pits: list[str] = []
+
+    async def get(self, index: str, id: str) -> SimpleNamespace:
+        for document in self.documents:
+            if document["id"] == id:
+                return SimpleNamespace(body={"_id": id, "_source": document})
+        raise api_error(NotFoundError, 404)
+
+    async def mget(self, index: str, ids: list[str]) -> SimpleNamespace:
+        self.mgets.append(ids)
+        documents = {document["id"]: document for document in self.documents}
+        return SimpleNamespace(
+            body={
+                "docs": [
+                    {"_id": item_id, "found": True, "_source": documents[item_id]}
+                    if item_id in documents
+                    else {"_id": item_id, "found": False}
+                    for item_id in ids
+                ]
+            }
+        )
+
+    async def search(self, **params: Any) -> SimpleNamespace:
+        self.searches.append(params)
+        if self.error:
+            raise self.error
+        start = params.get("from_") or 0
+        hits = [
+            {
+                "_id": document["id"],
+                "_source": document,
+                "sort": [document.get(key.split(":")[0], 1.0) for key in params.get("sort") or []],
+            }
+            for document in self.documents[start : start + params.get("size", 10)]
+        ]
+        body = {"hits": {"total": {"value": len(self.documents), "relation": "eq"}, "hits": hits}}
+        if self.aggregations is not None:
+            body["aggregations"] = self.aggregations
+        if "pit" in params:
+            body["pit_id"] = params["pit"]["id"]
+        return SimpleNamespace(body=body)
+
+    async def open_point_in_time(self, index: str, keep_alive: str) -> SimpleNamespace:
+        return SimpleNamespace(body={"id": "fake_pit"})
+
+    async def close_point_in_time(self, id: str) -> SimpleNamespace:
+        self.closed_pits.append(id)
+        return SimpleNamespace(body={"succeeded": True, "num_freed": 1})
+
+    async def msearch(self, searches: list[dict[str, Any]]) -> SimpleNamespace:
+        self.searches.extend(searches)
+        return SimpleNamespace(body={"responses": self.responses})
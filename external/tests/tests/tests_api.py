@@ -1,9 +1,13 @@
+import uuid
 from typing import TYPE_CHECKING
 
 import pytest
 
+from tests.fakes import FakeElasticsearch
+
 from models.film import Film as ModelsFilm, FilmPerson as ModelsFilmPerson
 from services.films import get_films_service
+from services.persons import get_persons_service
 
 if TYPE_CHECKING:
     from fastapi.testclient import TestClient
@@ -44,6 +48,7 @@ def test_films_retrieve(faker, mock_service, client: "TestClient", genre):
         "actors": [{"uuid": actor.id, "full_name": actor.name}],
         "directors": [{"uuid": director.id, "full_name": director.name}],
         "writers": [{"uuid": writer.id, "full_name": writer.name}],
+        "subscriptions": [],
     }
 
 
@@ -71,6 +76,103 @@ def test_films_list(faker, mock_service, client: "TestClient", genre, path):
             "uuid": film.id,
             "title": film.title,
             "imdb_rating": film.imdb_rating,
+            "subscriptions": [],
         }
         for film in films
     ]
+
+
+def test_films_list_without_total_and_facets(fake_service, client: "TestClient", film_documents):
+    fake_service(get_films_service, FakeElasticsearch(film_documents))
+
+    response = client.get("http://testserver/api/v1/films")
+
+    assert response.status_code == 200
+    assert [film["uuid"] for film in response.json()] == [document["id"] for document in film_documents]
+
+
+GENRE_ID = "0b105f87-e0a5-45dc-8ce7-f8632088f390"
+FILM_FACETS = {"genres": [{"value": GENRE_ID, "count": 2}], "subscriptions": [{"value": 1, "count": 3}]}
+
+
+@pytest.mark.parametrize(
+    argnames=("params", "total", "facets"),
+    argvalues=[
+        ("with_total=true", 3, None),
+        ("with_facets=true", None, FILM_FACETS),
+        ("with_total=true&with_facets=true", 3, FILM_FACETS),
+    ],
+)
+def test_films_list_with_total_and_facets(fake_service, client: "TestClient", film_documents, params, total, facets):
+    aggregations = {
+        "genres": {"doc_count": 3, "values": {"buckets": [{"key": GENRE_ID, "doc_count": 2}]}},
+        "subscriptions": {"buckets": [{"key": 1, "doc_count": 3}]},
+    }
+    service = fake_service(get_films_service, FakeElasticsearch(film_documents, aggregations=aggregations))
+
+    response = client.get(f"http://testserver/api/v1/films?{params}")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "items": [
+            {
+                "uuid": document["id"],
+                "title": document["title"],
+                "imdb_rating": document["imdb_rating"],
+                "subscriptions": document["subscriptions"],
+            }
+            for document in film_documents
+        ],
+        "total": total,
+        "facets": facets,
+        "next_cursor": None,
+    }
+    # Агрегации запрашиваются у Elasticsearch, только когда нужны фасеты
+    assert ("aggs" in service.database.storage.searches[0]) is (facets is not None)
+
+
+def test_films_batch(faker, fake_service, client: "TestClient", film_documents):
+    service = fake_service(get_films_service, FakeElasticsearch(film_documents))
+    cached, loaded, _ = (document["id"] for document in film_documents)
+    unknown = faker.uuid4()
+    client.get(f"http://testserver/api/v1/films/{cached}")
+
+    response = client.post("http://testserver/api/v1/films/batch", json={"ids": [loaded, unknown, cached, loaded]})
+
+    assert response.status_code == 200
+    assert [film["uuid"] for film in response.json()] == [loaded, cached]
+    # Из Elasticsearch одним запросом читаются только документы, которых нет в кэше
+    assert service.database.storage.mgets == [[loaded, unknown]]
+
+
+def test_persons_batch(faker, fake_service, client: "TestClient"):
+    persons = [{"id": faker.uuid4(), "full_name": faker.name(), "films": []} for _ in range(2)]
+    fake_service(get_persons_service, FakeElasticsearch(persons))
+    ids = [persons[1]["id"], faker.uuid4(), persons[0]["id"], persons[1]["id"]]
+
+    response = client.post("http://testserver/api/v1/persons/batch", json={"ids": ids})
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"uuid": person["id"], "full_name": person["full_name"], "films": []} for person in (persons[1], persons[0])
+    ]
+
+
+def test_films_batch_unknown_ids(fake_service, client: "TestClient", film_documents):
+    fake_service(get_films_service, FakeElasticsearch(film_documents))
+    # Как и детальные эндпойнты, пакетные принимают UUID любой версии
+    ids = [str(uuid.uuid1()), str(uuid.uuid5(uuid.NAMESPACE_URL, "film"))]
+
+    response = client.post("http://testserver/api/v1/films/batch", json={"ids": ids})
+
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.parametrize(argnames="ids", argvalues=[[], ["not-a-uuid"]])
+def test_films_batch_invalid_ids(fake_service, client: "TestClient", film_documents, ids):
+    fake_service(get_films_service, FakeElasticsearch(film_documents))
+
+    response = client.post("http://testserver/api/v1/films/batch", json={"ids": ids})
+
+    assert response.status_code == 422
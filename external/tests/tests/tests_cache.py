@@ -0,0 +1,151 @@
+import time
+
+import pytest
+
+from tests.fakes import FakeRedis
+
+from core.types import RequestData
+from models.genre import Genre
+from services.cache import GENERATIONS_KEY, LocalCache, RedisCache, invalidate
+
+
+@pytest.fixture()
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture()
+def redis_cache(redis):
+    return RedisCache(redis, "genres", Genre, expires=60)
+
+
+@pytest.fixture(autouse=True)
+def generations(monkeypatch):
+    generations = {}
+    monkeypatch.setattr("services.cache.generations", generations)
+    return generations
+
+
+@pytest.fixture()
+def local_cache(redis_cache):
+    return LocalCache(redis_cache, max_size=10, expires=30)
+
+
+def remaining_seconds(local_cache: LocalCache, key: str) -> float:
+    expires_at, _, _ = local_cache.storage[key]
+    return expires_at - time.monotonic()
+
+
+@pytest.mark.anyio()
+async def test_local_get_keeps_redis_ttl(redis, redis_cache, local_cache, genre):
+    request_data = RequestData(id=genre.id)
+    key = redis_cache.make_cache_key(request_data)
+    await redis.set(key, redis_cache.make_cache_value(genre), px=500)
+
+    assert await local_cache.get(request_data) == genre
+    assert 0 < remaining_seconds(local_cache, key) <= 0.5
+
+
+@pytest.mark.anyio()
+async def test_local_get_many_keeps_redis_ttl(redis, redis_cache, local_cache, genre):
+    request_data = RequestData(id=genre.id)
+    key = redis_cache.make_cache_key(request_data)
+    await redis.set(key, redis_cache.make_cache_value(genre), px=500)
+
+    assert await local_cache.get_many([request_data]) == [genre]
+    assert 0 < remaining_seconds(local_cache, key) <= 0.5
+
+
+@pytest.mark.anyio()
+async def test_local_get_many_mixes_local_and_redis(redis_cache, local_cache, faker, genre):
+    cached, missing = RequestData(id=genre.id), RequestData(id=faker.uuid4())
+    await local_cache.put(genre, cached)
+
+    assert await local_cache.get_many([missing, cached]) == [None, genre]
+    assert await redis_cache.get_many([missing, cached]) == [None, genre]
+
+
+@pytest.mark.anyio()
+async def test_local_get_response_keeps_redis_ttl(redis, redis_cache, local_cache, genre):
+    request_data = RequestData(id=genre.id)
+    await redis_cache.put_response((b"{}", {}), "genre_details", request_data)
+    await redis.expire(redis_cache.make_response_key(request_data), 1)
+
+    assert await local_cache.get_response("genre_details", request_data) == (b"{}", {})
+    key = f"{redis_cache.make_response_key(request_data)}_genre_details"
+    assert 0 < remaining_seconds(local_cache, key) <= 1
+    assert await local_cache.get_response("missing_route", request_data) is None
+
+
+@pytest.mark.anyio()
+async def test_put_response_keeps_hash_ttl(redis, redis_cache, genre):
+    request_data = RequestData(id=genre.id)
+    key = redis_cache.make_response_key(request_data)
+    await redis_cache.put_response((b"{}", {}), "genre_details", request_data)
+    await redis.expire(key, 1)
+
+    await redis_cache.put_response((b"[]", {}), "genre_films", request_data)
+
+    # Запись ответа другого эндпойнта не продлевает ответы, уже лежащие в хэше
+    assert 0 < await redis.pttl(key) <= 1000
+    assert await redis_cache.get_response("genre_films", request_data) == (b"[]", {})
+
+
+def test_generation_changes_list_keys_only(generations, redis_cache, genre):
+    detail, listing = RequestData(id=genre.id), RequestData(page_number=1, page_size=10)
+    detail_key, listing_key = redis_cache.make_cache_key(detail), redis_cache.make_cache_key(listing)
+    listing_response_key = redis_cache.make_response_key(listing)
+
+    generations["genres"] = 1
+
+    assert redis_cache.make_cache_key(detail) == detail_key
+    assert redis_cache.make_cache_key(listing) != listing_key
+    assert redis_cache.make_response_key(listing) != listing_response_key
+    # Ключи других индексов не меняются
+    assert RedisCache(None, "movies", Genre, expires=60).make_cache_key(listing).startswith("movies_0_")
+
+
+@pytest.mark.anyio()
+async def test_invalidate_drops_documents(generations, redis, redis_cache, genre, faker):
+    changed, unchanged = RequestData(id=genre.id), RequestData(id=faker.uuid4())
+    for request_data in (changed, unchanged):
+        await redis_cache.put(genre, request_data)
+        await redis_cache.put_response((b"{}", {}), "genre_details", request_data)
+
+    await invalidate(redis, "genres", [genre.id], generation=1)
+
+    assert generations == {"genres": 1}
+    assert await redis.hgetall(GENERATIONS_KEY) == {b"genres": b"1"}
+    assert await redis_cache.get(changed) is None
+    assert await redis_cache.get_response("genre_details", changed) is None
+    assert await redis_cache.get(unchanged) == genre
+    assert await redis_cache.get_response("genre_details", unchanged) == (b"{}", {})
+
+
+@pytest.mark.anyio()
+async def test_invalidate_without_ids_drops_all_documents(redis, redis_cache, genre, faker):
+    requests_data = [RequestData(id=genre.id), RequestData(id=faker.uuid4())]
+    for request_data in requests_data:
+        await redis_cache.put(genre, request_data)
+        await redis_cache.put_response((b"{}", {}), "genre_details", request_data)
+
+    await invalidate(redis, "genres", None, generation=1)
+
+    assert await redis_cache.get_many(requests_data) == [None, None]
+    for request_data in requests_data:
+        assert await redis_cache.get_response("genre_details", request_data) is None
+
+
+@pytest.mark.anyio()
+async def test_invalidate_once_per_generation(redis, redis_cache, local_cache, genre):
+    request_data = RequestData(id=genre.id)
+    await local_cache.put(genre, request_data)
+    await invalidate(redis, "genres", [genre.id], generation=1)
+    await redis_cache.put(genre, request_data)
+    await local_cache.put(genre, request_data)
+
+    # Сообщение об этом поколении уже обработано другим процессом: сбрасывается только локальный кэш
+    await invalidate(redis, "genres", [genre.id], generation=1)
+
+    assert await redis_cache.get(request_data) == genre
+    assert local_cache.lookup(local_cache.make_cache_key(request_data)) is None
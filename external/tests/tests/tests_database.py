@@ -0,0 +1,121 @@
+from typing import TYPE_CHECKING
+
+import pytest
+
+from elasticsearch import BadRequestError
+from tests.fakes import FakeElasticsearch, api_error
+
+from core.types import RequestData
+from models.film import Film, FilmShort
+from services.database import FIRST_PAGE_CURSOR, ElasticDatabase, InvalidCursorError
+from services.films import get_films_service
+
+if TYPE_CHECKING:
+    from fastapi.testclient import TestClient
+
+
+@pytest.fixture()
+def database(film_documents):
+    return ElasticDatabase(
+        FakeElasticsearch(film_documents),
+        index="movies",
+        model=Film,
+        projections={"short": FilmShort},
+        sort_fields=("imdb_rating", "-imdb_rating"),
+    )
+
+
+def test_cursor_round_trip():
+    cursor = ElasticDatabase.encode_cursor("pit", [7.5, "id"], ["imdb_rating:asc", "id:asc"])
+
+    assert ElasticDatabase.decode_cursor(cursor, ["imdb_rating:asc", "id:asc"]) == ("pit", [7.5, "id"])
+
+
+@pytest.mark.parametrize(
+    argnames="cursor",
+    argvalues=[
+        "",
+        "not-a-cursor",
+        ElasticDatabase.encode_cursor("pit", [7.5, "id"], ["imdb_rating:desc", "id:asc"]),
+        ElasticDatabase.encode_cursor("pit", ["id"], ["imdb_rating:asc", "id:asc"]),
+    ],
+)
+def test_decode_cursor_rejects_invalid(cursor):
+    with pytest.raises(InvalidCursorError):
+        ElasticDatabase.decode_cursor(cursor, ["imdb_rating:asc", "id:asc"])
+
+
+@pytest.mark.anyio()
+async def test_cursor_continues_in_point_in_time(database, film_documents):
+    first = await database.get(RequestData(page_size=2, projection="short", cursor=FIRST_PAGE_CURSOR))
+    assert [film.id for film in first] == [document["id"] for document in film_documents[:2]]
+    assert database.storage.searches[-1]["pit"]["id"] == "fake_pit"
+
+    await database.get(RequestData(page_size=2, projection="short", cursor=first.next_cursor))
+
+    search = database.storage.searches[-1]
+    assert search["pit"]["id"] == "fake_pit"
+    assert search["search_after"] == [film_documents[1]["id"]]
+
+
+@pytest.mark.anyio()
+async def test_last_cursor_page_closes_point_in_time(database, film_documents):
+    page = await database.get(RequestData(page_size=len(film_documents) + 1, cursor=FIRST_PAGE_CURSOR))
+
+    assert page.next_cursor is None
+    assert database.storage.closed_pits == ["fake_pit"]
+
+
+@pytest.mark.parametrize(
+    argnames="request_data, sort",
+    argvalues=[
+        (RequestData(page_size=2), None),
+        (RequestData(page_size=2, sort="-imdb_rating"), ["imdb_rating:desc"]),
+        (RequestData(page_size=2, query="star"), None),
+        (RequestData(page_size=2, cursor=FIRST_PAGE_CURSOR), ["id:asc"]),
+        (RequestData(page_size=2, sort="-imdb_rating", cursor=FIRST_PAGE_CURSOR), ["imdb_rating:desc", "id:asc"]),
+        (RequestData(page_size=2, query="star", cursor=FIRST_PAGE_CURSOR), ["_score", "id:asc"]),
+    ],
+)
+@pytest.mark.anyio()
+async def test_id_tiebreaker_only_for_cursor_pages(database, request_data, sort):
+    page = await database.get(request_data)
+
+    assert database.storage.searches[-1].get("sort") == sort
+    # Страницы по номеру не открывают point-in-time и не выдают курсор
+    assert (page.next_cursor is not None) is bool(request_data.cursor)
+
+
+@pytest.mark.anyio()
+async def test_search_after_bad_request_is_invalid_cursor(database):
+    cursor = ElasticDatabase.encode_cursor("pit", ["id"], ["id:asc"])
+    database.storage.error = api_error(BadRequestError, 400)
+
+    with pytest.raises(InvalidCursorError):
+        await database.get(RequestData(page_size=2, cursor=cursor))
+
+
+@pytest.mark.parametrize(
+    argnames="query",
+    argvalues=[
+        "cursor=not-a-cursor",
+        "sort=imdb_rating&cursor=" + ElasticDatabase.encode_cursor(None, ["id"], ["id:asc"]),
+    ],
+)
+def test_films_list_invalid_cursor(fake_service, client: "TestClient", film_documents, query):
+    fake_service(get_films_service, FakeElasticsearch(film_documents))
+
+    response = client.get("http://testserver/api/v1/films?" + query)
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "invalid cursor"}
+
+
+def test_films_list_rejected_search_after(fake_service, client: "TestClient", film_documents):
+    fake_service(get_films_service, FakeElasticsearch(film_documents, error=api_error(BadRequestError, 400)))
+    cursor = ElasticDatabase.encode_cursor("pit", ["id"], ["id:asc"])
+
+    response = client.get("http://testserver/api/v1/films?cursor=" + cursor)
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "invalid cursor"}
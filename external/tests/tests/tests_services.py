@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from tests.fakes import FakeRedis
+
+from core.types import RequestData
+from models.genre import Genre
+from services.base import BaseService
+from services.cache import RedisCache
+
+
+class CountingDatabase:
+    """База данных, которая отвечает с задержкой и считает обращения"""
+
+    def __init__(self, data: Genre, delay: float = 0.01) -> None:
+        self.data = data
+        self.delay = delay
+        self.calls = 0
+
+    async def get(self, request_data: RequestData) -> Genre:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.data
+
+
+@pytest.fixture()
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture()
+def database(genre):
+    return CountingDatabase(genre)
+
+
+@pytest.fixture()
+def service(redis, database):
+    return BaseService(cache=RedisCache(redis, "genres", Genre, expires=60), database=database)
+
+
+@pytest.fixture()
+def request_data(genre):
+    return RequestData(id=genre.id)
+
+
+@pytest.mark.anyio()
+async def test_get_data_coalesces_concurrent_requests(service, database, request_data, genre):
+    results = await asyncio.gather(*(service.get_data(request_data) for _ in range(10)))
+
+    assert results == [genre] * 10
+    assert database.calls == 1
+    assert service.in_flight == {}
+
+
+@pytest.mark.anyio()
+async def test_get_data_reads_cache(service, database, request_data, genre):
+    await service.get_data(request_data)
+
+    assert await service.get_data(request_data) == genre
+    assert database.calls == 1
+
+
+@pytest.mark.anyio()
+async def test_xfetch_refreshes_before_expiry(monkeypatch, service, database, request_data, genre):
+    await service.cache.put(genre, request_data)
+    # До истечения срока кэша 60 с, а данные получаются из базы данных 100 с
+    service.recompute_seconds = 100
+    monkeypatch.setattr("services.base.random.random", lambda: 0.5)
+
+    assert await service.get_data(request_data) == genre
+    assert database.calls == 1
+
+
+@pytest.mark.anyio()
+async def test_xfetch_keeps_fresh_cache(monkeypatch, service, database, request_data, genre):
+    await service.cache.put(genre, request_data)
+    service.recompute_seconds = 0.01
+    monkeypatch.setattr("services.base.random.random", lambda: 0.5)
+
+    assert await service.get_data(request_data) == genre
+    assert database.calls == 0
+
+
+@pytest.mark.parametrize(
+    argnames=("recompute_seconds", "ttl", "expected"),
+    argvalues=[(1, 100, True), (1, 10_000, False), (1, 0, False), (1, -2, False), (0, 100, False)],
+)
+def test_expires_early(monkeypatch, service, recompute_seconds, ttl, expected):
+    service.recompute_seconds = recompute_seconds
+    # -log(1 - 0.5) * 1 с ~ 693 мс
+    monkeypatch.setattr("services.base.random.random", lambda: 0.5)
+
+    assert service.expires_early(ttl) is expected
+
+
+@pytest.mark.anyio()
+async def test_unlock_keeps_lock_of_another_request(redis, service, request_data):
+    cache = service.cache
+    token = await cache.lock(request_data, timeout=5)
+    assert token
+    assert await cache.lock(request_data, timeout=5) is None
+
+    # Блокировка истекла, пока первый запрос обновлял данные, и её захватил другой запрос
+    await redis.delete(cache.make_lock_key(request_data))
+    other_token = await cache.lock(request_data, timeout=5)
+    await cache.unlock(request_data, token)
+
+    assert await cache.is_locked(request_data)
+    await cache.unlock(request_data, other_token)
+    assert not await cache.is_locked(request_data)
@@ -0,0 +1,109 @@
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from tests.fakes import FakeElasticsearch
+
+from core.config import settings
+from services.suggest import SuggestService, get_suggest_service
+
+if TYPE_CHECKING:
+    from fastapi.testclient import TestClient
+
+
+def completion(name: str, options: list[dict[str, Any]]) -> dict[str, Any]:
+    """Ответ поиска с подсказками completion-поля"""
+    return {"suggest": {name: [{"options": [{"_source": source} for source in options]}]}}
+
+
+@pytest.fixture()
+def film(faker) -> dict[str, Any]:
+    return {"id": faker.uuid4(), "title": "Star Wars"}
+
+
+@pytest.fixture()
+def person(faker) -> dict[str, Any]:
+    return {"id": faker.uuid4(), "full_name": "Stanley Kubrick"}
+
+
+@pytest.fixture()
+def elastic(film, person) -> FakeElasticsearch:
+    return FakeElasticsearch(responses=[completion("films", [film]), completion("persons", [person])])
+
+
+@pytest.mark.anyio()
+async def test_suggest_searches_all_indices_at_once(elastic, film, person):
+    service = SuggestService(elastic, max_size=10, expires=60)
+
+    assert await service.suggest("  St ", 3) == {"films": [film], "persons": [person]}
+    assert elastic.searches == [
+        {"index": "movies"},
+        {
+            "_source": ["id", "title"],
+            "suggest": {"films": {"prefix": "st", "completion": {"field": "title_suggest", "size": 3}}},
+        },
+        {"index": "persons"},
+        {
+            "_source": ["id", "full_name"],
+            "suggest": {"persons": {"prefix": "st", "completion": {"field": "full_name_suggest", "size": 3}}},
+        },
+    ]
+
+
+@pytest.mark.anyio()
+async def test_suggest_caches_normalized_prefix(elastic):
+    service = SuggestService(elastic, max_size=10, expires=60)
+
+    await service.suggest("Star  wars", 3)
+    await service.suggest("star wars ", 3)
+
+    assert len(elastic.searches) == 4
+    # Подсказки другого размера запрашиваются заново
+    await service.suggest("star wars", 5)
+    assert len(elastic.searches) == 8
+
+
+@pytest.mark.anyio()
+async def test_suggest_evicts_least_recently_used(elastic):
+    service = SuggestService(elastic, max_size=2, expires=60)
+
+    for prefix in ("a", "b", "a", "c"):
+        await service.suggest(prefix, 3)
+
+    assert list(service.cache) == [("a", 3), ("c", 3)]
+
+
+@pytest.mark.anyio()
+async def test_suggest_expires(elastic):
+    service = SuggestService(elastic, max_size=10, expires=0)
+
+    await service.suggest("st", 3)
+    await service.suggest("st", 3)
+
+    assert len(elastic.searches) == 8
+
+
+def test_suggest_route(app, client: "TestClient", elastic, film, person):
+    app.dependency_overrides[get_suggest_service] = lambda: SuggestService(elastic, max_size=10, expires=60)
+
+    response = client.get("http://testserver/api/v1/suggest", params={"query": "st"})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "films": [{"uuid": film["id"], "title": film["title"]}],
+        "persons": [{"uuid": person["id"], "full_name": person["full_name"]}],
+    }
+    assert elastic.searches[1]["suggest"]["films"]["completion"]["size"] == settings.suggest_size
+
+
+@pytest.mark.parametrize(
+    argnames="params",
+    argvalues=[{}, {"query": ""}, {"query": "st", "size": 0}, {"query": "st", "size": settings.suggest_size_max + 1}],
+)
+def test_suggest_route_validation(app, client: "TestClient", elastic, params):
+    app.dependency_overrides[get_suggest_service] = lambda: SuggestService(elastic, max_size=10, expires=60)
+
+    response = client.get("http://testserver/api/v1/suggest", params=params)
+
+    assert response.status_code == 422
+    assert elastic.searches == []